@@ -1,6 +1,6 @@
 from django.contrib import admin
-from .models import TimeSlot, Appointment, SubscriptionPlan, UserSubscription
-from .models import Certificate, Badge, Leaderboard, UserProfile
+from .models import TimeSlot, Appointment, SubscriptionPlan, UserSubscription, SessionAvailability, WaitlistEntry
+from .models import Certificate, Badge, Leaderboard, PointsRollup, PointsEntry, UserProfile
 from appointments.models import Contact
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import User
@@ -8,8 +8,10 @@ from django.urls import path
 from django.shortcuts import render
 from django.db.models import Sum, F
 from django.utils.html import format_html
+from django.utils import timezone
+from .leaderboard import award_points
 
-from .models import NewsletterSignup, PaymentQRCode, Payment
+from .models import NewsletterSignup, PaymentQRCode, Payment, OutboxEmail, ScheduledJob
 from .email_utils import send_subscription_email
 
 # Register your models here.
@@ -60,6 +62,7 @@ class AppointmentAdmin(admin.ModelAdmin):
     list_display = ['user', 'date', 'time_slot', 'status', 'get_subscription_plan', 'get_amount_paid']
     list_filter = ['status', 'date']
     search_fields = ['user__username']
+    list_select_related = ['user', 'time_slot', 'user_subscription__plan']
     
     def get_subscription_plan(self, obj):
         if obj.user_subscription and obj.user_subscription.plan:
@@ -116,9 +119,21 @@ class AppointmentAdmin(admin.ModelAdmin):
         }
         return render(request, 'admin/revenue_dashboard.html', context)
 
+@admin.register(SessionAvailability)
+class SessionAvailabilityAdmin(admin.ModelAdmin):
+    list_display = ('date', 'session', 'capacity', 'booked', 'remaining')
+    list_filter = ('session', 'date')
+    list_editable = ('capacity',)
+
+@admin.register(WaitlistEntry)
+class WaitlistEntryAdmin(admin.ModelAdmin):
+    list_display = ('user', 'date', 'session', 'status', 'created_at')
+    list_filter = ('status', 'session', 'date')
+    search_fields = ('user__username',)
+
 @admin.register(Certificate)
 class CertificateAdmin(admin.ModelAdmin):
-    list_display = ('user', 'issued_date')
+    list_display = ('user', 'badge_type', 'issued_date')
 
 @admin.register(Badge)
 class BadgeAdmin(admin.ModelAdmin):
@@ -127,6 +142,36 @@ class BadgeAdmin(admin.ModelAdmin):
 @admin.register(Leaderboard)
 class LeaderboardAdmin(admin.ModelAdmin):
     list_display = ('user', 'points')
+    list_select_related = ('user',)
+    ordering = ('-points',)
+
+@admin.register(PointsEntry)
+class PointsEntryAdmin(admin.ModelAdmin):
+    list_display = ('user', 'points', 'reason', 'awarded_at', 'created_at')
+    list_filter = ('reason',)
+    list_select_related = ('user',)
+    search_fields = ('user__username',)
+    fields = ('user', 'points', 'reason', 'awarded_at')
+
+    def save_model(self, request, obj, form, change):
+        # Record through award_points so the counters move with the ledger
+        entry = award_points(obj.user_id, obj.points, obj.reason, obj.awarded_at)
+        if entry:
+            obj.pk = entry.pk
+
+    # The ledger is append-only, corrections are recorded as adjustments
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+@admin.register(PointsRollup)
+class PointsRollupAdmin(admin.ModelAdmin):
+    list_display = ('user', 'period', 'period_start', 'points')
+    list_filter = ('period', 'period_start')
+    list_select_related = ('user',)
+    search_fields = ('user__username',)
 
 
 admin.site.register(Contact)
@@ -144,6 +189,8 @@ class PaymentAdmin(admin.ModelAdmin):
     list_filter = ('payment_status', 'subscription_plan')
     search_fields = ('user__username', 'transaction_code')
     readonly_fields = ('payment_screenshot',)
+    ordering = ('-created_at',)
+    show_full_result_count = False  # Skip the unfiltered COUNT(*) over every payment
     actions = ['verify_payments', 'reject_payments']
 
     def verify_payments(self, request, queryset):
@@ -192,6 +239,47 @@ class PaymentAdmin(admin.ModelAdmin):
                     subscription.end_date
                 )
 
+@admin.register(OutboxEmail)
+class OutboxEmailAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'get_recipients', 'status', 'attempts', 'next_attempt_at', 'created_at', 'sent_at')
+    list_filter = ('status',)
+    search_fields = ('subject',)
+    ordering = ('-created_at',)
+    exclude = ('mime',)
+    readonly_fields = ('subject', 'from_email', 'recipients', 'status', 'attempts', 'next_attempt_at',
+                       'last_error', 'created_at', 'sent_at')
+    actions = ['requeue_emails']
+
+    def get_recipients(self, obj):
+        return ', '.join(obj.recipients)
+    get_recipients.short_description = 'Recipients'
+
+    def has_add_permission(self, request):
+        return False
+
+    def requeue_emails(self, request, queryset):
+        requeued = queryset.exclude(status='sent').update(status='queued', attempts=0, next_attempt_at=timezone.now())
+        self.message_user(request, f"{requeued} emails requeued")
+    requeue_emails.short_description = "Retry selected emails now"
+
+@admin.register(ScheduledJob)
+class ScheduledJobAdmin(admin.ModelAdmin):
+    list_display = ('name', 'next_run_at', 'last_status', 'last_started_at', 'last_duration', 'last_rows', 'locked_by')
+    list_filter = ('last_status',)
+    ordering = ('name',)
+    readonly_fields = ('name', 'next_run_at', 'locked_until', 'locked_by', 'last_started_at', 'last_duration',
+                       'last_rows', 'last_status', 'last_error')
+    actions = ['run_now']
+
+    # Rows are created by run_scheduler for the jobs it knows
+    def has_add_permission(self, request):
+        return False
+
+    def run_now(self, request, queryset):
+        scheduled = queryset.update(next_run_at=timezone.now())
+        self.message_user(request, f"{scheduled} jobs will run on the scheduler's next check")
+    run_now.short_description = "Run selected jobs now"
+
 admin.site.site_header = "Devi's Gym System"
 admin.site.site_title = "Devi's Gym System Admin"
 admin.site.index_title = "Welcome to Devi's Gym System Admin"
@@ -0,0 +1,367 @@
+from datetime import date as date_type, time, timedelta
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Count
+from .models import Appointment, SessionAvailability, TimeSlot, WaitlistEntry
+from .email_utils import send_waitlist_promotion_email
+
+# Canonical time range of each session
+SESSION_TIMES = {
+    'morning': (time(6, 0), time(10, 0)),
+    'afternoon': (time(12, 0), time(16, 0)),
+    'evening': (time(17, 0), time(21, 0)),
+}
+
+DEFAULT_SESSION_CAPACITY = 30
+
+
+class SessionFull(Exception):
+    """Raised when a session has no seats left on the requested date"""
+
+
+class AlreadyBooked(Exception):
+    """Raised when the member already has an appointment on the requested date"""
+
+
+def session_capacity(session):
+    """Configured number of seats for a session"""
+    return getattr(settings, 'SESSION_CAPACITY', {}).get(session, DEFAULT_SESSION_CAPACITY)
+
+
+def session_for_times(start_time, end_time):
+    """Return the session covering exactly the given time range, if any"""
+    for session, times in SESSION_TIMES.items():
+        if (start_time, end_time) == times:
+            return session
+    return None
+
+
+def session_for_slot(time_slot):
+    """Return the session a time slot belongs to, matching legacy rows by their time range"""
+    return time_slot.session or session_for_times(time_slot.start_time, time_slot.end_time)
+
+
+def get_session_slot(session):
+    """Return the canonical TimeSlot row for a session, creating it if missing"""
+    time_slot = TimeSlot.objects.filter(session=session).order_by('id').first()
+    if time_slot is None:
+        start_time, end_time = SESSION_TIMES[session]
+        time_slot = TimeSlot.objects.create(
+            session=session,
+            start_time=start_time,
+            end_time=end_time,
+            is_available=True
+        )
+    return time_slot
+
+
+def get_availability(date, session):
+    """Return the capacity row for a session on a date, creating it if missing"""
+    availability, created = SessionAvailability.objects.get_or_create(
+        date=date,
+        session=session,
+        defaults={'capacity': session_capacity(session)}
+    )
+    return availability
+
+
+def reserve_session(user, subscription, date, session):
+    """
+    Book a seat in a session and create the appointment.
+
+    The seat is taken with a single conditional UPDATE (booked < capacity), which
+    is atomic on every backend including SQLite where select_for_update is a no-op.
+    Raises SessionFull when no seat is left, and AlreadyBooked when the member
+    has an appointment that day, including one a concurrent request just made.
+    """
+    time_slot = get_session_slot(session)
+    try:
+        with transaction.atomic():
+            if Appointment.objects.filter(user=user, date=date).exists():
+                raise AlreadyBooked(f"{user} already has an appointment on {date}")
+            availability = get_availability(date, session)
+            reserved = SessionAvailability.objects.filter(
+                pk=availability.pk,
+                booked__lt=F('capacity')
+            ).update(booked=F('booked') + 1)
+            if not reserved:
+                raise SessionFull(f"The {session} session on {date} is fully booked")
+
+            appointment = Appointment(
+                user=user,
+                user_subscription=subscription,
+                date=date,
+                time_slot=time_slot,
+                status='pending'
+            )
+            # The seat is already counted, stop the signal handlers counting it again
+            appointment._seat_counted = True
+            appointment.save()
+    except IntegrityError:
+        # unique (user, date): the seat taken above is rolled back with the insert
+        raise AlreadyBooked(f"{user} already has an appointment on {date}")
+    return appointment
+
+
+def occupy_session(date, session):
+    """Count a seat taken outside the booking engine, e.g. from the admin"""
+    availability = get_availability(date, session)
+    SessionAvailability.objects.filter(pk=availability.pk).update(booked=F('booked') + 1)
+
+
+def release_session(date, session):
+    """Give a seat back to a session"""
+    SessionAvailability.objects.filter(
+        date=date,
+        session=session,
+        booked__gt=0
+    ).update(booked=F('booked') - 1)
+
+
+def join_waitlist(user, subscription, date, session):
+    """Queue a member for a full session, keeping their place if already queued"""
+    entry, created = WaitlistEntry.objects.get_or_create(
+        user=user,
+        date=date,
+        session=session,
+        defaults={'user_subscription': subscription}
+    )
+    if not created and entry.status != 'waiting':
+        # Rejoining goes to the back of the queue
+        entry.delete()
+        entry = WaitlistEntry.objects.create(
+            user=user,
+            user_subscription=subscription,
+            date=date,
+            session=session
+        )
+    return entry
+
+
+def leave_waitlist(entry):
+    entry.status = 'cancelled'
+    entry.save(update_fields=['status'])
+
+
+def _promote(entry):
+    """Give a freed seat to a waiting member, returning their appointment or None"""
+    existing = Appointment.objects.filter(user_id=entry.user_id, date=entry.date).first()
+    if existing and existing.status != 'cancelled':
+        # They booked something else on that day in the meantime
+        entry.status = 'cancelled'
+        entry.save(update_fields=['status'])
+        return None
+
+    time_slot = get_session_slot(entry.session)
+    appointment = existing or Appointment(user_id=entry.user_id, date=entry.date)
+    appointment.user_subscription_id = entry.user_subscription_id
+    appointment.time_slot = time_slot
+    appointment.status = 'pending'
+    # The freed seat passes straight to this appointment
+    appointment._seat_counted = True
+    appointment.save()
+
+    entry.status = 'promoted'
+    entry.save(update_fields=['status'])
+    transaction.on_commit(lambda: send_waitlist_promotion_email(entry.user, appointment))
+    return appointment
+
+
+def free_seat(date, session):
+    """
+    Hand a freed seat to the first member on the waitlist, or release it.
+
+    The head of the queue is read through the waitlist index, so the cost does
+    not grow with the length of the queue.
+    """
+    with transaction.atomic():
+        while True:
+            entry = WaitlistEntry.objects.select_for_update().filter(
+                date=date,
+                session=session,
+                status='waiting'
+            ).order_by('created_at', 'id').first()
+            if entry is None:
+                release_session(date, session)
+                return None
+            appointment = _promote(entry)
+            if appointment:
+                return appointment
+
+
+def cancel_booking(appointment):
+    """Cancel an appointment and pass its seat on"""
+    with transaction.atomic():
+        appointment.status = 'cancelled'
+        appointment._seat_counted = True
+        appointment.save(update_fields=['status'])
+        session = session_for_slot(appointment.time_slot)
+        if session:
+            free_seat(appointment.date, session)
+
+
+def build_availability(start_date, weeks):
+    """
+    Materialize capacity rows for every open session in the next `weeks` weeks.
+
+    Booked counts are recomputed from appointments with a single grouped query,
+    so this also repairs counters that drifted.
+    """
+    end_date = start_date + timedelta(weeks=weeks)
+    dates = [start_date + timedelta(days=offset) for offset in range(weeks * 7)]
+    dates = [day for day in dates if day.weekday() != 5]  # Gym is closed on Saturdays
+
+    # Counted and written in one transaction, the capacity rows locked first,
+    # so a booking can only land before the count or after the write
+    with transaction.atomic():
+        existing = {
+            (availability.date, availability.session): availability
+            for availability in SessionAvailability.objects.select_for_update().filter(
+                date__gte=start_date,
+                date__lt=end_date
+            )
+        }
+        booked = {}
+        counts = Appointment.objects.filter(
+            date__gte=start_date,
+            date__lt=end_date
+        ).exclude(
+            status='cancelled'
+        ).values(
+            'date', 'time_slot__session', 'time_slot__start_time', 'time_slot__end_time'
+        ).annotate(total=Count('id'))
+        for row in counts:
+            session = row['time_slot__session'] or session_for_times(
+                row['time_slot__start_time'],
+                row['time_slot__end_time']
+            )
+            if session:
+                booked[(row['date'], session)] = booked.get((row['date'], session), 0) + row['total']
+
+        to_create = []
+        to_update = []
+        for day in dates:
+            for session in SESSION_TIMES:
+                count = booked.get((day, session), 0)
+                availability = existing.get((day, session))
+                if availability is None:
+                    to_create.append(SessionAvailability(
+                        date=day,
+                        session=session,
+                        capacity=session_capacity(session),
+                        booked=count
+                    ))
+                elif availability.booked != count:
+                    availability.booked = count
+                    to_update.append(availability)
+
+        SessionAvailability.objects.bulk_create(to_create, ignore_conflicts=True)
+        SessionAvailability.objects.bulk_update(to_update, ['booked'])
+    return len(to_create), len(to_update)
+
+
+def month_availability(year, month):
+    """
+    Return remaining capacity for every day of a month, read with one query.
+
+    Days that have not been materialized yet report the configured capacity.
+    """
+    first_day = date_type(year, month, 1)
+    next_month = date_type(year + month // 12, month % 12 + 1, 1)
+    rows = {
+        (availability.date, availability.session): availability
+        for availability in SessionAvailability.objects.filter(date__gte=first_day, date__lt=next_month)
+    }
+
+    days = {}
+    day = first_day
+    while day < next_month:
+        if day.weekday() == 5:
+            days[day.isoformat()] = {'closed': True, 'sessions': {}}
+        else:
+            sessions = {}
+            for session in SESSION_TIMES:
+                availability = rows.get((day, session))
+                capacity = availability.capacity if availability else session_capacity(session)
+                booked = availability.booked if availability else 0
+                sessions[session] = {
+                    'capacity': capacity,
+                    'booked': booked,
+                    'remaining': max(capacity - booked, 0),
+                }
+            days[day.isoformat()] = {'closed': False, 'sessions': sessions}
+        day += timedelta(days=1)
+    return days
+
+
+def recurring_dates(start_date, end_date, weekdays):
+    """Every date between start_date and end_date (inclusive) falling on one of the weekdays"""
+    return [
+        start_date + timedelta(days=offset)
+        for offset in range((end_date - start_date).days + 1)
+        if (start_date + timedelta(days=offset)).weekday() in weekdays
+    ]
+
+
+def reserve_recurring(user, subscription, session, weekdays, start_date, end_date=None):
+    """
+    Book the same session on several weekdays in one transaction.
+
+    Dates run from start_date until end_date or the end of the subscription,
+    whichever comes first. Saturdays, dates that already have an appointment and
+    full sessions are skipped. Returns the created appointments and a dict of
+    skipped dates by reason.
+    """
+    start_date = max(start_date, subscription.start_date)
+    end_date = min(end_date or subscription.end_date, subscription.end_date)
+    dates = recurring_dates(start_date, end_date, set(weekdays))
+
+    skipped = {
+        'closed': [day for day in dates if day.weekday() == 5],  # Gym is closed on Saturdays
+        'existing': [],
+        'full': [],
+    }
+    dates = [day for day in dates if day.weekday() != 5]
+    if not dates:
+        return [], skipped
+
+    time_slot = get_session_slot(session)
+    with transaction.atomic():
+        existing = set(
+            Appointment.objects.filter(user=user, date__in=dates).values_list('date', flat=True)
+        )
+        skipped['existing'] = sorted(existing)
+        dates = [day for day in dates if day not in existing]
+
+        # Create any missing capacity rows in one insert
+        materialized = set(
+            SessionAvailability.objects.filter(session=session, date__in=dates).values_list('date', flat=True)
+        )
+        SessionAvailability.objects.bulk_create([
+            SessionAvailability(date=day, session=session, capacity=session_capacity(session))
+            for day in dates if day not in materialized
+        ], ignore_conflicts=True)
+
+        # Lock the rows that still have a seat and take one seat from each
+        open_rows = dict(
+            SessionAvailability.objects.select_for_update().filter(
+                session=session,
+                date__in=dates,
+                booked__lt=F('capacity')
+            ).values_list('date', 'pk')
+        )
+        SessionAvailability.objects.filter(pk__in=open_rows.values()).update(booked=F('booked') + 1)
+        skipped['full'] = [day for day in dates if day not in open_rows]
+
+        # bulk_create skips the signal handlers, the seats are already counted above
+        appointments = Appointment.objects.bulk_create([
+            Appointment(
+                user=user,
+                user_subscription=subscription,
+                date=day,
+                time_slot=time_slot,
+                status='pending'
+            )
+            for day in dates if day in open_rows
+        ])
+    return appointments, skipped
@@ -0,0 +1,131 @@
+from functools import cached_property
+from io import BytesIO
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen import canvas
+
+# The member's lines: font, size and baseline, centred on the page
+FIELDS = [
+    ('Helvetica-Bold', 22, 470),
+    ('Helvetica', 12, 380),
+]
+# Bytes reserved in the page for each line, enough for the longest names a user can have
+FIELD_SLOT = 1024
+_SLOT_MARK = '%certificate-field'
+
+
+def _text(font, size, y, text):
+    """PDF operators drawing a line centred on the page, in the WinAnsi encoding of the standard fonts"""
+    encoded = text.encode('cp1252', 'replace')
+    x = (letter[0] - stringWidth(encoded.decode('cp1252'), font, size)) / 2
+    escaped = encoded.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)')
+    return b'BT 1 0 0 1 %.3f %d Tm (%s) Tj ET' % (x, y, escaped)
+
+
+class CertificateDesign:
+    """
+    Static artwork of a certificate plus where the member's fields are filled in.
+
+    The page with the artwork (border, logo, title and wording) is rendered
+    once per process, with a blank slot of fixed size for each of the
+    member's lines. A certificate is that page with the slots filled: the
+    PDF keeps its length, so every offset in it stays valid.
+    """
+
+    def __init__(self, key, title, line, accent):
+        self.key = key
+        self.title = title
+        self.line = line
+        self.accent = accent
+
+    def draw_artwork(self, p):
+        width, height = letter
+        # Double border
+        p.setStrokeColor(self.accent)
+        p.setLineWidth(6)
+        p.rect(30, 30, width - 60, height - 60)
+        p.setLineWidth(1.5)
+        p.rect(42, 42, width - 84, height - 84)
+
+        # Logo, a ring with the gym's initials
+        p.setFillColor(self.accent)
+        p.circle(width / 2, 660, 42, stroke=0, fill=1)
+        p.setFillColor(colors.white)
+        p.circle(width / 2, 660, 34, stroke=0, fill=1)
+        p.setFillColor(self.accent)
+        p.setFont("Times-BoldItalic", 30)
+        p.drawCentredString(width / 2, 650, "DG")
+
+        p.setFillColor(colors.black)
+        p.setFont("Helvetica-Bold", 28)
+        p.drawCentredString(width / 2, 560, self.title)
+        p.setFont("Times-Roman", 16)
+        p.drawCentredString(width / 2, 530, "Devi's Gym Pokhara-17 Chhorepatan")
+        p.setFont("Helvetica", 18)
+        p.drawCentredString(width / 2, 420, self.line)
+
+        # Signature line
+        p.setStrokeColor(colors.black)
+        p.setLineWidth(1)
+        p.line(width / 2 - 110, 200, width / 2 + 110, 200)
+        p.setFont("Helvetica", 12)
+        p.drawCentredString(width / 2, 182, "Gym Manager")
+
+    def field_lines(self, first_name, last_name, date):
+        return [f"Awarded to: {first_name} {last_name}", f"Date: {date.strftime('%Y-%m-%d')}"]
+
+    @cached_property
+    def page(self):
+        """The rendered page split around its slots"""
+        buffer = BytesIO()
+        p = canvas.Canvas(buffer, pagesize=letter, invariant=1, pageCompression=0)
+        self.draw_artwork(p)
+        p.setFillColor(colors.black)
+        slot = _SLOT_MARK.ljust(FIELD_SLOT)
+        for font, size, y in FIELDS:
+            # The font stays selected for the line later written into the slot
+            p.setFont(font, size)
+            p.addLiteral(slot)
+        p.showPage()
+        p.save()
+        return buffer.getvalue().split(slot.encode())
+
+    def render(self, first_name, last_name, date):
+        """Render a certificate to PDF bytes"""
+        page = self.page
+        pdf = [page[0]]
+        for (font, size, y), text, rest in zip(FIELDS, self.field_lines(first_name, last_name, date), page[1:]):
+            line = _text(font, size, y, text)
+            if len(line) > FIELD_SLOT:
+                raise ValueError(f'{text!r} does not fit on the certificate')
+            pdf += [line.ljust(FIELD_SLOT), rest]
+        return b''.join(pdf)
+
+
+DESIGNS = {
+    'Course Completion': CertificateDesign(
+        'course_completion',
+        "Fitness Certification",
+        "For completing the fitness course successfully",
+        colors.HexColor('#1f4e79')
+    ),
+    'Top Performer': CertificateDesign(
+        'top_performer',
+        "Certificate of Excellence",
+        "For outstanding performance in training",
+        colors.HexColor('#b8860b')
+    ),
+    'Consistency Award': CertificateDesign(
+        'consistency_award',
+        "Certificate of Consistency",
+        "For showing up and training week after week",
+        colors.HexColor('#2e7d32')
+    ),
+}
+
+DEFAULT_DESIGN = 'Course Completion'
+
+
+def get_design(badge_type):
+    return DESIGNS.get(badge_type, DESIGNS[DEFAULT_DESIGN])
@@ -0,0 +1,171 @@
+import hashlib
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+from .models import Certificate, Badge
+from .leaderboard import award_points_bulk
+from .certificate_templates import get_design, DEFAULT_DESIGN
+
+CERTIFICATE_DIR = 'certificates'
+
+
+def certificate_filename(user):
+    """Name the member downloads the certificate as"""
+    return f"certificate_{user.username}.pdf"
+
+
+def render_certificate_pdf(first_name, last_name, date_joined, badge_type=DEFAULT_DESIGN):
+    """
+    Render a certificate to PDF bytes with the design of the badge type.
+
+    The canvas is invariant (no timestamp or random document id), so the same
+    member always renders to the same bytes and the same content address.
+    Takes plain values so it can run in a worker process.
+    """
+    return get_design(badge_type).render(first_name, last_name, date_joined)
+
+
+def render_certificate(user, badge_type=DEFAULT_DESIGN):
+    return render_certificate_pdf(user.first_name, user.last_name, user.date_joined, badge_type)
+
+
+def store_certificate(pdf):
+    """Save PDF bytes under their SHA-256, returning the storage name"""
+    name = f"{CERTIFICATE_DIR}/{hashlib.sha256(pdf).hexdigest()}.pdf"
+    if not default_storage.exists(name):
+        # Identical content is stored once, a concurrent writer produces the same bytes
+        default_storage.save(name, ContentFile(pdf))
+    return name
+
+
+def certificate_email(user, pdf):
+    email = EmailMessage(
+        "Your Fitness Certificate",
+        "Congratulations! Please find your certificate attached.",
+        "admin@fitnesscenter.com",
+        [user.email]
+    )
+    email.attach(certificate_filename(user), pdf, 'application/pdf')
+    return email
+
+
+def send_certificate_email(user, pdf):
+    certificate_email(user, pdf).send()
+
+
+def _stored(certificate):
+    return (
+        certificate is not None
+        and certificate.file.name.startswith(f'{CERTIFICATE_DIR}/')
+        and default_storage.exists(certificate.file.name)
+    )
+
+
+def issue_certificate(user):
+    """
+    Return the member's certificate, issuing it on the first call.
+
+    Only the first issue creates the Certificate row, awards the Course
+    Completion badge and emails the PDF. Later calls return the stored
+    certificate without rendering anything. Certificates recorded before
+    PDFs were stored are rendered once and repointed, without side effects.
+    Returns (certificate, created).
+    """
+    certificates = Certificate.objects.filter(user=user, badge_type=DEFAULT_DESIGN).order_by('-issued_date', '-id')
+    certificate = certificates.first()
+    if _stored(certificate):
+        return certificate, False
+
+    pdf = render_certificate(user)
+    name = store_certificate(pdf)
+    with transaction.atomic():
+        # Lock the member so concurrent first requests issue a single certificate
+        User.objects.select_for_update().filter(pk=user.pk).first()
+        certificate = certificates.first()
+        if _stored(certificate):
+            return certificate, False
+        if certificate is not None:
+            certificate.file.name = name
+            certificate.save(update_fields=['file'])
+            return certificate, False
+
+        certificate = Certificate.objects.create(user=user, file=name, badge_type=DEFAULT_DESIGN)
+        # Award Badge for Course Completion, its points reach the leaderboard through the Badge signals
+        Badge.objects.create(user=user, badge_type='Course Completion')
+        transaction.on_commit(lambda: send_certificate_email(user, pdf))
+    return certificate, True
+
+
+def _render_member(member):
+    """Worker process entry point, member is a (pk, first_name, last_name, date_joined, badge_type) tuple"""
+    return member[0], render_certificate_pdf(*member[1:])
+
+
+def send_certificate_emails(emails):
+    """Send a batch of certificate emails over one connection"""
+    if emails:
+        get_connection().send_messages(emails)
+
+
+def issue_certificates(users, executor, chunk_size=200, progress=None, badge_type=DEFAULT_DESIGN):
+    """
+    Issue certificates with a badge of badge_type, in that badge's design,
+    to every member of a queryset who has no certificate of that type yet.
+
+    Members are read in primary key chunks. PDFs are rendered in parallel
+    through the executor (a ProcessPoolExecutor in production), the
+    Certificate, Badge and points rows of a chunk are written with bulk
+    inserts in one transaction, and the chunk's emails are sent over a single
+    connection once it commits. progress is called with the running count of
+    issued certificates after each chunk. Returns the number issued.
+    """
+    issued_type = Certificate.objects.filter(badge_type=badge_type)
+    pending = users.exclude(
+        Exists(issued_type.filter(user=OuterRef('pk')))
+    ).order_by('pk')
+    points = Badge.POINTS_MAPPING[badge_type]
+    issued = 0
+    last_pk = 0
+    while True:
+        members = {
+            member.pk: member
+            for member in pending.filter(pk__gt=last_pk).only(
+                'username', 'email', 'first_name', 'last_name', 'date_joined'
+            )[:chunk_size]
+        }
+        if not members:
+            break
+        last_pk = max(members)
+
+        rows = [
+            (pk, member.first_name, member.last_name, member.date_joined, badge_type)
+            for pk, member in members.items()
+        ]
+        pdfs = dict(executor.map(_render_member, rows))
+        names = {pk: store_certificate(pdf) for pk, pdf in pdfs.items()}
+
+        with transaction.atomic():
+            # Skip members who got a certificate from the view while rendering
+            taken = set(issued_type.filter(user_id__in=members).values_list('user_id', flat=True))
+            user_ids = [pk for pk in members if pk not in taken]
+            now = timezone.now()
+            Certificate.objects.bulk_create(
+                [Certificate(user_id=pk, file=names[pk], badge_type=badge_type) for pk in user_ids], batch_size=1000
+            )
+            # bulk_create skips Badge.save() and the Badge signals, so points are set and awarded here
+            badges = Badge.objects.bulk_create([
+                Badge(user_id=pk, badge_type=badge_type, points=points)
+                for pk in user_ids
+            ], batch_size=1000)
+            award_points_bulk(user_ids, points, 'badge', now, {badge.user_id: badge for badge in badges})
+            emails = [certificate_email(members[pk], pdfs[pk]) for pk in user_ids]
+            transaction.on_commit(lambda emails=emails: send_certificate_emails(emails))
+
+        issued += len(user_ids)
+        if progress:
+            progress(issued)
+    return issued
@@ -1,4 +1,4 @@
-from django.core.mail import send_mail
+from django.core.mail import send_mail, EmailMessage
 from django.conf import settings
 
 def send_subscription_email(user, plan, time_slot, start_date, end_date):
@@ -24,7 +24,7 @@ def send_appointment_email(user, appointment):
     )
     send_mail(subject, message, settings.DEFAULT_FROM_EMAIL, [user.email])
 
-def send_subscription_expiration_email(user, subscription):
+def subscription_expiration_message(user, subscription):
     subject = "Your Gym Subscription is Expiring Soon"
     message = (
         f"Hello {user.username},\n\n"
@@ -37,9 +37,12 @@ def send_subscription_expiration_email(user, subscription):
         "Best regards,\n"
         "Devi's Gym Nepal Team"
     )
-    send_mail(subject, message, settings.DEFAULT_FROM_EMAIL, [user.email])
+    return EmailMessage(subject, message, settings.DEFAULT_FROM_EMAIL, [user.email])
 
-def send_subscription_expired_email(user, subscription):
+def send_subscription_expiration_email(user, subscription):
+    subscription_expiration_message(user, subscription).send()
+
+def subscription_expired_message(user, subscription):
     subject = "Your Gym Subscription Has Expired"
     message = (
         f"Hello {user.username},\n\n"
@@ -52,4 +55,32 @@ def send_subscription_expired_email(user, subscription):
         "Best regards,\n"
         "Devi's Gym Nepal Team"
     )
-    send_mail(subject, message, settings.DEFAULT_FROM_EMAIL, [user.email]) 
\ No newline at end of file
+    return EmailMessage(subject, message, settings.DEFAULT_FROM_EMAIL, [user.email])
+
+def send_subscription_expired_email(user, subscription):
+    subscription_expired_message(user, subscription).send()
+
+def send_recurring_appointment_email(user, appointments):
+    subject = "Your Gym Appointments Are Booked"
+    time_slot = appointments[0].time_slot
+    dates = "\n".join(f"- {appointment.date.strftime('%A, %B %d, %Y')}" for appointment in appointments)
+    message = (
+        f"Hello {user.username},\n\n"
+        f"Your {len(appointments)} appointments are confirmed.\n"
+        f"Session: {time_slot.get_session_display()} ({time_slot.start_time.strftime('%I:%M %p')} to {time_slot.end_time.strftime('%I:%M %p')})\n\n"
+        f"Dates:\n{dates}\n\n"
+        "See you at the gym!"
+    )
+    send_mail(subject, message, settings.DEFAULT_FROM_EMAIL, [user.email])
+
+def send_waitlist_promotion_email(user, appointment):
+    subject = "A Spot Opened Up For Your Gym Session"
+    time_slot = appointment.time_slot
+    message = (
+        f"Hello {user.username},\n\n"
+        f"Good news! A spot opened up and you have been moved off the waitlist.\n"
+        f"Your appointment is confirmed for {appointment.date}.\n"
+        f"Session: {time_slot.get_session_display()} ({time_slot.start_time.strftime('%I:%M %p')} to {time_slot.end_time.strftime('%I:%M %p')})\n\n"
+        "See you at the gym!"
+    )
+    send_mail(subject, message, settings.DEFAULT_FROM_EMAIL, [user.email])
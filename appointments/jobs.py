@@ -0,0 +1,76 @@
+from datetime import timedelta
+from io import StringIO
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core.management import call_command
+from django.db.models import Q
+from django.utils import timezone
+from notifications.models import Notification, UserNotification
+from notifications.fanout import deliver_pending
+from .booking import build_availability
+from .models import OutboxEmail
+from .otp_store import get_otp_store
+from .scheduler import job
+from .management.commands import check_expiring_subscriptions, reconcile_points
+
+
+def run_command(command, **options):
+    """Run a management command quietly, returning the rows it reports touching"""
+    call_command(command, stdout=StringIO(), **options)
+    return command.rows
+
+
+@job('expire_subscriptions', cron='0 6 * * *')
+def expire_subscriptions():
+    return run_command(check_expiring_subscriptions.Command())
+
+
+@job('build_availability', cron='45 2 * * *')
+def extend_availability():
+    # Keeps the rolling horizon of capacity rows ahead of the calendar, and repairs drifted counts
+    created, updated = build_availability(timezone.now().date(), getattr(settings, 'AVAILABILITY_WEEKS', 8))
+    return created + updated
+
+
+@job('purge_otps', every=timedelta(hours=1))
+def purge_otps():
+    return get_otp_store().purge()
+
+
+@job('clear_sessions', cron='30 3 * * *')
+def clear_sessions():
+    deleted, _ = Session.objects.filter(expire_date__lt=timezone.now()).delete()
+    return deleted
+
+
+@job('reconcile_points', cron='0 4 * * 0', lease=timedelta(hours=3))
+def reconcile():
+    return run_command(reconcile_points.Command(), fix=True)
+
+
+@job('deliver_notifications', every=timedelta(minutes=1))
+def deliver_notifications():
+    return deliver_pending()
+
+
+@job('prune_notifications', cron='0 5 * * *')
+def prune_notifications():
+    cutoff = timezone.now() - timedelta(days=getattr(settings, 'NOTIFICATION_RETENTION_DAYS', 90))
+    # Read notifications first, then retired announcements with whatever is left of them.
+    # Read rows of broadcasts stand in for the read watermark and are kept.
+    read, _ = UserNotification.objects.filter(
+        is_read=True,
+        created_at__lt=cutoff,
+        notification__broadcast_at__isnull=True
+    ).delete()
+    retired, _ = Notification.objects.filter(is_active=False, created_at__lt=cutoff).delete()
+    return read + retired
+
+
+@job('prune_outbox', cron='15 5 * * *')
+def prune_outbox():
+    cutoff = timezone.now() - timedelta(days=getattr(settings, 'OUTBOX_RETENTION_DAYS', 30))
+    deleted, _ = OutboxEmail.objects.filter(
+        Q(status='sent', sent_at__lt=cutoff) | Q(status='dead', created_at__lt=cutoff)
+    ).delete()
+    return deleted
@@ -0,0 +1,184 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum, Window, Subquery, Value, DateField
+from django.db.models.functions import Rank, Coalesce, TruncWeek, TruncMonth
+from django.utils import timezone
+from .models import Leaderboard, PointsRollup, PointsEntry
+
+DEFAULT_PAGE_SIZE = 50
+
+# Boards a member can pick, 'all' is the all-time Leaderboard table
+WINDOWS = ['all', 'week', 'month']
+
+
+def period_start(period, day):
+    """Monday of the ISO week or first day of the month containing the day"""
+    if period == 'week':
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+
+def _increment(model, points, **lookup):
+    updated = model.objects.filter(**lookup).update(points=F('points') + points)
+    if updated:
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(points=points, **lookup)
+    except IntegrityError:
+        # Another request created the row in the meantime
+        model.objects.filter(**lookup).update(points=F('points') + points)
+
+
+def add_points(user_id, points, awarded_at):
+    """
+    Add (or with a negative value remove) points on a member's all-time row
+    and on the week and month rollups of the day they were awarded.
+    """
+    _increment(Leaderboard, points, user_id=user_id)
+    day = timezone.localdate(awarded_at)
+    for period in ('week', 'month'):
+        _increment(PointsRollup, points, user_id=user_id, period=period, period_start=period_start(period, day))
+
+
+def award_points(user_id, points, reason, awarded_at=None, badge=None):
+    """
+    Record points in the ledger and add them to the counters in the same
+    transaction. Counters only ever move by F() expressions, so concurrent
+    awards never overwrite each other.
+    """
+    if not points:
+        return None
+    awarded_at = awarded_at or timezone.now()
+    with transaction.atomic():
+        entry = PointsEntry.objects.create(
+            user_id=user_id,
+            points=points,
+            reason=reason,
+            badge=badge,
+            awarded_at=awarded_at
+        )
+        add_points(user_id, points, awarded_at)
+    return entry
+
+
+def _increment_many(model, user_ids, points, **lookup):
+    rows = model.objects.filter(user_id__in=user_ids, **lookup)
+    existing = set(rows.values_list('user_id', flat=True))
+    rows.update(points=F('points') + points)
+    model.objects.bulk_create([
+        model(user_id=user_id, points=points, **lookup)
+        for user_id in user_ids if user_id not in existing
+    ])
+
+
+def award_points_bulk(user_ids, points, reason, awarded_at=None, badges=None):
+    """
+    award_points for many members receiving the same points at the same
+    moment, with a fixed number of queries whatever the number of members.
+    badges optionally maps user ids to the badge each entry is for.
+    """
+    if not points or not user_ids:
+        return
+    awarded_at = awarded_at or timezone.now()
+    badges = badges or {}
+    day = timezone.localdate(awarded_at)
+    with transaction.atomic():
+        PointsEntry.objects.bulk_create([
+            PointsEntry(
+                user_id=user_id,
+                points=points,
+                reason=reason,
+                badge=badges.get(user_id),
+                awarded_at=awarded_at
+            )
+            for user_id in user_ids
+        ], batch_size=1000)
+        _increment_many(Leaderboard, user_ids, points)
+        for period in ('week', 'month'):
+            _increment_many(PointsRollup, user_ids, points, period=period, period_start=period_start(period, day))
+
+
+def board(window='all'):
+    """Rows of a leaderboard, each with a user and points"""
+    if window == 'all':
+        rows = Leaderboard.objects.all()
+    else:
+        rows = PointsRollup.objects.filter(
+            period=window,
+            period_start=period_start(window, timezone.localdate())
+        )
+    # Rows whose points were all revoked stay behind at zero
+    return rows.exclude(points=0)
+
+
+def ranked(window='all'):
+    """Leaderboard rows annotated with their RANK(), highest points first"""
+    return board(window).select_related('user').annotate(
+        rank=Window(Rank(), order_by=F('points').desc())
+    ).order_by('-points', 'user_id')
+
+
+def leaderboard_page(page_number, window='all', page_size=None):
+    page_size = page_size or getattr(settings, 'LEADERBOARD_PAGE_SIZE', DEFAULT_PAGE_SIZE)
+    return Paginator(ranked(window), page_size).get_page(page_number)
+
+
+def member_rank(user, window='all'):
+    """
+    Rank of a member, equal to RANK() over the whole board.
+
+    Counts the rows with more points than the member in one query that reads
+    the points index, members without a row count as having no points.
+    """
+    rows = board(window)
+    own_points = rows.filter(user_id=user.pk).values('points')
+    ahead = rows.filter(
+        points__gt=Coalesce(Subquery(own_points), Value(0))
+    ).count()
+    return ahead + 1
+
+
+def ledger_totals(user_ids):
+    """All-time points of some members, summed from the ledger"""
+    return dict(
+        PointsEntry.objects.filter(user_id__in=user_ids).values('user_id').annotate(
+            total=Sum('points')
+        ).values_list('user_id', 'total')
+    )
+
+
+def ledger_rollups(user_ids):
+    """{(user_id, period, period_start): points} of some members, summed from the ledger"""
+    rollups = {}
+    for period, trunc in (('week', TruncWeek), ('month', TruncMonth)):
+        totals = PointsEntry.objects.filter(user_id__in=user_ids).annotate(
+            start=trunc('awarded_at', output_field=DateField())
+        ).values('user_id', 'start').annotate(total=Sum('points')).exclude(total=0)
+        for row in totals:
+            rollups[(row['user_id'], period, row['start'])] = row['total']
+    return rollups
+
+
+def lock_counters(user_ids):
+    """
+    Lock some members' leaderboard rows until the transaction ends. Awards
+    update that row first, so none commits between reading the ledger and
+    writing counters computed from it.
+    """
+    list(Leaderboard.objects.select_for_update().filter(user_id__in=user_ids).values_list('pk', flat=True))
+
+
+def rebuild_rollups(user_ids):
+    """Recompute the week and month rollups of some members from the ledger"""
+    with transaction.atomic():
+        lock_counters(user_ids)
+        rows = [
+            PointsRollup(user_id=user_id, period=period, period_start=start, points=points)
+            for (user_id, period, start), points in ledger_rollups(user_ids).items()
+        ]
+        PointsRollup.objects.filter(user_id__in=user_ids).delete()
+        PointsRollup.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
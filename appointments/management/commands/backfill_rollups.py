@@ -0,0 +1,37 @@
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from appointments.leaderboard import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuilds the weekly and monthly leaderboard rollups from the badge history. '
+        'Each chunk of members is rebuilt in its own transaction, so an interrupted run '
+        'can simply be started again.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500, help='Members rebuilt per transaction')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        user_ids = User.objects.order_by('pk').values_list('pk', flat=True)
+        total_users = 0
+        total_rows = 0
+        last_pk = 0
+        started = time.perf_counter()
+        while True:
+            chunk = list(user_ids.filter(pk__gt=last_pk)[:chunk_size])
+            if not chunk:
+                break
+            total_rows += rebuild_rollups(chunk)
+            total_users += len(chunk)
+            last_pk = chunk[-1]
+            self.stdout.write(f'{total_users} members, {total_rows} rollup rows')
+
+        elapsed = time.perf_counter() - started
+        rate = total_users / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {total_rows} rollup rows for {total_users} members in {elapsed:.2f}s ({rate:.0f} members/sec)'
+        ))
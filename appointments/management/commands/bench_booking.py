@@ -0,0 +1,100 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+from appointments.models import SubscriptionPlan, UserSubscription, Appointment, SessionAvailability
+from appointments.booking import reserve_session, get_session_slot, SessionFull
+
+BENCH_PREFIX = 'bench_booking_'
+
+
+class Command(BaseCommand):
+    help = 'Fires parallel bookings at a single session and checks that it is never overbooked'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bookings', type=int, default=300, help='Number of members booking at once')
+        parser.add_argument('--workers', type=int, default=32, help='Number of parallel threads')
+        parser.add_argument('--capacity', type=int, default=30, help='Seats available in the session')
+        parser.add_argument('--session', default='evening', choices=['morning', 'afternoon', 'evening'])
+
+    def handle(self, *args, **options):
+        bookings = options['bookings']
+        capacity = options['capacity']
+        session = options['session']
+
+        # Book far in the future on a weekday so real data is never touched
+        date = timezone.now().date() + timedelta(days=3650)
+        while date.weekday() == 5:
+            date += timedelta(days=1)
+
+        self.cleanup(date, session)
+        subscriptions = self.setup(bookings, date, session, capacity)
+
+        def book(subscription):
+            try:
+                reserve_session(subscription.user, subscription, date, session)
+                return 'booked'
+            except SessionFull:
+                return 'full'
+            except Exception as e:
+                return f'error: {e}'
+            finally:
+                connection.close()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            results = list(executor.map(book, subscriptions))
+        elapsed = time.perf_counter() - started
+
+        booked = results.count('booked')
+        full = results.count('full')
+        errors = [r for r in results if r.startswith('error')]
+        availability = SessionAvailability.objects.get(date=date, session=session)
+        appointments = Appointment.objects.filter(date=date, user__username__startswith=BENCH_PREFIX).count()
+
+        self.stdout.write(f'{bookings} booking attempts on {options["workers"]} threads in {elapsed:.2f}s '
+                          f'({bookings / elapsed:.1f} bookings/sec)')
+        self.stdout.write(f'Booked: {booked}, rejected as full: {full}, errors: {len(errors)}')
+        for error in errors[:5]:
+            self.stdout.write(self.style.ERROR(error))
+
+        expected = min(bookings, capacity)
+        if booked == appointments == availability.booked == expected and not errors:
+            self.stdout.write(self.style.SUCCESS(f'Session filled to exactly {availability.booked}/{capacity} seats'))
+        else:
+            self.stdout.write(self.style.ERROR(
+                f'Inconsistent result: {booked} booked, {appointments} appointments, '
+                f'counter {availability.booked}, capacity {capacity}'
+            ))
+
+        self.cleanup(date, session)
+
+    def setup(self, bookings, date, session, capacity):
+        plan = SubscriptionPlan.objects.create(name=f'{BENCH_PREFIX}plan', duration_months=1, price=0)
+        time_slot = get_session_slot(session)
+        User.objects.bulk_create([
+            User(username=f'{BENCH_PREFIX}{i}', email=f'{BENCH_PREFIX}{i}@example.com')
+            for i in range(bookings)
+        ])
+        users = User.objects.filter(username__startswith=BENCH_PREFIX)
+        UserSubscription.objects.bulk_create([
+            UserSubscription(
+                user=user,
+                plan=plan,
+                start_date=date,
+                end_date=date,
+                time_slot=time_slot,
+                is_active=True
+            )
+            for user in users
+        ])
+        SessionAvailability.objects.create(date=date, session=session, capacity=capacity)
+        return list(UserSubscription.objects.filter(plan=plan).select_related('user'))
+
+    def cleanup(self, date, session):
+        User.objects.filter(username__startswith=BENCH_PREFIX).delete()
+        SubscriptionPlan.objects.filter(name=f'{BENCH_PREFIX}plan').delete()
+        SessionAvailability.objects.filter(date=date, session=session).delete()
@@ -0,0 +1,94 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from io import BytesIO
+from django.contrib.auth.models import User
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from appointments.models import Certificate, OutboxEmail
+from appointments.certificates import issue_certificates
+from appointments.certificate_templates import DESIGNS
+from appointments.outbox import HELD_UNTIL
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen import canvas
+
+BENCH_PREFIX = 'bench_certificate_'
+
+
+def previous_render(first_name, last_name, date_joined):
+    """The renderer generate_certificate used before the template layer, for comparison"""
+    buffer = BytesIO()
+    p = canvas.Canvas(buffer, pagesize=letter)
+    p.setFont("Helvetica-Bold", 24)
+    p.drawString(200, 750, "Fitness Certification")
+    p.setFont("Helvetica", 18)
+    p.drawString(220, 700, f"Awarded to: {first_name} {last_name}")
+    p.drawString(220, 670, "For completing the fitness course successfully")
+    p.setFont("Helvetica", 12)
+    p.drawString(220, 640, f"Date: {date_joined.strftime('%Y-%m-%d')}")
+    p.showPage()
+    p.save()
+    return buffer.getvalue()
+
+
+class Command(BaseCommand):
+    help = (
+        'Measures certificates issued per second for growing cohort sizes. Certificate emails '
+        'are queued as usual but never become due, and are deleted afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10,100,500,1000', help='Comma separated cohort sizes')
+        parser.add_argument('--workers', type=int, nargs='*', default=[1, 4], help='Process counts to compare')
+        parser.add_argument('--chunk-size', type=int, default=200, help='Certificates written per transaction')
+        parser.add_argument('--renders', type=int, default=500, help='Renders per renderer in the render comparison')
+
+    # A live mail worker must not send the bench's certificates
+    @override_settings(EMAIL_BACKEND='appointments.outbox.HeldOutboxBackend')
+    def handle(self, *args, **options):
+        self.compare_renderers(options['renders'])
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        self.stdout.write(f'{"cohort":>8} {"workers":>8} {"seconds":>9} {"certs/sec":>10}')
+        for size in sizes:
+            for workers in options['workers']:
+                self.cleanup()
+                users = self.setup(size)
+                started = time.perf_counter()
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    issued = issue_certificates(users, executor, options['chunk_size'])
+                elapsed = time.perf_counter() - started
+                self.stdout.write(f'{issued:>8} {workers:>8} {elapsed:>9.2f} {issued / elapsed:>10.1f}')
+        self.cleanup()
+
+    def compare_renderers(self, renders):
+        design = DESIGNS['Course Completion']
+        renderers = {
+            'previous renderer (text only)': previous_render,
+            'design with artwork': design.render,
+        }
+        date_joined = datetime(2025, 1, 1)
+        self.stdout.write(f'{"renderer":32} {"ms/render":>10} {"bytes":>8}')
+        for name, render in renderers.items():
+            render('Warm', 'Up', date_joined)
+            started = time.perf_counter()
+            for i in range(renders):
+                pdf = render(f'Member{i}', 'Rai', date_joined)
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f'{name:32} {elapsed / renders * 1000:>10.3f} {len(pdf):>8}')
+        self.stdout.write('')
+
+    def setup(self, size):
+        # bulk_create skips the welcome email signal
+        User.objects.bulk_create([
+            User(username=f'{BENCH_PREFIX}{i}', email=f'{BENCH_PREFIX}{i}@example.com', first_name=f'Member{i}')
+            for i in range(size)
+        ])
+        return User.objects.filter(username__startswith=BENCH_PREFIX)
+
+    def cleanup(self):
+        users = User.objects.filter(username__startswith=BENCH_PREFIX)
+        for name in Certificate.objects.filter(user__in=users).values_list('file', flat=True):
+            default_storage.delete(name)
+        users.delete()
+        OutboxEmail.objects.filter(next_attempt_at=HELD_UNTIL).delete()
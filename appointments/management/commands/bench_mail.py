@@ -0,0 +1,132 @@
+import socketserver
+import threading
+import time
+from django.core.mail import EmailMessage, get_connection
+from django.core.management.base import BaseCommand
+from appointments.models import OutboxEmail
+from appointments.outbox import HELD_UNTIL, Dispatcher, HeldOutboxBackend, TokenBucket, deliver_batch
+
+BENCH_SUBJECT = 'bench_mail'
+
+
+class StandInSMTPHandler(socketserver.StreamRequestHandler):
+    """
+    Just enough SMTP to accept mail: every reply is delayed by the server's
+    latency to stand in for the round trips to a real provider, and from
+    throttle_after messages on MAIL is refused with 421 like a throttling provider.
+    """
+
+    def reply(self, line):
+        time.sleep(self.server.latency)
+        self.wfile.write(f'{line}\r\n'.encode())
+
+    def handle(self):
+        self.reply('220 bench ESMTP')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line[:4].decode().upper()
+            if command in ('EHLO', 'HELO'):
+                self.reply('250 bench')
+            elif command == 'MAIL':
+                with self.server.lock:
+                    throttled = 0 <= self.server.throttle_after <= self.server.received
+                self.reply('421 4.7.0 Try again later' if throttled else '250 OK')
+            elif command == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                while self.rfile.readline() not in (b'.\r\n', b''):
+                    pass
+                with self.server.lock:
+                    self.server.received += 1
+                self.reply('250 OK queued')
+            elif command == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                # RCPT, RSET and NOOP
+                self.reply('250 OK')
+
+
+class StandInSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, latency, throttle_after=-1):
+        super().__init__(('127.0.0.1', 0), StandInSMTPHandler)
+        self.latency = latency
+        self.throttle_after = throttle_after
+        self.received = 0
+        self.lock = threading.Lock()
+
+
+class Command(BaseCommand):
+    help = 'Measures outbox delivery rate against a local stand-in SMTP server for growing worker counts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--emails', type=int, default=500, help='Emails delivered per run')
+        parser.add_argument('--workers', type=int, nargs='*', default=[1, 2, 4, 8], help='Worker counts to compare')
+        parser.add_argument('--latency', type=float, default=20, help='Milliseconds the server takes per reply')
+        parser.add_argument('--rate-per-minute', type=int, help='Apply a rate limit, unlimited by default')
+        parser.add_argument('--throttle-after', type=int, default=-1,
+                            help='Server refuses mail with 421 after this many messages')
+
+    def handle(self, *args, **options):
+        server = StandInSMTPServer(options['latency'] / 1000, options['throttle_after'])
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        host, port = server.server_address
+        self.stdout.write(f'Stand-in SMTP server on {host}:{port}, {options["latency"]:.0f}ms per reply')
+        self.stdout.write(f'{"workers":>8} {"sent":>6} {"throttled":>10} {"seconds":>9} {"emails/sec":>11}')
+        try:
+            for workers in options['workers']:
+                self.cleanup()
+                self.queue(options['emails'])
+                with server.lock:
+                    server.received = 0
+                per_minute = options['rate_per_minute'] or 10 ** 9
+                dispatcher = Dispatcher(
+                    workers,
+                    TokenBucket(per_minute, 10 ** 9),
+                    lambda: get_connection(
+                        'django.core.mail.backends.smtp.EmailBackend',
+                        host=host, port=port, username='', password='', use_tls=False, use_ssl=False
+                    )
+                )
+                started = time.perf_counter()
+                outcomes = self.deliver(dispatcher)
+                elapsed = time.perf_counter() - started
+                dispatcher.shutdown()
+                sent = outcomes.count('sent')
+                self.stdout.write(
+                    f'{workers:>8} {sent:>6} {outcomes.count("throttled"):>10} {elapsed:>9.2f} {sent / elapsed:>11.1f}'
+                )
+        finally:
+            server.shutdown()
+            server.server_close()
+            self.cleanup()
+
+    def queue(self, count):
+        # Held, so a mail worker running alongside never claims them
+        HeldOutboxBackend().send_messages([
+            EmailMessage(f'{BENCH_SUBJECT} {i}', 'Benchmark message\n' * 40, 'gym@example.com', [f'member{i}@example.com'])
+            for i in range(count)
+        ])
+
+    def deliver(self, dispatcher):
+        """Deliver the benchmark's queued emails in claim sized batches, as the worker does"""
+        outcomes = []
+        while True:
+            # A throttled email is rescheduled, it is not retried within the run
+            emails = list(OutboxEmail.objects.filter(
+                subject__startswith=BENCH_SUBJECT, status='queued', attempts=0, last_error=''
+            ).order_by('pk')[:100])
+            if not emails:
+                return outcomes
+            outcomes += deliver_batch(dispatcher, emails, max_attempts=1)
+            # Throttled emails were rescheduled, hold them again
+            OutboxEmail.objects.filter(
+                pk__in=[email.pk for email in emails], status='queued'
+            ).update(next_attempt_at=HELD_UNTIL)
+
+    def cleanup(self):
+        OutboxEmail.objects.filter(subject__startswith=BENCH_SUBJECT).delete()
@@ -0,0 +1,80 @@
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.test import Client, RequestFactory, override_settings
+from django.urls import reverse
+from appointments.models import OutboxEmail
+from appointments.otp_models import OTP
+from appointments.ratelimit import account_key, bucket_cache, ip_key, take
+from appointments.views import forgot_password
+
+BENCH_EMAIL = 'bench_ratelimit@example.com'
+
+
+class Command(BaseCommand):
+    help = (
+        'Load tests forgot_password: compares the cost of an accepted request, which '
+        'writes an OTP and queues an email, with a request the rate limit turns away'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help='Requests per measurement')
+
+    def handle(self, *args, **options):
+        count = options['requests']
+        self.cleanup()
+        User.objects.create_user(username='bench_ratelimit', email=BENCH_EMAIL)
+        url = reverse('forgot_password')
+        client = Client()
+        try:
+            # Mail is queued as in production, whatever backend these settings use, but held
+            # so a mail worker running alongside never sends it
+            with override_settings(RATE_LIMIT_ENABLED=False, EMAIL_BACKEND='appointments.outbox.HeldOutboxBackend'):
+                accepted = self.measure(count, lambda i: client.post(url, {'email': BENCH_EMAIL}, REMOTE_ADDR='10.1.0.1'))
+
+            self.forget_buckets(count)
+            # Use up the bench email's bucket, every request after that is turned away
+            for i in range(3):
+                client.post(url, {'email': BENCH_EMAIL}, REMOTE_ADDR=f'10.2.0.{i}')
+            throttled = self.measure(
+                count,
+                lambda i: client.post(url, {'email': BENCH_EMAIL}, REMOTE_ADDR=f'10.3.{i // 250}.{i % 250}')
+            )
+            # The same, without the test client and middleware around the view
+            factory = RequestFactory()
+            view = self.measure(
+                count,
+                lambda i: forgot_password(factory.post(url, {'email': BENCH_EMAIL}, REMOTE_ADDR='10.4.0.1'))
+            )
+            bucket = self.measure(count, lambda i: take('ratelimit:bench', 1, 3600))
+        finally:
+            self.forget_buckets(count)
+            self.cleanup()
+
+        self.stdout.write(f'{"request":<34} {"per request":>12} {"requests/sec":>13}')
+        for label, seconds in [
+            ('accepted (OTP row + queued email)', accepted),
+            ('throttled (429)', throttled),
+            ('throttled view, no middleware', view),
+            ('bucket check alone', bucket),
+        ]:
+            self.stdout.write(f'{label:<34} {seconds / count * 1e6:>10.0f}us {count / seconds:>13.0f}')
+
+    def measure(self, count, request):
+        started = time.perf_counter()
+        for i in range(count):
+            request(i)
+        return time.perf_counter() - started
+
+    def forget_buckets(self, count):
+        """Drop the buckets the bench filled, leaving everyone else's in the shared cache"""
+        ips = ['10.1.0.1', '10.4.0.1'] + [f'10.2.0.{i}' for i in range(3)]
+        ips += [f'10.3.{i // 250}.{i % 250}' for i in range(count)]
+        bucket_cache().delete_many(
+            [ip_key('otp', ip) for ip in ips] + [account_key('otp', BENCH_EMAIL), 'ratelimit:bench']
+        )
+
+    def cleanup(self):
+        User.objects.filter(email=BENCH_EMAIL).delete()
+        OTP.objects.filter(email=BENCH_EMAIL).delete()
+        OutboxEmail.objects.filter(recipients=[BENCH_EMAIL]).delete()
@@ -0,0 +1,134 @@
+import json
+import statistics
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.urls import reverse
+
+# Maximum number of SQL queries each page may run. A page going over its
+# budget usually means a template started querying inside a loop.
+MEMBER_PAGES = {
+    'home': ('home', 10),
+    'my_appointments': ('my_appointments', 12),
+    'workout_history': ('workout_history', 12),
+    'progress_history': ('progress_history', 12),
+    'leaderboard': ('leaderboard', 10),
+    'user_notifications': ('notifications:user_notifications', 6),
+}
+ADMIN_PAGES = {
+    'admin_appointments': ('admin:appointments_appointment_changelist', 10),
+    'admin_subscriptions': ('admin:appointments_usersubscription_changelist', 10),
+    'admin_payments': ('admin:appointments_payment_changelist', 10),
+    'admin_badges': ('admin:appointments_badge_changelist', 10),
+    'admin_notifications': ('admin:notifications_notification_changelist', 14),
+    'admin_user_notifications': ('admin:notifications_usernotification_changelist', 10),
+}
+
+
+class QueryTimer:
+    """Database execute wrapper counting queries and their time with a precise clock"""
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.queries += 1
+
+
+class Command(BaseCommand):
+    help = 'Measures wall time and SQL cost of the main pages and fails when a page exceeds its query budget'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5, help='Requests per page, the first one warms up')
+        parser.add_argument('--username', help='Member to browse as, defaults to the one with the most appointments')
+        parser.add_argument('--output', default='bench_views.json', help='File to write the JSON results to')
+
+    def handle(self, *args, **options):
+        member = self.get_member(options['username'])
+        admin = self.get_admin()
+        self.stdout.write(f'Browsing as {member.username} and {admin.username}, {options["runs"]} runs per page')
+
+        results = {}
+        for name, (url_name, budget) in MEMBER_PAGES.items():
+            results[name] = self.measure(member, reverse(url_name), budget, options['runs'])
+        for name, (url_name, budget) in ADMIN_PAGES.items():
+            results[name] = self.measure(admin, reverse(url_name), budget, options['runs'])
+
+        over_budget = []
+        for name, result in results.items():
+            line = (f'{name:28} {result["wall_ms"]:8.1f} ms  {result["sql_ms"]:8.1f} ms SQL  '
+                    f'{result["queries"]:4} queries (budget {result["budget"]})')
+            if result['queries'] > result['budget']:
+                over_budget.append(name)
+                self.stdout.write(self.style.ERROR(line))
+            else:
+                self.stdout.write(line)
+
+        with open(options['output'], 'w') as output:
+            json.dump({
+                'member': member.username,
+                'runs': options['runs'],
+                'pages': results,
+            }, output, indent=2)
+        self.stdout.write(f'Results written to {options["output"]}')
+
+        if over_budget:
+            raise CommandError(f'Query budget exceeded by: {", ".join(over_budget)}')
+
+    def get_member(self, username):
+        if username:
+            try:
+                return User.objects.get(username=username)
+            except User.DoesNotExist:
+                raise CommandError(f'User {username} does not exist')
+        member = User.objects.filter(is_staff=False).annotate(
+            appointments=Count('appointment')
+        ).order_by('-appointments').first()
+        if member is None:
+            raise CommandError('No members found, run seed_benchmark first')
+        return member
+
+    def get_admin(self):
+        admin = User.objects.filter(is_superuser=True).first()
+        if admin is None:
+            # bulk_create skips the welcome email signal
+            admin = User.objects.bulk_create([
+                User(username='bench_admin', email='bench_admin@example.com', is_staff=True, is_superuser=True)
+            ])[0]
+        return admin
+
+    def measure(self, user, url, budget, runs):
+        client = Client()
+        client.force_login(user)
+        walls = []
+        sql_times = []
+        queries = 0
+        for run in range(runs):
+            timer = QueryTimer()
+            with connection.execute_wrapper(timer):
+                started = time.perf_counter()
+                response = client.get(url)
+                wall = time.perf_counter() - started
+            if response.status_code != 200:
+                raise CommandError(f'{url} returned {response.status_code}')
+            if run == 0 and runs > 1:
+                continue  # Warm-up request fills caches and compiles templates
+            walls.append(wall * 1000)
+            sql_times.append(timer.seconds * 1000)
+            queries = timer.queries
+        return {
+            'url': url,
+            'wall_ms': round(statistics.median(walls), 2),
+            'sql_ms': round(statistics.median(sql_times), 2),
+            'queries': queries,
+            'budget': budget,
+        }
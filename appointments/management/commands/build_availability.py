@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from appointments.booking import build_availability
+
+class Command(BaseCommand):
+    help = 'Precomputes remaining session capacity for the upcoming weeks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--weeks', type=int, default=getattr(settings, 'AVAILABILITY_WEEKS', 8), help='Number of weeks ahead to materialize')
+
+    def handle(self, *args, **options):
+        today = timezone.now().date()
+        created, updated = build_availability(today, options['weeks'])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Materialized availability for the next {options["weeks"]} weeks: '
+                f'{created} rows created, {updated} rows corrected'
+            )
+        )
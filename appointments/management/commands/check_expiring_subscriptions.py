@@ -1,59 +1,115 @@
+import time
+from django.conf import settings
+from django.core.mail import get_connection
 from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Exists, OuterRef
 from django.utils import timezone
 from datetime import timedelta
-from appointments.models import UserSubscription
-from appointments.email_utils import send_subscription_expiration_email, send_subscription_expired_email
+from appointments.models import UserSubscription, SubscriptionReminder
+from appointments.email_utils import subscription_expiration_message, subscription_expired_message
+from appointments.subscriptions import invalidate_active_subscriptions
 
 class Command(BaseCommand):
-    help = 'Checks for subscriptions that are about to expire or have expired and sends notifications'
+    help = 'Sends expiry reminders once per subscription and deactivates every subscription past its end date'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500, help='Subscriptions read, emailed and updated per batch')
+        parser.add_argument(
+            '--notify-days', type=int, default=getattr(settings, 'EXPIRED_NOTICE_DAYS', 7),
+            help='Only email members whose subscription ended within this many days, older ones are deactivated quietly'
+        )
 
     def handle(self, *args, **options):
         today = timezone.now().date()
         three_days_from_now = today + timedelta(days=3)
+        self.chunk_size = options['chunk_size']
+        self.connection = get_connection()
+        # Subscriptions handled, for the scheduler
+        self.rows = 0
 
-        # Check for subscriptions about to expire (within next 3 days)
-        expiring_subscriptions = UserSubscription.objects.filter(
-            is_active=True,
-            end_date__lte=three_days_from_now,
-            end_date__gt=today
+        # Subscriptions about to expire (within next 3 days) that have not been reminded yet
+        self.sweep(
+            'expiration notifications',
+            'expiring',
+            UserSubscription.objects.filter(
+                is_active=True,
+                end_date__lte=three_days_from_now,
+                end_date__gt=today
+            ).exclude(
+                Exists(SubscriptionReminder.objects.filter(subscription=OuterRef('pk'), kind='expiring'))
+            ),
+            subscription_expiration_message,
+            deactivate=False
         )
 
-        for subscription in expiring_subscriptions:
-            try:
-                send_subscription_expiration_email(subscription.user, subscription)
-                self.stdout.write(
-                    self.style.SUCCESS(
-                        f'Successfully sent expiration notification to {subscription.user.username}'
-                    )
-                )
-            except Exception as e:
-                self.stdout.write(
-                    self.style.ERROR(
-                        f'Failed to send expiration notification to {subscription.user.username}: {str(e)}'
-                    )
-                )
-
-        # Check for subscriptions that have expired today
-        expired_subscriptions = UserSubscription.objects.filter(
-            is_active=True,
-            end_date=today
+        # Subscriptions ending today, and any a missed run left active after their end date.
+        # A backlog from long ago is deactivated without mailing notices that are no longer news.
+        self.notify_after = today - timedelta(days=options['notify_days'])
+        self.sweep(
+            'expired notifications',
+            'expired',
+            UserSubscription.objects.filter(
+                is_active=True,
+                end_date__lte=today
+            ),
+            subscription_expired_message,
+            deactivate=True
         )
 
-        for subscription in expired_subscriptions:
+    def sweep(self, name, kind, subscriptions, build_message, deactivate):
+        """
+        Walk the subscriptions in primary key chunks. Each chunk commits its
+        reminder ledger rows, its emails and its deactivation together, so the
+        committed state is the checkpoint: a run that crashes resumes with the
+        first unfinished chunk and nothing already recorded is sent again.
+        """
+        started = time.perf_counter()
+        sent = processed = failed = 0
+        last_pk = 0
+        subscriptions = subscriptions.select_related('user', 'plan', 'time_slot').order_by('pk')
+        while True:
+            chunk = list(subscriptions.filter(pk__gt=last_pk)[:self.chunk_size])
+            if not chunk:
+                break
+            last_pk = chunk[-1].pk
             try:
-                # Send expired notification
-                send_subscription_expired_email(subscription.user, subscription)
-                # Update subscription status
-                subscription.is_active = False
-                subscription.save()
-                self.stdout.write(
-                    self.style.SUCCESS(
-                        f'Successfully sent expired notification to {subscription.user.username}'
-                    )
-                )
+                sent += self.process(chunk, kind, build_message, deactivate)
+                processed += len(chunk)
             except Exception as e:
-                self.stdout.write(
-                    self.style.ERROR(
-                        f'Failed to send expired notification to {subscription.user.username}: {str(e)}'
-                    )
-                ) 
\ No newline at end of file
+                # The chunk rolled back, the next run picks it up again
+                failed += len(chunk)
+                self.stdout.write(self.style.ERROR(f'Failed to send {len(chunk)} {name}: {e}'))
+
+        self.rows += processed
+        elapsed = time.perf_counter() - started
+        rate = processed / elapsed if elapsed else 0
+        style = self.style.ERROR if failed else self.style.SUCCESS
+        self.stdout.write(style(
+            f'Sent {sent} {name} for {processed} subscriptions in {elapsed:.2f}s '
+            f'({rate:.0f} subscriptions/sec), {failed} failed'
+        ))
+
+    def process(self, chunk, kind, build_message, deactivate):
+        """Record, send and deactivate one chunk in a single transaction. Returns the number of emails sent."""
+        with transaction.atomic():
+            # Read inside the transaction so a concurrent run cannot send the same reminders
+            reminded = set(SubscriptionReminder.objects.filter(
+                subscription__in=chunk,
+                kind=kind
+            ).values_list('subscription_id', flat=True))
+            pending = [subscription for subscription in chunk if subscription.pk not in reminded]
+            if deactivate:
+                pending = [subscription for subscription in pending if subscription.end_date >= self.notify_after]
+            SubscriptionReminder.objects.bulk_create(
+                [SubscriptionReminder(subscription=subscription, kind=kind) for subscription in pending],
+                ignore_conflicts=True
+            )
+            # With the outbox backend this only queues the emails, in this transaction
+            self.connection.send_messages([build_message(subscription.user, subscription) for subscription in pending])
+            if deactivate:
+                UserSubscription.objects.filter(pk__in=[subscription.pk for subscription in chunk]).update(is_active=False)
+        if deactivate:
+            # update() skips the post_save handler that clears the cached subscriptions
+            invalidate_active_subscriptions({subscription.user_id for subscription in chunk})
+        return len(pending)
@@ -0,0 +1,82 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q, Exists, OuterRef
+from appointments.models import TimeSlot, Appointment, UserSubscription
+from appointments.booking import SESSION_TIMES, get_session_slot
+
+
+def session_slot_filter(session, prefix=''):
+    """Q matching time slots of a session, including legacy rows without a session"""
+    start_time, end_time = SESSION_TIMES[session]
+    return Q(**{f'{prefix}session': session}) | Q(**{
+        f'{prefix}session__isnull': True,
+        f'{prefix}start_time': start_time,
+        f'{prefix}end_time': end_time,
+    })
+
+
+class Command(BaseCommand):
+    help = (
+        'Repoints appointments and subscriptions at the canonical time slot of each session '
+        'and deletes the duplicate slots. Work is committed per chunk, so an interrupted run '
+        'can simply be started again.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Rows updated or deleted per transaction')
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many rows would change')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+
+        for session in SESSION_TIMES:
+            canonical = get_session_slot(session)
+            duplicates = TimeSlot.objects.filter(session_slot_filter(session)).exclude(pk=canonical.pk)
+
+            if options['dry_run']:
+                appointments = Appointment.objects.filter(time_slot__in=duplicates).count()
+                subscriptions = UserSubscription.objects.filter(time_slot__in=duplicates).count()
+                self.stdout.write(
+                    f'{session}: {duplicates.count()} duplicate slots, '
+                    f'{appointments} appointments and {subscriptions} subscriptions to repoint'
+                )
+                continue
+
+            for model in (Appointment, UserSubscription):
+                self.repoint(model, session, canonical, chunk_size)
+            self.delete_orphans(duplicates, session, chunk_size)
+
+    def repoint(self, model, session, canonical, chunk_size):
+        queryset = model.objects.filter(session_slot_filter(session, prefix='time_slot__')).exclude(time_slot=canonical)
+        total = 0
+        started = time.perf_counter()
+        while True:
+            with transaction.atomic():
+                pks = list(queryset.order_by('pk').values_list('pk', flat=True)[:chunk_size])
+                if not pks:
+                    break
+                # update() skips the signal handlers, the session of each row is unchanged
+                total += model.objects.filter(pk__in=pks).update(time_slot=canonical)
+        self.report(f'Repointed {total} {model._meta.verbose_name_plural} to the {session} slot', total, started)
+
+    def delete_orphans(self, duplicates, session, chunk_size):
+        orphans = duplicates.filter(
+            ~Exists(Appointment.objects.filter(time_slot=OuterRef('pk'))),
+            ~Exists(UserSubscription.objects.filter(time_slot=OuterRef('pk')))
+        )
+        total = 0
+        started = time.perf_counter()
+        while True:
+            with transaction.atomic():
+                pks = list(orphans.order_by('pk').values_list('pk', flat=True)[:chunk_size])
+                if not pks:
+                    break
+                deleted, _ = TimeSlot.objects.filter(pk__in=pks).delete()
+                total += deleted
+        self.report(f'Deleted {total} duplicate {session} slots', total, started)
+
+    def report(self, message, rows, started):
+        elapsed = time.perf_counter() - started
+        rate = rows / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(f'{message} in {elapsed:.2f}s ({rate:.0f} rows/sec)'))
@@ -0,0 +1,83 @@
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from appointments.models import Leaderboard, PointsRollup
+from appointments.leaderboard import ledger_totals, ledger_rollups, lock_counters, rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        'Checks the leaderboard counters and the weekly and monthly rollups against '
+        'the points ledger, streaming through members in chunks'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Members checked per query')
+        parser.add_argument('--fix', action='store_true', help='Reset drifted counters to the ledger totals')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        user_ids = User.objects.order_by('pk').values_list('pk', flat=True)
+        checked = 0
+        drifted_totals = 0
+        drifted_rollups = 0
+        last_pk = 0
+        started = time.perf_counter()
+        while True:
+            chunk = list(user_ids.filter(pk__gt=last_pk)[:chunk_size])
+            if not chunk:
+                break
+            last_pk = chunk[-1]
+            checked += len(chunk)
+            # The ledger is read in the transaction that fixes the counters, or an
+            # award committed in between would be overwritten
+            with transaction.atomic():
+                if options['fix']:
+                    lock_counters(chunk)
+                drifted_totals += self.check_totals(chunk, options['fix'])
+                drifted_rollups += self.check_rollups(chunk, options['fix'])
+
+        # Drifted members, for the scheduler
+        self.rows = drifted_totals + drifted_rollups
+        elapsed = time.perf_counter() - started
+        rate = checked / elapsed if elapsed else 0
+        summary = (f'Checked {checked} members in {elapsed:.2f}s ({rate:.0f} members/sec): '
+                   f'{drifted_totals} leaderboard counters and {drifted_rollups} members\' rollups drifted')
+        if (drifted_totals or drifted_rollups) and not options['fix']:
+            raise CommandError(summary)
+        self.stdout.write(self.style.SUCCESS(summary + (', fixed' if options['fix'] else '')))
+
+    def check_totals(self, chunk, fix):
+        expected = ledger_totals(chunk)
+        counters = dict(Leaderboard.objects.filter(user_id__in=chunk).values_list('user_id', 'points'))
+        drifted = [
+            user_id for user_id in chunk
+            if counters.get(user_id, 0) != expected.get(user_id, 0)
+        ]
+        for user_id in drifted:
+            self.stdout.write(self.style.WARNING(
+                f'User {user_id}: leaderboard has {counters.get(user_id, 0)} points, ledger has {expected.get(user_id, 0)}'
+            ))
+        if fix:
+            for user_id in drifted:
+                Leaderboard.objects.update_or_create(user_id=user_id, defaults={'points': expected.get(user_id, 0)})
+        return len(drifted)
+
+    def check_rollups(self, chunk, fix):
+        expected = ledger_rollups(chunk)
+        counters = {
+            (user_id, period, start): points
+            for user_id, period, start, points in PointsRollup.objects.filter(
+                user_id__in=chunk
+            ).values_list('user_id', 'period', 'period_start', 'points')
+        }
+        drifted = {
+            key[0] for key in expected.keys() | counters.keys()
+            if counters.get(key, 0) != expected.get(key, 0)
+        }
+        for user_id in sorted(drifted):
+            self.stdout.write(self.style.WARNING(f'User {user_id}: week or month rollups differ from the ledger'))
+        if fix and drifted:
+            rebuild_rollups(list(drifted))
+        return len(drifted)
@@ -0,0 +1,78 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from appointments.outbox import (
+    Dispatcher, claim_due, deliver_batch, rate_limit, DEFAULT_BULK_RESERVE, DEFAULT_MAX_ATTEMPTS, DEFAULT_WORKERS
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Delivers the email outbox over a small pool of persistent SMTP connections, within '
+        'the provider\'s per-minute and per-day quotas. Failed emails are retried with '
+        'exponential backoff and dead-lettered after too many attempts. Transactional mail '
+        'goes first, and bulk mail leaves part of the daily quota to it.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Deliver what is due and exit')
+        parser.add_argument('--batch-size', type=int, default=100, help='Most emails claimed at a time')
+        parser.add_argument('--workers', type=int,
+                            default=getattr(settings, 'OUTBOX_WORKERS', DEFAULT_WORKERS),
+                            help='Parallel SMTP connections')
+        parser.add_argument('--poll-interval', type=float, default=5, help='Seconds to sleep when the queue is empty')
+        parser.add_argument('--idle-timeout', type=float, default=60,
+                            help='Close the SMTP connections after this many seconds without mail')
+        parser.add_argument('--max-attempts', type=int,
+                            default=getattr(settings, 'OUTBOX_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS),
+                            help='Attempts before an email is dead-lettered')
+        parser.add_argument('--bulk-reserve', type=int,
+                            default=getattr(settings, 'OUTBOX_BULK_RESERVE', DEFAULT_BULK_RESERVE),
+                            help='Emails of the daily quota that bulk mail leaves for transactional mail')
+
+    def handle(self, *args, **options):
+        bucket = rate_limit()
+        dispatcher = Dispatcher(options['workers'], bucket)
+        counts = {'sent': 0, 'failed': 0, 'dead': 0, 'throttled': 0}
+        started = time.perf_counter()
+        last_mail = time.monotonic()
+        try:
+            while True:
+                close_old_connections()
+                # Only claim what the quota lets us send now, so claimed mail never waits out its lease
+                allowed, wait = bucket.available()
+                bulk_allowed, _ = bucket.available(reserve=options['bulk_reserve'])
+                emails = claim_due(
+                    min(options['batch_size'], allowed),
+                    bulk_limit=min(options['batch_size'], bulk_allowed)
+                ) if allowed else []
+                if not emails:
+                    if options['once']:
+                        break
+                    if time.monotonic() - last_mail > options['idle_timeout']:
+                        dispatcher.close_connections()
+                    # Out of quota, sleep until the next token instead of a full poll
+                    time.sleep(min(wait, options['poll_interval']) if not allowed else options['poll_interval'])
+                    continue
+
+                last_mail = time.monotonic()
+                outcomes = deliver_batch(dispatcher, emails, options['max_attempts'])
+                for email, outcome in zip(emails, outcomes):
+                    counts[outcome] += 1
+                    if outcome != 'sent':
+                        self.stdout.write(self.style.WARNING(
+                            f'Email {email.pk} {outcome} (attempt {email.attempts}): {email.last_error}'
+                        ))
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f'{counts["sent"]} sent, {counts["failed"] + counts["dead"]} failed, '
+                    f'{counts["throttled"]} throttled ({counts["sent"] / elapsed:.1f} emails/sec)'
+                )
+        except KeyboardInterrupt:
+            pass
+        finally:
+            dispatcher.shutdown()
+        self.stdout.write(self.style.SUCCESS(
+            f'Mail worker stopped: {counts["sent"]} sent, {counts["failed"] + counts["dead"]} failed'
+        ))
@@ -0,0 +1,59 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+from appointments import jobs  # noqa: F401, registers the jobs
+from appointments.models import ScheduledJob
+from appointments.scheduler import JOBS, sync_jobs, run_due_jobs
+
+
+class Command(BaseCommand):
+    help = (
+        'Runs the periodic maintenance jobs. Any number of hosts may run it, '
+        'each job run is locked in the database so it happens on one host only.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Run the jobs that are due and exit')
+        parser.add_argument('--list', action='store_true', help='Show the jobs and their last run, then exit')
+        parser.add_argument('--poll-interval', type=float, default=30, help='Most seconds to sleep between checks')
+
+    def handle(self, *args, **options):
+        sync_jobs()
+        if options['list']:
+            self.list_jobs()
+            return
+
+        try:
+            while True:
+                close_old_connections()
+                for state in run_due_jobs():
+                    self.report(state)
+                if options['once']:
+                    break
+                upcoming = ScheduledJob.objects.filter(name__in=JOBS).order_by('next_run_at').first()
+                wait = options['poll_interval']
+                if upcoming:
+                    wait = min(wait, max((upcoming.next_run_at - timezone.now()).total_seconds(), 1))
+                time.sleep(wait)
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS('Scheduler stopped'))
+
+    def report(self, state):
+        summary = f'{state.name}: {state.last_duration:.2f}s, {state.last_rows if state.last_rows is not None else "-"} rows'
+        if state.last_status == 'failed':
+            self.stdout.write(self.style.ERROR(f'{summary}, failed: {state.last_error}'))
+        else:
+            self.stdout.write(self.style.SUCCESS(summary))
+
+    def list_jobs(self):
+        states = {state.name: state for state in ScheduledJob.objects.filter(name__in=JOBS)}
+        for name, (schedule, lease, func) in JOBS.items():
+            state = states[name]
+            last = (
+                f'last {state.last_status} at {timezone.localtime(state.last_started_at):%Y-%m-%d %H:%M} '
+                f'in {state.last_duration:.2f}s, {state.last_rows} rows'
+                if state.last_started_at else 'never run'
+            )
+            self.stdout.write(f'{name:<22} {str(schedule):<16} next {timezone.localtime(state.next_run_at):%Y-%m-%d %H:%M}, {last}')
@@ -0,0 +1,359 @@
+import random
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+from appointments.models import (
+    SubscriptionPlan, UserSubscription, SubscriptionReminder, Payment, Appointment, WorkoutSession,
+    Exercise, ExerciseLog, Badge, Leaderboard, PointsRollup, PointsEntry
+)
+from appointments.booking import SESSION_TIMES, get_session_slot, build_availability
+from appointments.leaderboard import rebuild_rollups
+from notifications.inbox import invalidate_all_navbars
+from notifications.models import Notification, UserNotification, NotificationReadState
+
+USERNAME_PREFIX = 'seed_user_'
+NOTIFICATION_PREFIX = '[seed] '
+
+PLANS = [
+    # name, months, price, share of purchases
+    ('Monthly Package', 1, Decimal('50.00'), 50),
+    ('Bi-Monthly Package', 2, Decimal('95.00'), 15),
+    ('Quarterly Package', 3, Decimal('135.00'), 25),
+    ('Annual Package', 12, Decimal('480.00'), 10),
+]
+SESSION_WEIGHTS = {'morning': 35, 'afternoon': 15, 'evening': 50}
+NOTIFICATION_TYPES = ['holiday', 'event', 'update', 'general']
+
+
+def raw_delete(queryset):
+    """
+    Delete a queryset's rows with one DELETE, without loading them or sending
+    signals. Returns the number of rows deleted.
+    """
+    meta = queryset.model._meta
+    quote = connection.ops.quote_name
+    sql, params = queryset.values('pk').query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {quote(meta.db_table)} WHERE {quote(meta.pk.column)} IN ({sql})',
+            params
+        )
+        return cursor.rowcount
+
+
+class Command(BaseCommand):
+    help = 'Bulk-generates a large, realistic dataset of members and their history for benchmarking'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help='Number of members to create')
+        parser.add_argument('--months', type=int, default=12, help='Months of history to generate')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed, the same seed gives the same data')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per INSERT')
+        parser.add_argument('--chunk-users', type=int, default=500, help='Members generated per transaction')
+        parser.add_argument('--clear', action='store_true', help='Delete previously seeded data first')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.today = timezone.now().date()
+        self.start = self.today - timedelta(days=30 * options['months'])
+        self.totals = {}
+
+        if options['clear']:
+            self.clear()
+
+        self.plans = [
+            (SubscriptionPlan.objects.get_or_create(
+                name=name,
+                defaults={'duration_months': months, 'price': price}
+            )[0], weight)
+            for name, months, price, weight in PLANS
+        ]
+        self.time_slots = {session: get_session_slot(session) for session in SESSION_TIMES}
+        self.exercises = list(Exercise.objects.all())
+        self.password = make_password('benchmark123')  # Hashing once keeps user creation cheap
+        self.first_index = User.objects.filter(username__startswith=USERNAME_PREFIX).count()
+
+        started = time.perf_counter()
+        notifications = self.create_notifications(options['months'])
+        for offset in range(0, options['users'], options['chunk_users']):
+            count = min(options['chunk_users'], options['users'] - offset)
+            with transaction.atomic():
+                users = self.create_users(self.first_index + offset, count)
+                self.create_history(users)
+                self.create_user_notifications(users, notifications)
+            elapsed = time.perf_counter() - started
+            rows = sum(self.totals.values())
+            self.stdout.write(f'{offset + count}/{options["users"]} members, {rows} rows ({rows / elapsed:.0f} rows/sec)')
+
+        # Seeded appointments bypass the booking engine, resync the upcoming capacity rows
+        build_availability(self.today, 8)
+
+        for name, total in self.totals.items():
+            self.stdout.write(f'  {name}: {total}')
+        self.stdout.write(self.style.SUCCESS(f'Seeded benchmark data in {time.perf_counter() - started:.1f}s'))
+
+    def insert(self, model, objects, name=None):
+        created = model.objects.bulk_create(objects, batch_size=self.batch_size)
+        name = name or model._meta.verbose_name_plural
+        self.totals[name] = self.totals.get(name, 0) + len(created)
+        return created
+
+    def insert_dated(self, model, objects, *date_fields, name=None):
+        """
+        Insert rows whose auto_now/auto_now_add fields hold historical dates.
+        bulk_create stamps those fields with the current time, so the dates are
+        written back with bulk_update afterwards.
+        """
+        dates = [[getattr(obj, field) for field in date_fields] for obj in objects]
+        created = self.insert(model, objects, name)
+        for obj, values in zip(created, dates):
+            for field, value in zip(date_fields, values):
+                setattr(obj, field, value)
+        model.objects.bulk_update(created, date_fields, batch_size=self.batch_size)
+        return created
+
+    def random_datetime(self, day):
+        moment = datetime.combine(day, datetime.min.time(), tzinfo=dt_timezone.utc)
+        return moment + timedelta(seconds=self.rng.randrange(6 * 3600, 21 * 3600))
+
+    def create_notifications(self, months):
+        """Announcements broadcast to every member, as the admin sends them"""
+        notifications = []
+        for index in range(months * 2):  # About two announcements a month
+            day = self.start + timedelta(days=self.rng.randrange((self.today - self.start).days + 1))
+            notification_type = self.rng.choice(NOTIFICATION_TYPES)
+            sent = self.random_datetime(day)
+            notifications.append(Notification(
+                title=f'{NOTIFICATION_PREFIX}{notification_type.title()} notice {index + 1}',
+                message='Generated by seed_benchmark.',
+                notification_type=notification_type,
+                created_at=sent,
+                broadcast_at=sent
+            ))
+        notifications = self.insert(Notification, notifications)
+        # bulk_create skips the handler that drops cached navbars
+        invalidate_all_navbars()
+        return sorted(notifications, key=lambda notification: notification.broadcast_at)
+
+    def create_users(self, first_index, count):
+        users = []
+        for index in range(first_index, first_index + count):
+            joined = self.start + timedelta(days=self.rng.randrange((self.today - self.start).days + 1))
+            users.append(User(
+                username=f'{USERNAME_PREFIX}{index}',
+                email=f'{USERNAME_PREFIX}{index}@example.com',
+                first_name=f'Member{index}',
+                password=self.password,
+                date_joined=self.random_datetime(joined)
+            ))
+        # bulk_create skips the welcome email signal
+        return self.insert(User, users)
+
+    def create_history(self, users):
+        plans, weights = zip(*self.plans)
+        sessions, session_weights = zip(*SESSION_WEIGHTS.items())
+
+        payments = []
+        subscriptions = []
+        for user in users:
+            day = user.date_joined.date()
+            session = self.rng.choices(sessions, session_weights)[0]
+            # Members keep renewing until they churn
+            while day <= self.today:
+                plan = self.rng.choices(plans, weights)[0]
+                status = self.rng.choices(['verified', 'pending', 'failed'], [90, 5, 5])[0]
+                created_at = self.random_datetime(day)
+                payments.append(Payment(
+                    user=user,
+                    subscription_plan=plan,
+                    amount=plan.price,
+                    payment_status=status,
+                    transaction_code=f'TXN{self.rng.randrange(10 ** 9):09d}',
+                    created_at=created_at,
+                    updated_at=created_at
+                ))
+                end_date = day + timedelta(days=30 * plan.duration_months)
+                subscriptions.append(UserSubscription(
+                    user=user,
+                    plan=plan,
+                    start_date=day,
+                    end_date=end_date,
+                    time_slot=self.time_slots[session],
+                    is_active=status == 'verified' and end_date >= self.today
+                ))
+                if status == 'failed' or self.rng.random() < 0.3:
+                    break
+                day = end_date + timedelta(days=1)
+
+        payments = self.insert_dated(Payment, payments, 'created_at', 'updated_at')
+        for payment, subscription in zip(payments, subscriptions):
+            subscription.payment = payment
+        subscriptions = [
+            subscription for subscription in subscriptions
+            if subscription.payment.payment_status == 'verified'
+        ]
+        subscriptions = self.insert(UserSubscription, subscriptions)
+        self.create_appointments(subscriptions)
+        self.create_badges(users)
+
+    def create_appointments(self, subscriptions):
+        sessions = list(SESSION_TIMES)
+        horizon = self.today + timedelta(days=14)
+        appointments = []
+        for subscription in subscriptions:
+            visits_per_week = self.rng.choices([1, 2, 3, 4, 5, 6], [10, 20, 30, 20, 15, 5])[0]
+            preferred = subscription.time_slot
+            day = subscription.start_date
+            end_date = min(subscription.end_date, horizon)
+            while day <= end_date:
+                if day.weekday() != 5 and self.rng.random() < visits_per_week / 6:
+                    time_slot = preferred if self.rng.random() < 0.85 else self.time_slots[self.rng.choice(sessions)]
+                    if day > self.today:
+                        status = 'pending'
+                    else:
+                        status = self.rng.choices(['confirmed', 'cancelled'], [92, 8])[0]
+                    appointments.append(Appointment(
+                        user_id=subscription.user_id,
+                        user_subscription=subscription,
+                        date=day,
+                        time_slot=time_slot,
+                        status=status,
+                        created_at=self.random_datetime(day - timedelta(days=self.rng.randrange(0, 7)))
+                    ))
+                day += timedelta(days=1)
+
+        appointments = self.insert_dated(Appointment, appointments, 'created_at')
+        self.create_workouts([
+            appointment for appointment in appointments
+            if appointment.status == 'confirmed' and appointment.date <= self.today
+        ])
+
+    def create_workouts(self, appointments):
+        sessions = []
+        for appointment in appointments:
+            if self.rng.random() < 0.6:  # Not everyone logs their workout
+                sessions.append(WorkoutSession(
+                    user_id=appointment.user_id,
+                    appointment=appointment,
+                    date=appointment.date,
+                    notes=''
+                ))
+        sessions = self.insert_dated(WorkoutSession, sessions, 'date')
+
+        logs = []
+        for session in sessions:
+            for exercise in self.rng.sample(self.exercises, min(len(self.exercises), self.rng.randint(1, 5))):
+                if exercise.category == 'cardio':
+                    logs.append(ExerciseLog(
+                        workout_session=session,
+                        exercise=exercise,
+                        sets=1,
+                        reps=1,
+                        duration_minutes=self.rng.randint(10, 60)
+                    ))
+                else:
+                    logs.append(ExerciseLog(
+                        workout_session=session,
+                        exercise=exercise,
+                        sets=self.rng.randint(2, 5),
+                        reps=self.rng.randint(6, 15),
+                        weight=Decimal(self.rng.randrange(10, 150, 5))
+                    ))
+        self.insert(ExerciseLog, logs)
+
+    def create_badges(self, users):
+        badges = []
+        for user in users:
+            # Most members never earn a badge, a few earn several
+            for _ in range(self.rng.choices([0, 1, 2, 3], [60, 25, 10, 5])[0]):
+                badge_type = self.rng.choices(['Course Completion', 'Consistency Award', 'Top Performer'], [60, 30, 10])[0]
+                earned = user.date_joined.date() + timedelta(days=self.rng.randrange(max((self.today - user.date_joined.date()).days, 1)))
+                badges.append(Badge(
+                    user=user,
+                    badge_type=badge_type,
+                    points=Badge.POINTS_MAPPING[badge_type],  # bulk_create skips Badge.save()
+                    awarded_date=self.random_datetime(earned)
+                ))
+        badges = self.insert_dated(Badge, badges, 'awarded_date')
+
+        # bulk_create skips the points signal handlers, write the ledger and
+        # the counters derived from it directly, seeded members start without rows
+        entries = [
+            PointsEntry(
+                user_id=badge.user_id,
+                points=badge.points,
+                reason='badge',
+                badge=badge,
+                awarded_at=badge.awarded_date
+            )
+            for badge in badges
+        ]
+        # created_at is when the line was written, awarded_at carries the history
+        self.insert(PointsEntry, entries, name='points entries')
+        totals = {}
+        for badge in badges:
+            totals[badge.user_id] = totals.get(badge.user_id, 0) + badge.points
+        self.insert(Leaderboard, [Leaderboard(user_id=user_id, points=points) for user_id, points in totals.items()])
+        rollups = rebuild_rollups([user.pk for user in users])
+        self.totals['points rollups'] = self.totals.get('points rollups', 0) + rollups
+
+    def create_user_notifications(self, users, notifications):
+        """
+        Members' read state of the broadcasts: a watermark up to which they have
+        read everything, and a read row for the odd broadcast read past it
+        """
+        read_states = []
+        read_rows = []
+        for user in users:
+            # Members receive the announcements sent after they joined
+            received = [notification for notification in notifications if notification.broadcast_at > user.date_joined]
+            if not received:
+                continue
+            # Most members keep up, the rest stopped reading at some point
+            caught_up = len(received) if self.rng.random() < 0.6 else self.rng.randrange(len(received))
+            if caught_up:
+                read_states.append(NotificationReadState(user=user, read_until=received[caught_up - 1].broadcast_at))
+            # The first broadcast past the watermark is unread, or the watermark would have moved past it
+            for notification in received[caught_up + 1:]:
+                if self.rng.random() < 0.2:
+                    read_rows.append(UserNotification(
+                        user=user,
+                        notification=notification,
+                        is_read=True,
+                        created_at=notification.broadcast_at
+                    ))
+        self.insert(NotificationReadState, read_states)
+        self.insert(UserNotification, read_rows)
+
+    def clear(self):
+        started = time.perf_counter()
+        seeded = {'user__username__startswith': USERNAME_PREFIX}
+        deleted = 0
+        with transaction.atomic():
+            # Raw deletes skip loading every row for the appointment and badge
+            # signal handlers, the capacity counters are rebuilt afterwards instead
+            for queryset in [
+                ExerciseLog.objects.filter(workout_session__user__username__startswith=USERNAME_PREFIX),
+                WorkoutSession.objects.filter(**seeded),
+                Appointment.objects.filter(**seeded),
+                UserNotification.objects.filter(**seeded),
+                NotificationReadState.objects.filter(**seeded),
+                PointsEntry.objects.filter(**seeded),
+                PointsRollup.objects.filter(**seeded),
+                Leaderboard.objects.filter(**seeded),
+                Badge.objects.filter(**seeded),
+                SubscriptionReminder.objects.filter(subscription__user__username__startswith=USERNAME_PREFIX),
+                UserSubscription.objects.filter(**seeded),
+                Payment.objects.filter(**seeded),
+            ]:
+                deleted += raw_delete(queryset)
+            deleted += User.objects.filter(username__startswith=USERNAME_PREFIX).delete()[0]
+            deleted += Notification.objects.filter(title__startswith=NOTIFICATION_PREFIX).delete()[0]
+        build_availability(self.today, 8)
+        self.stdout.write(f'Deleted {deleted} previously seeded rows in {time.perf_counter() - started:.1f}s')
@@ -0,0 +1,43 @@
+import time
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.core.management.base import BaseCommand, CommandError
+from appointments.models import NewsletterSignup, OutboxEmail
+
+
+class Command(BaseCommand):
+    help = (
+        'Sends a newsletter to every signup, one email per subscriber. The emails are '
+        'queued in batches as bulk mail and run_mail_worker delivers them within the sending '
+        'quota, after any transactional mail.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('subject')
+        parser.add_argument('body_file', help='Plain text file with the newsletter body')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Emails queued per batch')
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['body_file'], encoding='utf-8') as f:
+                body = f.read()
+        except OSError as e:
+            raise CommandError(f'Cannot read the newsletter body: {e}')
+
+        # Queued behind transactional mail, so a newsletter never delays a booking confirmation
+        connection = get_connection(priority=OutboxEmail.BULK)
+        started = time.perf_counter()
+        queued = 0
+        recipients = NewsletterSignup.objects.order_by('pk').values_list('email', flat=True)
+        batch = []
+        for email in recipients.iterator(chunk_size=options['chunk_size']):
+            batch.append(EmailMessage(options['subject'], body, settings.DEFAULT_FROM_EMAIL, [email]))
+            if len(batch) == options['chunk_size']:
+                queued += connection.send_messages(batch)
+                batch = []
+        if batch:
+            queued += connection.send_messages(batch)
+
+        elapsed = time.perf_counter() - started
+        rate = queued / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(f'Queued {queued} newsletters in {elapsed:.2f}s ({rate:.0f} emails/sec)'))
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.5 on 2026-10-17 21:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0019_payment_transaction_code'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SessionAvailability',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('session', models.CharField(choices=[('morning', 'Morning Session – 6:00 AM to 10:00 AM'), ('afternoon', 'Afternoon Session – 12:00 PM to 4:00 PM'), ('evening', 'Evening Session – 5:00 PM to 9:00 PM')], max_length=20)),
+                ('capacity', models.PositiveIntegerField()),
+                ('booked', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'Session availability',
+                'unique_together': {('date', 'session')},
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.5 on 2026-10-17 21:55
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def fill_leaderboard(apps, schema_editor):
+    """Start the materialized leaderboard from the badges awarded so far"""
+    Badge = apps.get_model('appointments', 'Badge')
+    Leaderboard = apps.get_model('appointments', 'Leaderboard')
+    totals = Badge.objects.values('user_id').annotate(total=Sum('points')).filter(total__gt=0)
+    Leaderboard.objects.all().delete()
+    Leaderboard.objects.bulk_create(
+        [Leaderboard(user_id=row['user_id'], points=row['total']) for row in totals],
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0022_hot_query_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='leaderboard',
+            index=models.Index(fields=['-points', 'user'], name='leaderboard_points_idx'),
+        ),
+        migrations.RunPython(fill_leaderboard, migrations.RunPython.noop),
+    ]
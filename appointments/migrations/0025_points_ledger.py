@@ -0,0 +1,57 @@
+# Generated by Django 5.1.5 on 2026-10-17 21:58
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def open_ledger(apps, schema_editor):
+    """One opening entry per badge, matching the counters built from badges so far"""
+    Badge = apps.get_model('appointments', 'Badge')
+    PointsEntry = apps.get_model('appointments', 'PointsEntry')
+    now = timezone.now()
+    entries = []
+    for badge_id, user_id, points, awarded_date in Badge.objects.values_list(
+        'id', 'user_id', 'points', 'awarded_date'
+    ).iterator(chunk_size=2000):
+        entries.append(PointsEntry(
+            user_id=user_id,
+            points=points,
+            reason='badge',
+            badge_id=badge_id,
+            awarded_at=awarded_date,
+            created_at=now
+        ))
+        if len(entries) == 2000:
+            PointsEntry.objects.bulk_create(entries)
+            entries = []
+    PointsEntry.objects.bulk_create(entries)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0024_points_rollup'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PointsEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('points', models.IntegerField()),
+                ('reason', models.CharField(choices=[('badge', 'Badge awarded'), ('badge_revoked', 'Badge revoked'), ('adjustment', 'Adjustment')], max_length=20)),
+                ('awarded_at', models.DateTimeField(help_text='When the points count for, decides their week and month')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('badge', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='appointments.badge')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'Points ledger',
+                'indexes': [models.Index(fields=['user', 'awarded_at'], name='points_user_awarded_idx')],
+            },
+        ),
+        migrations.RunPython(open_ledger, migrations.RunPython.noop),
+    ]
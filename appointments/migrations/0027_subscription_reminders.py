@@ -0,0 +1,37 @@
+# Generated by Django 5.1.5 on 2026-10-17 22:08
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0026_outbox_email'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubscriptionReminder',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('expiring', 'Expiring soon'), ('expired', 'Expired')], max_length=10)),
+                ('sent_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='usersubscription',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['end_date', 'id'], name='subscription_sweep_idx'),
+        ),
+        migrations.AddField(
+            model_name='subscriptionreminder',
+            name='subscription',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reminders', to='appointments.usersubscription'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='subscriptionreminder',
+            unique_together={('subscription', 'kind')},
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.5 on 2026-10-17 22:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0027_subscription_reminders'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScheduledJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('next_run_at', models.DateTimeField()),
+                ('locked_until', models.DateTimeField(blank=True, help_text='Set while a host is running the job', null=True)),
+                ('locked_by', models.CharField(blank=True, max_length=255)),
+                ('last_started_at', models.DateTimeField(blank=True, null=True)),
+                ('last_duration', models.FloatField(blank=True, help_text='Seconds', null=True)),
+                ('last_rows', models.IntegerField(blank=True, help_text='Rows the last run touched', null=True)),
+                ('last_status', models.CharField(blank=True, choices=[('succeeded', 'Succeeded'), ('failed', 'Failed')], max_length=10)),
+                ('last_error', models.TextField(blank=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.5 on 2026-10-17 22:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0029_otp_attempts'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='pointsentry',
+            name='badge',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, to='appointments.badge'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.5 on 2026-10-17 22:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0030_points_entry_badge_unconstrained'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='certificate',
+            name='badge_type',
+            field=models.CharField(default='Course Completion', max_length=50),
+        ),
+    ]
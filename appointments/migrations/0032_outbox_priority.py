@@ -0,0 +1,26 @@
+# Generated by Django 5.1.5 on 2026-10-17 22:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0031_certificate_badge_type'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='outboxemail',
+            name='outbox_due_idx',
+        ),
+        migrations.AddField(
+            model_name='outboxemail',
+            name='priority',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'Transactional'), (1, 'Bulk')], default=0, help_text='Transactional mail is sent before bulk mail such as newsletters'),
+        ),
+        migrations.AddIndex(
+            model_name='outboxemail',
+            index=models.Index(condition=models.Q(('status', 'queued')), fields=['priority', 'next_attempt_at', 'id'], name='outbox_due_idx'),
+        ),
+    ]
@@ -3,6 +3,7 @@ from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 from datetime import datetime, timedelta, time
 from django.conf import settings
+from django.utils import timezone
 from PIL import Image
 from io import BytesIO
 from django.core.files.base import ContentFile
@@ -61,6 +62,22 @@ class UserSubscription(models.Model):
     end_date = models.DateField()
     time_slot = models.ForeignKey(TimeSlot, on_delete=models.CASCADE)
     is_active = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            # Active subscription lookup on every page view
+            models.Index(
+                fields=['user', 'end_date'],
+                condition=models.Q(is_active=True),
+                name='subscription_active_idx',
+            ),
+            # Expiry sweep, active subscriptions by end date
+            models.Index(
+                fields=['end_date', 'id'],
+                condition=models.Q(is_active=True),
+                name='subscription_sweep_idx',
+            ),
+        ]
     
     def save(self, *args, **kwargs):
         if not self.end_date:
@@ -73,6 +90,23 @@ class UserSubscription(models.Model):
     def __str__(self):
         return f"{self.user.username} - {self.plan.name}"
 
+class SubscriptionReminder(models.Model):
+    """A reminder already sent for a subscription, so each kind is sent once"""
+    KIND_CHOICES = [
+        ('expiring', 'Expiring soon'),
+        ('expired', 'Expired'),
+    ]
+
+    subscription = models.ForeignKey(UserSubscription, on_delete=models.CASCADE, related_name='reminders')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    sent_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('subscription', 'kind')
+
+    def __str__(self):
+        return f"{self.get_kind_display()} reminder for {self.subscription}"
+
 class Payment(models.Model):
     PAYMENT_STATUS_CHOICES = [
         ('pending', 'Pending'),
@@ -91,6 +125,12 @@ class Payment(models.Model):
     verified_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='verified_payments')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Payment review queue in the admin
+            models.Index(fields=['payment_status', 'created_at'], name='payment_status_created_idx'),
+        ]
     
     def __str__(self):
         return f"Payment {self.id} - {self.user.username} - {self.payment_status}"
@@ -146,6 +186,49 @@ class Appointment(models.Model):
     def __str__(self):
         return f"{self.user.username} - {self.date} {self.time_slot}"
 
+class SessionAvailability(models.Model):
+    date = models.DateField()
+    session = models.CharField(max_length=20, choices=TimeSlot.SESSION_CHOICES)
+    capacity = models.PositiveIntegerField()
+    booked = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('date', 'session')  # One capacity row per session per day
+        verbose_name_plural = 'Session availability'
+
+    @property
+    def remaining(self):
+        return max(self.capacity - self.booked, 0)
+
+    def __str__(self):
+        return f"{self.date} {self.get_session_display()} ({self.booked}/{self.capacity})"
+
+class WaitlistEntry(models.Model):
+    STATUS_CHOICES = [
+        ('waiting', 'Waiting'),
+        ('promoted', 'Promoted'),
+        ('cancelled', 'Cancelled'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    user_subscription = models.ForeignKey(UserSubscription, on_delete=models.CASCADE, null=True, blank=True)
+    date = models.DateField()
+    session = models.CharField(max_length=20, choices=TimeSlot.SESSION_CHOICES)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='waiting')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('user', 'date', 'session')
+        ordering = ['created_at', 'id']  # First come, first served
+        indexes = [
+            # Finds the head of a session's queue without scanning it
+            models.Index(fields=['date', 'session', 'status', 'created_at', 'id'], name='waitlist_queue_idx'),
+        ]
+        verbose_name_plural = 'Waitlist entries'
+
+    def __str__(self):
+        return f"{self.user.username} waiting for {self.date} {self.get_session_display()}"
+
 class Exercise(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True)
@@ -169,12 +252,19 @@ class WorkoutSession(models.Model):
         return f"{self.user.username}'s workout on {self.date}"
 
 class ExerciseLog(models.Model):
-    workout_session = models.ForeignKey(WorkoutSession, on_delete=models.CASCADE)
+    # Indexed by exerciselog_session_idx, which leads with this column
+    workout_session = models.ForeignKey(WorkoutSession, on_delete=models.CASCADE, db_index=False)
     exercise = models.ForeignKey(Exercise, on_delete=models.CASCADE)
     sets = models.IntegerField()
     reps = models.IntegerField()
     weight = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
     duration_minutes = models.IntegerField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Logs of a workout, grouped by exercise
+            models.Index(fields=['workout_session', 'exercise'], name='exerciselog_session_idx'),
+        ]
     
     def __str__(self):
         if self.exercise.category == 'cardio':
@@ -215,6 +305,8 @@ class PersonalBest(models.Model):
 class Certificate(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     file = models.FileField(upload_to='certificates/')
+    # The badge issued with the certificate, which also picks its design
+    badge_type = models.CharField(max_length=50, default='Course Completion')
     issued_date = models.DateTimeField(auto_now_add=True)
     
 
@@ -251,13 +343,76 @@ class Badge(models.Model):
 
 # Leaderboard Model
 class Leaderboard(models.Model):
+    """Badge points per member, kept up to date by the Badge signal handlers"""
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     points = models.IntegerField(default=0)
 
+    class Meta:
+        indexes = [
+            # Serves both the ranked listing and "how many members are ahead of me"
+            models.Index(fields=['-points', 'user'], name='leaderboard_points_idx'),
+        ]
+
     def __str__(self):
         return f"{self.user.username} - {self.points} points"
     
 
+class PointsRollup(models.Model):
+    """Badge points per member per ISO week or calendar month"""
+    PERIOD_CHOICES = [
+        ('week', 'Week'),
+        ('month', 'Month'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    period = models.CharField(max_length=5, choices=PERIOD_CHOICES)
+    period_start = models.DateField(help_text="Monday of the ISO week or first day of the month")
+    points = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ['period', 'period_start', 'user']
+        indexes = [
+            models.Index(fields=['period', 'period_start', '-points', 'user'], name='rollup_period_points_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.points} points in the {self.period} of {self.period_start}"
+
+
+class PointsEntry(models.Model):
+    """
+    One line of the append-only points ledger. Leaderboard and PointsRollup
+    are counters derived from it, revoked points are recorded as a negative entry.
+    """
+    REASON_CHOICES = [
+        ('badge', 'Badge awarded'),
+        ('badge_revoked', 'Badge revoked'),
+        ('adjustment', 'Adjustment'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    points = models.IntegerField()
+    reason = models.CharField(max_length=20, choices=REASON_CHOICES)
+    # No constraint, so deleting a badge never rewrites its ledger lines, which keep its id
+    badge = models.ForeignKey(Badge, on_delete=models.DO_NOTHING, db_constraint=False, null=True, blank=True)
+    awarded_at = models.DateTimeField(help_text="When the points count for, decides their week and month")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name_plural = 'Points ledger'
+        indexes = [
+            models.Index(fields=['user', 'awarded_at'], name='points_user_awarded_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.pk:
+            raise ValueError("Points entries are append-only, record a new entry instead")
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.user.username} {self.points:+} points ({self.get_reason_display()})"
+
+
 class Contact(models.Model):
     name = models.CharField(max_length=30)
     email = models.EmailField()
@@ -313,4 +468,67 @@ class UserProfile(models.Model):
         super().save(*args, **kwargs)
 
     def __str__(self):
-        return f"{self.user.username}'s Profile"
\ No newline at end of file
+        return f"{self.user.username}'s Profile"
+
+class OutboxEmail(models.Model):
+    """An email waiting for the mail worker, stored as the MIME message to send"""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('sent', 'Sent'),
+        ('dead', 'Dead letter'),
+    ]
+    TRANSACTIONAL = 0
+    BULK = 1
+    PRIORITY_CHOICES = [
+        (TRANSACTIONAL, 'Transactional'),
+        (BULK, 'Bulk'),
+    ]
+
+    subject = models.CharField(max_length=255)
+    from_email = models.CharField(max_length=255)
+    recipients = models.JSONField(help_text="Every envelope recipient, including cc and bcc")
+    mime = models.BinaryField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    priority = models.PositiveSmallIntegerField(
+        choices=PRIORITY_CHOICES,
+        default=TRANSACTIONAL,
+        help_text="Transactional mail is sent before bulk mail such as newsletters"
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Queued mail that is due, transactional first then oldest first
+            models.Index(
+                fields=['priority', 'next_attempt_at', 'id'],
+                condition=models.Q(status='queued'),
+                name='outbox_due_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} to {', '.join(self.recipients)} ({self.status})"
+
+class ScheduledJob(models.Model):
+    """State of a run_scheduler job, shared by every host running the scheduler"""
+    STATUS_CHOICES = [
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    ]
+
+    name = models.CharField(max_length=100, unique=True)
+    next_run_at = models.DateTimeField()
+    locked_until = models.DateTimeField(null=True, blank=True, help_text="Set while a host is running the job")
+    locked_by = models.CharField(max_length=255, blank=True)
+    last_started_at = models.DateTimeField(null=True, blank=True)
+    last_duration = models.FloatField(null=True, blank=True, help_text="Seconds")
+    last_rows = models.IntegerField(null=True, blank=True, help_text="Rows the last run touched")
+    last_status = models.CharField(max_length=10, choices=STATUS_CHOICES, blank=True)
+    last_error = models.TextField(blank=True)
+
+    def __str__(self):
+        return self.name
@@ -10,11 +10,25 @@ class OTP(models.Model):
     otp_code = models.CharField(max_length=6)
     created_at = models.DateTimeField(auto_now_add=True)
     is_verified = models.BooleanField(default=False)
+    # Wrong guesses, the code is locked after too many
+    attempts = models.PositiveSmallIntegerField(default=0)
     purpose = models.CharField(max_length=20, choices=[
         ('registration', 'Registration'),
         ('password_reset', 'Password Reset')
     ])
 
+    class Meta:
+        indexes = [
+            # Latest unverified code for an email and purpose
+            models.Index(
+                fields=['email', 'purpose', 'created_at'],
+                condition=models.Q(is_verified=False),
+                name='otp_lookup_idx',
+            ),
+            # Purge of expired codes
+            models.Index(fields=['created_at'], name='otp_created_idx'),
+        ]
+
     def __str__(self):
         return f"OTP for {self.email} - {self.purpose}"
 
@@ -0,0 +1,100 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+from django.utils.module_loading import import_string
+from .otp_models import OTP
+
+DEFAULT_STORE = 'appointments.otp_store.DatabaseOTPStore'
+# Codes are valid for 10 minutes, and locked after this many wrong guesses
+OTP_TTL = 600
+MAX_ATTEMPTS = 5
+
+VERIFIED = 'verified'
+INVALID = 'invalid'
+EXPIRED = 'expired'
+
+
+class CacheOTPStore:
+    """
+    Codes live in the OTP_CACHE cache and expire with its TTL, nothing needs
+    purging. Wrong guesses are counted with the cache's incr, which Redis and
+    Memcached make atomic. The cache must be shared by every process, since
+    a code issued by one gunicorn worker is verified by another.
+    """
+
+    def _cache(self):
+        return caches[getattr(settings, 'OTP_CACHE', 'default')]
+
+    def _keys(self, email, purpose):
+        return f'otp:{purpose}:{email}', f'otp_attempts:{purpose}:{email}'
+
+    def issue(self, email, purpose):
+        """Create a code for the email and purpose, replacing any earlier one. Returns the code."""
+        code = OTP.generate_otp()
+        code_key, attempts_key = self._keys(email, purpose)
+        self._cache().set_many({code_key: code, attempts_key: 0}, OTP_TTL)
+        return code
+
+    def verify(self, email, purpose, code):
+        code_key, attempts_key = self._keys(email, purpose)
+        cache = self._cache()
+        try:
+            attempts = cache.incr(attempts_key)
+        except ValueError:
+            # No code issued, or it expired
+            return EXPIRED
+        if attempts > MAX_ATTEMPTS:
+            cache.delete_many([code_key, attempts_key])
+            return EXPIRED
+        stored = cache.get(code_key)
+        if stored is None:
+            return EXPIRED
+        if not constant_time_compare(stored, code or ''):
+            return INVALID
+        cache.delete_many([code_key, attempts_key])
+        return VERIFIED
+
+    def purge(self):
+        return 0
+
+
+class DatabaseOTPStore:
+    """
+    Codes are OTP rows. Verifying reads only the latest unverified code of
+    the email and purpose through otp_lookup_idx, and the purge_otps job
+    deletes rows once they are verified or expired.
+    """
+
+    def issue(self, email, purpose):
+        code = OTP.generate_otp()
+        OTP.objects.create(email=email, otp_code=code, purpose=purpose)
+        return code
+
+    def verify(self, email, purpose, code):
+        otp = OTP.objects.filter(
+            email=email,
+            purpose=purpose,
+            is_verified=False
+        ).order_by('-created_at').first()
+        if otp is None or otp.is_expired():
+            return EXPIRED
+        # Counted in the UPDATE so concurrent guesses cannot get past the limit
+        if not OTP.objects.filter(pk=otp.pk, attempts__lt=MAX_ATTEMPTS).update(attempts=F('attempts') + 1):
+            return EXPIRED
+        if not constant_time_compare(otp.otp_code, code or ''):
+            return INVALID
+        OTP.objects.filter(pk=otp.pk).update(is_verified=True)
+        return VERIFIED
+
+    def purge(self):
+        """Delete verified and expired codes. Returns the number deleted."""
+        cutoff = timezone.now() - timedelta(seconds=OTP_TTL)
+        deleted, _ = OTP.objects.filter(Q(created_at__lt=cutoff) | Q(is_verified=True)).delete()
+        return deleted
+
+
+def get_otp_store():
+    return import_string(getattr(settings, 'OTP_STORE', DEFAULT_STORE))()
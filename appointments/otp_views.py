@@ -3,18 +3,14 @@ from django.contrib.auth.models import User
 from django.contrib import messages
 from django.core.mail import send_mail
 from django.conf import settings
-from .otp_models import OTP
+from .otp_store import get_otp_store, VERIFIED, EXPIRED
+from .ratelimit import rate_limit
 from django.contrib.auth import login, authenticate
 from django.contrib.auth.forms import SetPasswordForm
 
 def send_otp_email(email, purpose):
     """Send OTP to user's email"""
-    otp = OTP.generate_otp()
-    OTP.objects.create(
-        email=email,
-        otp_code=otp,
-        purpose=purpose
-    )
+    otp = get_otp_store().issue(email, purpose)
     
     subject = f"Your OTP for {purpose.replace('_', ' ').title()}"
     message = f"Your OTP is: {otp}\nThis OTP is valid for 10 minutes."
@@ -22,6 +18,7 @@ def send_otp_email(email, purpose):
     
     send_mail(subject, message, from_email, [email], fail_silently=False)
 
+@rate_limit('otp', per_ip='10/h', per_account='3/10m')
 def request_otp(request):
     """Handle OTP request"""
     if request.method == 'POST':
@@ -52,21 +49,12 @@ def verify_otp(request):
         otp_code = request.POST.get('otp')
         purpose = request.POST.get('purpose')
         
-        try:
-            otp_obj = OTP.objects.filter(
-                email=email,
-                otp_code=otp_code,
-                purpose=purpose,
-                is_verified=False
-            ).latest('created_at')
-            
-            if otp_obj.is_expired():
-                messages.error(request, 'OTP has expired. Please request a new one.')
-                return redirect('request_otp')
-            
-            otp_obj.is_verified = True
-            otp_obj.save()
-            
+        result = get_otp_store().verify(email, purpose, otp_code)
+        if result == EXPIRED:
+            messages.error(request, 'OTP has expired. Please request a new one.')
+            return redirect('request_otp')
+
+        if result == VERIFIED:
             if purpose == 'registration':
                 # Get registration data from session
                 registration_data = request.session.get('registration_data')
@@ -89,8 +77,7 @@ def verify_otp(request):
                 # Store email in session for password reset
                 request.session['reset_email'] = email
                 return redirect('reset_password', email=email)
-                
-        except OTP.DoesNotExist:
+        else:
             messages.error(request, 'Invalid OTP. Please try again.')
     
     # Get email and purpose from session
@@ -0,0 +1,339 @@
+import random
+import smtplib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+from django.db import transaction
+from django.utils import timezone
+from .models import OutboxEmail
+
+DEFAULT_DELIVERY_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+DEFAULT_MAX_ATTEMPTS = 6
+# First retry after a minute, doubling up to six hours
+BACKOFF_BASE = 60
+BACKOFF_MAX = 6 * 60 * 60
+# How long a claimed email is hidden from other workers while it is being sent
+CLAIM_LEASE = timedelta(minutes=5)
+# Gmail's sending limits for a personal account
+DEFAULT_RATE_PER_MINUTE = 20
+DEFAULT_RATE_PER_DAY = 500
+# Part of the daily quota bulk mail leaves for transactional mail
+DEFAULT_BULK_RESERVE = 100
+DEFAULT_WORKERS = 4
+# Sending pauses for this long after a 4xx throttling reply, doubling while they continue
+THROTTLE_PAUSE = 30
+THROTTLE_PAUSE_MAX = 15 * 60
+# Next attempt of mail that is never due
+HELD_UNTIL = datetime(9999, 1, 1, tzinfo=dt_timezone.utc)
+
+
+class OutboxBackend(BaseEmailBackend):
+    """
+    Email backend that stores messages in the outbox instead of sending them.
+
+    Queuing is a single INSERT in the caller's transaction, so a request never
+    waits on SMTP, and mail written by a transaction that rolls back is never sent.
+    run_mail_worker delivers the queue. Open the connection with
+    priority=OutboxEmail.BULK for mail such as newsletters, which is sent
+    after transactional mail.
+    """
+
+    def __init__(self, priority=OutboxEmail.TRANSACTIONAL, **kwargs):
+        super().__init__(**kwargs)
+        self.priority = priority
+
+    def send_messages(self, email_messages):
+        queued = [
+            OutboxEmail(
+                subject=message.subject[:255],
+                from_email=message.from_email or settings.DEFAULT_FROM_EMAIL,
+                recipients=message.recipients(),
+                mime=message.message().as_bytes(linesep='\r\n'),
+                priority=self.priority,
+                next_attempt_at=self.due_at()
+            )
+            for message in email_messages
+            if message.recipients()
+        ]
+        OutboxEmail.objects.bulk_create(queued)
+        return len(queued)
+
+    def due_at(self):
+        return timezone.now()
+
+
+class HeldOutboxBackend(OutboxBackend):
+    """
+    Queues exactly like OutboxBackend, but the emails are never due. Benchmarks
+    use it to measure queuing against a database a live run_mail_worker may be
+    delivering from, then delete what they queued.
+    """
+
+    def due_at(self):
+        return HELD_UNTIL
+
+
+class _StoredMIME:
+    """The already rendered MIME message, in the shape delivery backends expect"""
+
+    def __init__(self, mime):
+        self.mime = mime
+
+    def as_bytes(self, linesep='\n'):
+        return self.mime if linesep == '\r\n' else self.mime.replace(b'\r\n', linesep.encode())
+
+
+class QueuedEmail(EmailMessage):
+    """An outbox row handed to a delivery backend, sent exactly as it was queued"""
+
+    def __init__(self, outbox_email):
+        super().__init__(
+            subject=outbox_email.subject,
+            from_email=outbox_email.from_email,
+            to=outbox_email.recipients
+        )
+        self.mime = bytes(outbox_email.mime)
+
+    def message(self):
+        return _StoredMIME(self.mime)
+
+
+def delivery_connection():
+    """Connection of the backend that really sends, SMTP in production"""
+    return get_connection(getattr(settings, 'OUTBOX_DELIVERY_BACKEND', DEFAULT_DELIVERY_BACKEND))
+
+
+def retry_delay(attempts):
+    """Exponential backoff with jitter, so failed mail does not retry in lockstep"""
+    delay = min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+def claim_due(batch_size, bulk_limit=None):
+    """
+    Claim a batch of due emails, transactional mail first and then oldest
+    first, with at most bulk_limit bulk emails.
+
+    Claimed rows have their next attempt pushed out by a lease, so a second
+    worker skips them and a worker that dies mid-batch only delays them.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        due = OutboxEmail.objects.select_for_update(skip_locked=True).filter(
+            status='queued',
+            next_attempt_at__lte=now
+        ).order_by('priority', 'next_attempt_at', 'id')
+        emails = list(due.filter(priority=OutboxEmail.TRANSACTIONAL)[:batch_size])
+        bulk = batch_size - len(emails) if bulk_limit is None else min(batch_size - len(emails), bulk_limit)
+        if bulk > 0:
+            emails += due.filter(priority=OutboxEmail.BULK)[:bulk]
+        OutboxEmail.objects.filter(pk__in=[email.pk for email in emails]).update(
+            next_attempt_at=now + CLAIM_LEASE
+        )
+    return emails
+
+
+def close_quietly(connection):
+    """Drop a connection that a failure may have left broken"""
+    try:
+        connection.close()
+    except Exception:
+        pass
+
+
+class Throttled(Exception):
+    """Sending is paused because the provider throttled an earlier message"""
+
+
+class TokenBucket:
+    """
+    Rate limit shared by every sending thread of a worker: a per-minute
+    bucket for bursts and a per-day bucket for the daily quota, both refilled
+    continuously. A 4xx throttling reply pauses all sending, for longer each
+    time the provider keeps pushing back.
+    """
+
+    def __init__(self, per_minute, per_day, sent_today=0):
+        now = time.monotonic()
+        # [capacity, refill per second, tokens]
+        self.buckets = [
+            [per_minute, per_minute / 60, per_minute],
+            [per_day, per_day / 86400, max(per_day - sent_today, 0)],
+        ]
+        self.updated = now
+        self.paused_until = now
+        self.pause = THROTTLE_PAUSE
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self.updated
+        self.updated = now
+        for bucket in self.buckets:
+            capacity, rate, tokens = bucket
+            bucket[2] = min(capacity, tokens + elapsed * rate)
+
+    def _delay(self, now):
+        """Seconds until a message may be sent"""
+        return max(
+            [self.paused_until - now] + [(1 - tokens) / rate for capacity, rate, tokens in self.buckets]
+        )
+
+    def available(self, reserve=0):
+        """
+        Messages that may be sent right away, and if none the seconds until one
+        may. A reserve is left untouched in the daily bucket.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            if self.paused_until > now:
+                return 0, self.paused_until - now
+            minute, day = (tokens for capacity, rate, tokens in self.buckets)
+            tokens = max(int(min(minute, day - reserve)), 0)
+            if tokens:
+                return tokens, 0
+            return 0, max(self._delay(now), (reserve + 1 - day) / self.buckets[1][1])
+
+    def acquire(self):
+        """Take a token, waiting for one to refill. Raises Throttled while sending is paused."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if self.paused_until > now:
+                    raise Throttled(f'Sending paused for {self.paused_until - now:.0f}s')
+                self._refill(now)
+                wait = self._delay(now)
+                if wait <= 0:
+                    for bucket in self.buckets:
+                        bucket[2] -= 1
+                    return
+            time.sleep(wait)
+
+    def throttle(self):
+        """Back off after the provider refused to take more mail for now. Returns the pause in seconds."""
+        with self.lock:
+            now = time.monotonic()
+            if self.paused_until <= now:
+                self.paused_until = now + self.pause
+                self.pause = min(self.pause * 2, THROTTLE_PAUSE_MAX)
+            return self.paused_until - now
+
+    def recover(self):
+        with self.lock:
+            self.pause = THROTTLE_PAUSE
+
+
+def rate_limit():
+    """A token bucket with the configured quotas, less what was sent in the last day"""
+    sent_today = OutboxEmail.objects.filter(
+        status='sent',
+        sent_at__gte=timezone.now() - timedelta(days=1)
+    ).count()
+    return TokenBucket(
+        getattr(settings, 'OUTBOX_RATE_PER_MINUTE', DEFAULT_RATE_PER_MINUTE),
+        getattr(settings, 'OUTBOX_RATE_PER_DAY', DEFAULT_RATE_PER_DAY),
+        sent_today
+    )
+
+
+def is_throttled(error):
+    """Whether an SMTP error is a temporary 4xx refusal rather than a failure of the message"""
+    if isinstance(error, Throttled):
+        return True
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(400 <= code < 500 for code, message in error.recipients.values())
+    return isinstance(error, smtplib.SMTPResponseException) and 400 <= error.smtp_code < 500
+
+
+class Dispatcher:
+    """
+    Sends claimed emails in parallel, each thread over its own persistent
+    connection, all of them drawing from one rate limit. Only SMTP happens in
+    the threads, results are recorded by the caller.
+    """
+
+    def __init__(self, workers, bucket, connection_factory=delivery_connection):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='outbox')
+        self.bucket = bucket
+        self.connection_factory = connection_factory
+        self.local = threading.local()
+        self.connections = []
+        self.lock = threading.Lock()
+
+    def _connection(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = self.local.connection = self.connection_factory()
+            with self.lock:
+                self.connections.append(connection)
+        return connection
+
+    def _send(self, outbox_email):
+        try:
+            self.bucket.acquire()
+        except Throttled as e:
+            return e
+        connection = self._connection()
+        try:
+            # Opens the connection the first time and after a failure, otherwise it is reused
+            connection.open()
+            connection.send_messages([QueuedEmail(outbox_email)])
+        except Exception as e:
+            close_quietly(connection)
+            return e
+        self.bucket.recover()
+        return None
+
+    def send(self, outbox_emails):
+        """Send a batch, returning the error of each email or None where it was sent"""
+        return list(self.executor.map(self._send, outbox_emails))
+
+    def close_connections(self):
+        with self.lock:
+            for connection in self.connections:
+                close_quietly(connection)
+
+    def shutdown(self):
+        self.executor.shutdown()
+        self.close_connections()
+
+
+def record(outbox_email, error, max_attempts, bucket):
+    """
+    Record the outcome of sending one claimed email: sent, a retry after
+    backoff, a dead letter, or for a throttling reply a retry once the pause
+    ends that does not count as an attempt. Returns the outcome.
+    """
+    if error is None:
+        outbox_email.status = 'sent'
+        outbox_email.sent_at = timezone.now()
+        outbox_email.save(update_fields=['status', 'sent_at'])
+        return 'sent'
+
+    outbox_email.last_error = f'{type(error).__name__}: {error}'
+    if is_throttled(error):
+        pause = bucket.throttle()
+        outbox_email.next_attempt_at = timezone.now() + timedelta(seconds=pause)
+        outbox_email.save(update_fields=['last_error', 'next_attempt_at'])
+        return 'throttled'
+
+    outbox_email.attempts += 1
+    if outbox_email.attempts >= max_attempts:
+        outbox_email.status = 'dead'
+    else:
+        outbox_email.next_attempt_at = timezone.now() + retry_delay(outbox_email.attempts)
+    outbox_email.save(update_fields=['attempts', 'last_error', 'status', 'next_attempt_at'])
+    return outbox_email.status if outbox_email.status == 'dead' else 'failed'
+
+
+def deliver_batch(dispatcher, outbox_emails, max_attempts):
+    """Send claimed emails through the dispatcher and record each outcome. Returns the outcomes."""
+    errors = dispatcher.send(outbox_emails)
+    return [
+        record(outbox_email, error, max_attempts, dispatcher.bucket)
+        for outbox_email, error in zip(outbox_emails, errors)
+    ]
@@ -0,0 +1,108 @@
+import hashlib
+import math
+import re
+import time
+from functools import wraps
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+
+RATE_PATTERN = re.compile(r'^(\d+)/(\d*)([smhd])$')
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """'5/m' is 5 requests a minute, '3/10m' is 3 every ten minutes. Returns (capacity, seconds)."""
+    match = RATE_PATTERN.match(rate)
+    if not match:
+        raise ValueError(f'Invalid rate {rate!r}, expected something like 5/m or 3/10m')
+    count, multiplier, unit = match.groups()
+    return int(count), int(multiplier or 1) * PERIODS[unit]
+
+
+def bucket_cache():
+    """The cache holding the buckets, shared by every web process in production"""
+    return caches[getattr(settings, 'RATE_LIMIT_CACHE', 'default')]
+
+
+def ip_key(name, ip):
+    return f'ratelimit:{name}:ip:{ip}'
+
+
+def account_key(name, account):
+    # Hashed so any input makes a valid, short cache key
+    return f'ratelimit:{name}:account:{hashlib.sha1(account.encode()).hexdigest()}'
+
+
+def take(key, capacity, period):
+    """
+    Take a token from the bucket stored under key, which holds up to capacity
+    tokens and refills them evenly over period seconds. Returns 0 if a token
+    was taken, otherwise the seconds until one is available.
+
+    The bucket is one cache entry read and written back, so two requests at
+    the same instant may both take the last token. That slack is fine for
+    stopping floods and saves a lock on every request.
+    """
+    cache = bucket_cache()
+    now = time.time()
+    rate = capacity / period
+    tokens, updated = cache.get(key, (capacity, now))
+    tokens = min(capacity, tokens + (now - updated) * rate)
+    if tokens < 1:
+        return (1 - tokens) / rate
+    cache.set(key, (tokens - 1, now), period)
+    return 0
+
+
+def client_ip(request):
+    """
+    The client's address. Behind a proxy that appends it to a header such as
+    X-Forwarded-For, the last entry is the one the proxy saw, earlier entries
+    come from the client and can be forged. The header is only trusted when
+    RATE_LIMIT_IP_HEADER names it, without a proxy a client could set it.
+    """
+    header = getattr(settings, 'RATE_LIMIT_IP_HEADER', None)
+    forwarded = request.META.get(header, '') if header else ''
+    if forwarded:
+        return forwarded.split(',')[-1].strip()
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def too_many_requests(retry_after):
+    seconds = max(math.ceil(retry_after), 1)
+    response = HttpResponse(
+        f'Too many requests. Please try again in {seconds} seconds.',
+        status=429,
+        content_type='text/plain'
+    )
+    response['Retry-After'] = str(seconds)
+    return response
+
+
+def rate_limit(name, per_ip=None, per_account=None, account_field='email', methods=('POST',)):
+    """
+    Limit a view with token buckets in the cache, one per client IP and one
+    per account (the value of account_field in the POST data, the email by
+    default). Requests over either limit get a 429 with Retry-After before
+    the view runs. Rates are written like '10/h' or '3/10m'.
+    """
+    ip_rate = parse_rate(per_ip) if per_ip else None
+    account_rate = parse_rate(per_account) if per_account else None
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method in methods and getattr(settings, 'RATE_LIMIT_ENABLED', True):
+                if ip_rate:
+                    retry_after = take(ip_key(name, client_ip(request)), *ip_rate)
+                    if retry_after:
+                        return too_many_requests(retry_after)
+                account = request.POST.get(account_field, '').strip().lower()
+                if account_rate and account:
+                    retry_after = take(account_key(name, account), *account_rate)
+                    if retry_after:
+                        return too_many_requests(retry_after)
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,175 @@
+import os
+import socket
+import time
+from datetime import timedelta
+from django.db.models import Q
+from django.utils import timezone
+from .models import ScheduledJob
+
+# Registered jobs by name, filled in by the @job decorator in appointments.jobs
+JOBS = {}
+
+DEFAULT_LEASE = timedelta(hours=1)
+
+
+class Every:
+    """Run at a fixed interval after the previous run started"""
+
+    def __init__(self, interval):
+        self.interval = interval
+
+    def next_after(self, moment):
+        return moment + self.interval
+
+    def __str__(self):
+        return f'every {self.interval}'
+
+
+class Cron:
+    """
+    A five field cron expression: minute, hour, day of month, month, day of
+    week (0 or 7 is Sunday). Fields take *, numbers, ranges, lists and /steps.
+    Times are in the project's time zone.
+    """
+    RANGES = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+    def __init__(self, expression):
+        self.expression = expression
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f'Cron expression needs 5 fields: {expression!r}')
+        self.minutes, self.hours, self.days, self.months, weekdays = [
+            self._parse(field, low, high) for field, (low, high) in zip(fields, self.RANGES)
+        ]
+        self.weekdays = {day % 7 for day in weekdays}
+        # As in cron, when both days are restricted either one matching is enough
+        self.any_day = fields[2] == '*'
+        self.any_weekday = fields[4] == '*'
+
+    @staticmethod
+    def _parse(field, low, high):
+        values = set()
+        for part in field.split(','):
+            span, _, step = part.partition('/')
+            if span == '*':
+                start, end = low, high
+            elif '-' in span:
+                start, end = map(int, span.split('-'))
+            else:
+                start = end = int(span)
+                if step:
+                    end = high
+            if not low <= start <= end <= high:
+                raise ValueError(f'Cron field {field!r} is outside {low}-{high}')
+            values.update(range(start, end + 1, int(step) if step else 1))
+        return values
+
+    def _day_matches(self, moment):
+        in_month = moment.day in self.days
+        # isoweekday() is 1 for Monday to 7 for Sunday, cron counts Sunday as 0
+        in_week = moment.isoweekday() % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return in_month and in_week
+        return in_month or in_week
+
+    def next_after(self, moment):
+        """The first matching minute strictly after moment"""
+        local = timezone.localtime(moment).replace(second=0, microsecond=0) + timedelta(minutes=1)
+        # Four years covers every valid expression, including the 29th of February
+        limit = local + timedelta(days=4 * 366)
+        while local < limit:
+            if local.month not in self.months or not self._day_matches(local):
+                local = (local + timedelta(days=1)).replace(hour=0, minute=0)
+            elif local.hour not in self.hours:
+                local = (local + timedelta(hours=1)).replace(minute=0)
+            elif local.minute not in self.minutes:
+                local += timedelta(minutes=1)
+            else:
+                return timezone.localtime(local)
+        raise ValueError(f'Cron expression never matches: {self.expression!r}')
+
+    def __str__(self):
+        return self.expression
+
+
+def job(name, every=None, cron=None, lease=DEFAULT_LEASE):
+    """
+    Register a maintenance job to run on an interval (a timedelta) or a cron
+    expression. The function returns the number of rows it touched, or None.
+    lease is how long the job's lock is held before another host may assume
+    the run died and take it over, so it must be longer than the job runs.
+    """
+    if (every is None) == (cron is None):
+        raise ValueError('A job needs exactly one of every or cron')
+    schedule = Every(every) if every is not None else Cron(cron)
+
+    def register(func):
+        JOBS[name] = (schedule, lease, func)
+        return func
+    return register
+
+
+def owner():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def sync_jobs(now=None):
+    """Create the state row of every registered job, scheduling its first run"""
+    now = now or timezone.now()
+    existing = set(ScheduledJob.objects.filter(name__in=JOBS).values_list('name', flat=True))
+    ScheduledJob.objects.bulk_create([
+        ScheduledJob(
+            name=name,
+            # Interval jobs run straight away, cron jobs wait for their first slot
+            next_run_at=now if isinstance(schedule, Every) else schedule.next_after(now)
+        )
+        for name, (schedule, lease, func) in JOBS.items()
+        if name not in existing
+    ], ignore_conflicts=True)
+
+
+def acquire(name, lease, now):
+    """
+    Take the job's lock if its run is due and nobody holds the lock. A single
+    conditional UPDATE, so exactly one host wins however many are polling.
+    """
+    return ScheduledJob.objects.filter(
+        Q(locked_until__isnull=True) | Q(locked_until__lt=now),
+        name=name,
+        next_run_at__lte=now
+    ).update(locked_until=now + lease, locked_by=owner()) == 1
+
+
+def run_job(name):
+    """Run a job that has been acquired, recording how it went and releasing the lock"""
+    schedule, lease, func = JOBS[name]
+    started_at = timezone.now()
+    started = time.perf_counter()
+    error = ''
+    rows = None
+    try:
+        rows = func()
+    except Exception as e:
+        error = f'{type(e).__name__}: {e}'
+    # A run that outlived its lease leaves alone the lock another host has taken since
+    ScheduledJob.objects.filter(name=name, locked_by=owner()).update(
+        last_started_at=started_at,
+        last_duration=time.perf_counter() - started,
+        last_rows=rows,
+        last_error=error,
+        last_status='failed' if error else 'succeeded',
+        # A failed run waits for its next slot like any other
+        next_run_at=schedule.next_after(started_at),
+        locked_until=None,
+        locked_by=''
+    )
+    return ScheduledJob.objects.get(name=name)
+
+
+def run_due_jobs(now=None):
+    """Run every registered job that is due and not running elsewhere. Returns their state rows."""
+    finished = []
+    for name, (schedule, lease, func) in JOBS.items():
+        if acquire(name, lease, now or timezone.now()):
+            finished.append(run_job(name))
+    return finished
@@ -1,8 +1,13 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, pre_save, post_delete
 from django.contrib.auth.models import User
 from django.dispatch import receiver
+from django.db import transaction
 from django.core.mail import send_mail
 from django.conf import settings
+from .models import Appointment, TimeSlot, UserSubscription, Payment, Badge
+from .booking import session_for_slot, occupy_session, free_seat
+from .subscriptions import invalidate_active_subscription
+from .leaderboard import award_points
 
 @receiver(post_save, sender=User)
 def send_welcome_email(sender, instance, created, **kwargs):
@@ -18,4 +23,77 @@ def send_welcome_email(sender, instance, created, **kwargs):
             from_email,
             recipient_list,
             fail_silently=False,
-        )
\ No newline at end of file
+        )
+
+
+def _appointment_seat(appointment):
+    """(date, session) seat held by an appointment, or None if it holds no seat"""
+    if appointment.status == 'cancelled':
+        return None
+    try:
+        session = session_for_slot(appointment.time_slot)
+    except TimeSlot.DoesNotExist:
+        return None
+    return (appointment.date, session) if session else None
+
+@receiver(pre_save, sender=Appointment)
+def remember_appointment_seat(sender, instance, **kwargs):
+    # Appointments saved by the booking engine have already been counted
+    if getattr(instance, '_seat_counted', False) or not instance.pk:
+        return
+    previous = Appointment.objects.filter(pk=instance.pk).select_related('time_slot').first()
+    instance._previous_seat = _appointment_seat(previous) if previous else None
+
+@receiver(post_save, sender=Appointment)
+def update_session_availability(sender, instance, created, **kwargs):
+    if getattr(instance, '_seat_counted', False):
+        instance._seat_counted = False
+        return
+    previous = getattr(instance, '_previous_seat', None)
+    current = _appointment_seat(instance)
+    instance._previous_seat = None
+    if previous == current:
+        return
+    if previous:
+        free_seat(*previous)
+    if current:
+        occupy_session(*current)
+
+@receiver(post_delete, sender=Appointment)
+def release_deleted_appointment_seat(sender, instance, **kwargs):
+    seat = _appointment_seat(instance)
+    if seat:
+        free_seat(*seat)
+
+@receiver(post_save, sender=UserSubscription)
+@receiver(post_delete, sender=UserSubscription)
+@receiver(post_save, sender=Payment)
+@receiver(post_delete, sender=Payment)
+def clear_active_subscription_cache(sender, instance, **kwargs):
+    # After commit, or a request in between could cache the old row again
+    user_id = instance.user_id
+    transaction.on_commit(lambda: invalidate_active_subscription(user_id))
+
+@receiver(pre_save, sender=Badge)
+def remember_badge_points(sender, instance, **kwargs):
+    previous = None
+    if instance.pk:
+        previous = Badge.objects.filter(pk=instance.pk).values_list('user_id', 'points', 'awarded_date').first()
+    instance._previous_points = previous
+
+@receiver(post_save, sender=Badge)
+def update_leaderboard(sender, instance, **kwargs):
+    previous = getattr(instance, '_previous_points', None)
+    instance._previous_points = None
+    if previous == (instance.user_id, instance.points, instance.awarded_date):
+        return
+    if previous:
+        award_points(previous[0], -previous[1], 'badge_revoked', previous[2], badge=instance)
+    award_points(instance.user_id, instance.points, 'badge', instance.awarded_date, badge=instance)
+
+@receiver(post_delete, sender=Badge)
+def remove_badge_points(sender, instance, origin=None, **kwargs):
+    # When the member is deleted their ledger and counters go with them
+    if isinstance(origin, User) or getattr(origin, 'model', None) is User:
+        return
+    award_points(instance.user_id, -instance.points, 'badge_revoked', instance.awarded_date)
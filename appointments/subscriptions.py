@@ -0,0 +1,56 @@
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+from .models import UserSubscription
+
+# How long to remember that a user has no active subscription
+NO_SUBSCRIPTION_TIMEOUT = 60 * 60
+
+# Stored in place of None so a cache miss can be told apart from "no subscription"
+_NO_SUBSCRIPTION = 'none'
+
+
+def _cache_key(user_id):
+    return f'active_subscription:{user_id}'
+
+
+def _cache():
+    return caches[getattr(settings, 'SUBSCRIPTION_CACHE', 'default')]
+
+
+def get_active_subscription(user):
+    """
+    Return the user's active subscription, or None.
+
+    The result is cached until the end of the subscription's last day and is
+    invalidated whenever one of the user's subscriptions or payments changes.
+    The cache is shared, so changes made by the scheduler reach web requests.
+    """
+    key = _cache_key(user.pk)
+    cache = _cache()
+    subscription = cache.get(key)
+    if subscription is not None:
+        return None if subscription == _NO_SUBSCRIPTION else subscription
+
+    now = timezone.now()
+    subscription = UserSubscription.objects.filter(
+        user=user,
+        is_active=True,
+        end_date__gte=now.date()
+    ).select_related('plan', 'time_slot').first()
+
+    if subscription is None:
+        cache.set(key, _NO_SUBSCRIPTION, NO_SUBSCRIPTION_TIMEOUT)
+    else:
+        expires = datetime.combine(subscription.end_date + timedelta(days=1), time.min, tzinfo=dt_timezone.utc)
+        cache.set(key, subscription, max(int((expires - now).total_seconds()), 1))
+    return subscription
+
+
+def invalidate_active_subscription(user_id):
+    _cache().delete(_cache_key(user_id))
+
+
+def invalidate_active_subscriptions(user_ids):
+    _cache().delete_many([_cache_key(user_id) for user_id in user_ids])
@@ -1,3 +1,1106 @@
-from django.test import TestCase
+from datetime import datetime, timedelta
+from functools import wraps
+from io import StringIO
+import json
+import os
+import shutil
+import smtplib
+import subprocess
+import sys
+import tempfile
+from unittest import mock, skipUnless
+from django.conf import settings
+from django.test import TestCase, override_settings
+from django.core.management import call_command, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core import mail
+from django.urls import reverse
+from django.utils import timezone
+from .models import TimeSlot, SessionAvailability, WaitlistEntry, Certificate, OutboxEmail, ScheduledJob, SubscriptionReminder, SubscriptionPlan, UserSubscription, Appointment, Payment, WorkoutSession, Exercise, ExerciseLog, Badge, Leaderboard, PointsRollup, PointsEntry, NewsletterSignup
+from .otp_models import OTP
+from django.core.mail import send_mail, EmailMessage
+from django.core.mail.backends.base import BaseEmailBackend
+from .booking import SESSION_TIMES, get_session_slot, reserve_session, reserve_recurring, cancel_booking, join_waitlist, leave_waitlist, build_availability, month_availability, SessionFull, AlreadyBooked
+from .certificate_templates import DESIGNS
+from .subscriptions import get_active_subscription, _cache, _cache_key
+from .outbox import TokenBucket, Throttled
+from .otp_store import CacheOTPStore, DatabaseOTPStore, VERIFIED, INVALID, EXPIRED, MAX_ATTEMPTS
+from .scheduler import JOBS, Cron, job, acquire, sync_jobs, run_due_jobs
+from .leaderboard import leaderboard_page, member_rank, period_start, rebuild_rollups, award_points
+from .management.commands.bench_views import MEMBER_PAGES
 
-# Create your tests here.
+
+def clear_caches():
+    """Empty every cache, the local memory one outlives each test"""
+    for cache in caches.all():
+        cache.clear()
+
+
+# Query counts are the code's own. The shared cache is a database table, whose
+# queries a Redis or Memcached deployment would not run.
+LOCAL_SHARED_CACHE = {
+    **settings.CACHES,
+    'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'shared'},
+}
+
+
+def cross_process_cache(test):
+    """
+    Run a test with the shared cache in a temporary directory, which
+    run_in_another_process hands to the other process. The test database is
+    out of its reach, and the real shared cache is left alone.
+    """
+    @wraps(test)
+    def wrapper(*args, **kwargs):
+        with tempfile.TemporaryDirectory() as location:
+            shared = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location}
+            with override_settings(CACHES={**settings.CACHES, 'shared': shared}):
+                return test(*args, **kwargs)
+    return wrapper
+
+
+def run_in_another_process(code):
+    """Run Python with Django set up in a separate process, as run_scheduler does, using this process's caches"""
+    subprocess.run(
+        [
+            sys.executable, '-c',
+            'import django, json, os; django.setup(); from django.test import override_settings; '
+            f'override_settings(CACHES=json.loads(os.environ["TEST_CACHES"])).enable(); {code}'
+        ],
+        cwd=settings.BASE_DIR,
+        env={**os.environ, 'TEST_CACHES': json.dumps(settings.CACHES)},
+        check=True
+    )
+
+
+def query_plans(queries, table):
+    """EXPLAIN QUERY PLAN for every captured SELECT reading from the table"""
+    plans = []
+    with connection.cursor() as cursor:
+        for query in queries:
+            sql = query['sql']
+            if sql.startswith('SELECT') and f'FROM "{table}"' in sql:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+                plans.append(' | '.join(row[-1] for row in cursor.fetchall()))
+    return plans
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN is SQLite specific')
+class QueryPlanTests(TestCase):
+    """The main query of each hot view must be served by an index"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='member', email='member@example.com', password='pass12345')
+        cls.plan = SubscriptionPlan.objects.create(name='Monthly Package', duration_months=1, price=50)
+        today = timezone.now().date()
+        cls.subscription = UserSubscription.objects.create(
+            user=cls.user,
+            plan=cls.plan,
+            start_date=today,
+            end_date=today + timedelta(days=30),
+            time_slot=get_session_slot('evening'),
+            is_active=True
+        )
+        Appointment.objects.create(
+            user=cls.user,
+            user_subscription=cls.subscription,
+            date=today,
+            time_slot=get_session_slot('evening')
+        )
+
+    def setUp(self):
+        clear_caches()
+
+    def assertUsesIndex(self, url, table, index, method='get', data=None, user=None):
+        self.client.force_login(user or self.user)
+        with CaptureQueriesContext(connection) as queries:
+            getattr(self.client, method)(url, data or {})
+        plans = query_plans(queries.captured_queries, table)
+        self.assertTrue(plans, f'{url} did not query {table}')
+        for plan in plans:
+            self.assertIn(index, plan)
+            self.assertNotIn(f'SCAN {table}', plan)
+
+    def test_home_active_subscription(self):
+        self.assertUsesIndex(reverse('home'), 'appointments_usersubscription', 'subscription_active_idx')
+
+    def test_book_appointment_active_subscription(self):
+        self.assertUsesIndex(reverse('book_appointment'), 'appointments_usersubscription', 'subscription_active_idx')
+
+    def test_my_appointments(self):
+        # Appointment(user, date) is already indexed by its unique constraint
+        self.assertUsesIndex(reverse('my_appointments'), 'appointments_appointment', '(user_id=?)')
+
+    def test_workout_history_exercise_logs(self):
+        session = WorkoutSession.objects.create(user=self.user)
+        ExerciseLog.objects.create(workout_session=session, exercise=Exercise.objects.first(), sets=3, reps=10)
+        self.assertUsesIndex(reverse('workout_history'), 'appointments_exerciselog', 'exerciselog_session_idx')
+
+    def test_verify_otp(self):
+        OTP.objects.create(email='member@example.com', otp_code='123456', purpose='password_reset')
+        self.assertUsesIndex(
+            reverse('verify_otp'),
+            'appointments_otp',
+            'otp_lookup_idx',
+            method='post',
+            data={'email': 'member@example.com', 'otp': '123456', 'purpose': 'password_reset'}
+        )
+
+    def test_payment_changelist(self):
+        admin = User.objects.create_superuser(username='admin', email='admin@example.com', password='pass12345')
+        Payment.objects.create(user=self.user, subscription_plan=self.plan, amount=50)
+        self.assertUsesIndex(
+            reverse('admin:appointments_payment_changelist') + '?payment_status__exact=pending',
+            'appointments_payment',
+            'payment_status_created_idx',
+            user=admin
+        )
+
+
+@override_settings(CACHES=LOCAL_SHARED_CACHE)
+class QueryBudgetTests(TestCase):
+    """Member pages must stay within their query budget however much history there is"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='member', email='member@example.com', password='pass12345')
+        plan = SubscriptionPlan.objects.create(name='Monthly Package', duration_months=1, price=50)
+        cls.today = timezone.now().date()
+        cls.subscription = UserSubscription.objects.create(
+            user=cls.user,
+            plan=plan,
+            start_date=cls.today - timedelta(days=30),
+            end_date=cls.today + timedelta(days=30),
+            time_slot=get_session_slot('evening'),
+            is_active=True
+        )
+        cls.exercises = list(Exercise.objects.all()[:3])
+
+    def setUp(self):
+        clear_caches()
+        self.client.force_login(self.user)
+
+    def add_history(self, first_day, days):
+        for offset in range(first_day, first_day + days):
+            appointment = Appointment.objects.create(
+                user=self.user,
+                user_subscription=self.subscription,
+                date=self.today - timedelta(days=offset + 1),
+                time_slot=get_session_slot('evening'),
+                status='confirmed'
+            )
+            session = WorkoutSession.objects.create(user=self.user, appointment=appointment)
+            for exercise in self.exercises:
+                ExerciseLog.objects.create(workout_session=session, exercise=exercise, sets=3, reps=10, weight=offset + 20)
+
+    def count_queries(self, url_name):
+        clear_caches()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(url_name))
+        self.assertEqual(response.status_code, 200)
+        return len(queries.captured_queries)
+
+    def test_member_pages(self):
+        self.add_history(0, 2)
+        small = {name: self.count_queries(url_name) for name, (url_name, budget) in MEMBER_PAGES.items()}
+        self.add_history(2, 6)
+        for name, (url_name, budget) in MEMBER_PAGES.items():
+            with self.subTest(page=name):
+                queries = self.count_queries(url_name)
+                self.assertLessEqual(queries, budget)
+                self.assertEqual(queries, small[name], f'{name} runs more queries as history grows')
+
+
+@override_settings(SESSION_CAPACITY={'morning': 2, 'afternoon': 2, 'evening': 2})
+class BookingTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        plan = SubscriptionPlan.objects.create(name='Monthly Package', duration_months=1, price=50)
+        today = timezone.now().date()
+        cls.subscriptions = [
+            UserSubscription.objects.create(
+                user=User.objects.create_user(username=f'member{i}', email=f'member{i}@example.com', password='pass12345'),
+                plan=plan,
+                start_date=today,
+                end_date=today + timedelta(days=60),
+                time_slot=get_session_slot('evening'),
+                is_active=True
+            )
+            for i in range(5)
+        ]
+        # A weekday next week, the gym is closed on Saturdays
+        cls.date = today + timedelta(days=7)
+        while cls.date.weekday() == 5:
+            cls.date += timedelta(days=1)
+
+    def setUp(self):
+        clear_caches()
+
+    def book(self, subscription, date=None, session='evening'):
+        return reserve_session(subscription.user, subscription, date or self.date, session)
+
+    def booked(self, session='evening', date=None):
+        availability = SessionAvailability.objects.filter(date=date or self.date, session=session).first()
+        return availability.booked if availability else 0
+
+    def test_reservations_stop_at_capacity(self):
+        first, second, third = self.subscriptions[:3]
+        self.book(first)
+        self.book(second)
+        with self.assertRaises(SessionFull):
+            self.book(third)
+        self.assertEqual(self.booked(), 2)
+        self.assertFalse(Appointment.objects.filter(user=third.user).exists())
+        # Other sessions have their own seats
+        self.book(third, session='morning')
+        self.assertEqual(self.booked('morning'), 1)
+
+    def test_second_booking_on_a_day_is_refused(self):
+        first = self.subscriptions[0]
+        self.book(first)
+        with self.assertRaises(AlreadyBooked):
+            self.book(first, session='morning')
+        self.assertEqual(self.booked(), 1)
+        self.assertEqual(self.booked('morning'), 0)
+
+        self.client.force_login(first.user)
+        response = self.client.post(reverse('book_appointment'), {'date': self.date.isoformat(), 'time_slot': '3'})
+        self.assertRedirects(response, reverse('book_appointment'), fetch_redirect_response=False)
+        self.assertEqual(Appointment.objects.filter(user=first.user).count(), 1)
+
+    def test_concurrent_booking_loses_the_unique_race(self):
+        first = self.subscriptions[0]
+        self.book(first)
+        # The other request's appointment lands after this one checked for it
+        not_yet = mock.Mock(**{'exists.return_value': False})
+        with mock.patch.object(Appointment.objects, 'filter', return_value=not_yet):
+            with self.assertRaises(AlreadyBooked):
+                self.book(first, session='morning')
+        self.assertEqual(self.booked('morning'), 0)
+
+    def test_cancel_frees_the_seat(self):
+        first, second, third = self.subscriptions[:3]
+        appointment = self.book(first)
+        self.book(second)
+        cancel_booking(appointment)
+        self.assertEqual(self.booked(), 1)
+        self.book(third)
+        self.assertEqual(self.booked(), 2)
+        with self.assertRaises(SessionFull):
+            self.book(self.subscriptions[3])
+
+    def test_recurring_booking_skips_full_and_booked_days(self):
+        member, other, third = self.subscriptions[:3]
+        days = [self.date + timedelta(days=offset) for offset in range(14)]
+        # Two weekdays the gym is open, each twice in the fortnight
+        weekdays = {day.weekday() for day in days[:3] if day.weekday() != 5}
+        dates = [day for day in days if day.weekday() in weekdays]
+        full, booked = dates[1], dates[2]
+        self.book(other, full)
+        self.book(third, full)
+        self.book(member, booked, session='morning')
+
+        appointments, skipped = reserve_recurring(member.user, member, 'evening', weekdays, days[0], days[-1])
+        self.assertEqual(skipped['full'], [full])
+        self.assertEqual(skipped['existing'], [booked])
+        self.assertEqual(
+            sorted(appointment.date for appointment in appointments),
+            [day for day in dates if day not in (full, booked)]
+        )
+        self.assertEqual(self.booked(date=full), 2)
+        for appointment in appointments:
+            self.assertEqual(self.booked(date=appointment.date), 1)
+        # The member's own appointment keeps the day it already had
+        self.assertEqual(Appointment.objects.get(user=member.user, date=booked).time_slot.session, 'morning')
+
+    def test_leaving_the_waitlist_needs_a_post(self):
+        self.book(self.subscriptions[0])
+        self.book(self.subscriptions[1])
+        member = self.subscriptions[2]
+        entry = join_waitlist(member.user, member, self.date, 'evening')
+        self.client.force_login(member.user)
+        url = reverse('leave_waitlist', args=[entry.pk])
+
+        # A prefetched or crawled link must not drop the member's place
+        self.assertEqual(self.client.get(url).status_code, 405)
+        entry.refresh_from_db()
+        self.assertEqual(entry.status, 'waiting')
+
+        self.assertRedirects(self.client.post(url), reverse('my_appointments'), fetch_redirect_response=False)
+        entry.refresh_from_db()
+        self.assertNotEqual(entry.status, 'waiting')
+
+    def test_cancelling_promotes_the_first_valid_waiting_member(self):
+        first, second, left, moved, waiting = self.subscriptions
+        appointment = self.book(first)
+        self.book(second)
+        entries = [join_waitlist(subscription.user, subscription, self.date, 'evening') for subscription in (left, moved, waiting)]
+        leave_waitlist(entries[0])
+        # Booked another session that day after joining, so no longer wants the seat
+        self.book(moved, session='morning')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            cancel_booking(appointment)
+        self.assertEqual(
+            [entry.status for entry in WaitlistEntry.objects.filter(pk__in=[entry.pk for entry in entries]).order_by('pk')],
+            ['cancelled', 'cancelled', 'promoted']
+        )
+        promoted = Appointment.objects.get(user=waiting.user, date=self.date)
+        self.assertEqual((promoted.time_slot.session, promoted.status), ('evening', 'pending'))
+        self.assertEqual(Appointment.objects.get(user=moved.user, date=self.date).time_slot.session, 'morning')
+        # The seat passed straight on
+        self.assertEqual(self.booked(), 2)
+        self.assertEqual([message.to for message in mail.outbox[-1:]], [[waiting.user.email]])
+
+        # With nobody left waiting the next seat is released
+        cancel_booking(promoted)
+        self.assertEqual(self.booked(), 1)
+
+    def test_compact_timeslots_merges_duplicates(self):
+        canonical = get_session_slot('evening')
+        start_time, end_time = SESSION_TIMES['evening']
+        # A row made per booking by the old view, and a legacy row without a session
+        duplicates = [
+            TimeSlot.objects.create(session='evening', start_time=start_time, end_time=end_time),
+            TimeSlot.objects.create(start_time=start_time, end_time=end_time),
+        ]
+        first, second, third = self.subscriptions[:3]
+        for subscription, time_slot, offset in ((first, duplicates[0], 0), (second, duplicates[1], 0), (third, duplicates[1], 1)):
+            Appointment.objects.create(
+                user=subscription.user,
+                user_subscription=subscription,
+                date=self.date + timedelta(days=offset),
+                time_slot=time_slot
+            )
+        second.time_slot = duplicates[1]
+        second.save()
+        self.assertEqual(self.booked(), 2)
+
+        call_command('compact_timeslots', chunk_size=1, stdout=StringIO())
+        self.assertEqual(list(TimeSlot.objects.filter(start_time=start_time, end_time=end_time)), [canonical])
+        self.assertEqual(Appointment.objects.exclude(time_slot=canonical).count(), 0)
+        self.assertEqual(UserSubscription.objects.exclude(time_slot=canonical).count(), 0)
+        # Repointing keeps each appointment in its session, so the seat counts stand
+        self.assertEqual(self.booked(), 2)
+
+    def test_build_availability_counts_and_repairs(self):
+        first, second = self.subscriptions[:2]
+        self.book(first)
+        self.book(second, session='morning')
+        SessionAvailability.objects.filter(date=self.date, session='evening').update(booked=2)
+
+        created, updated = build_availability(self.date, 1)
+        # Six open days of three sessions, the two rows made by the bookings already existed
+        self.assertEqual((created, updated), (16, 1))
+        self.assertEqual(self.booked(), 1)
+        self.assertEqual(self.booked('morning'), 1)
+        saturday = self.date + timedelta(days=(5 - self.date.weekday()) % 7)
+        self.assertFalse(SessionAvailability.objects.filter(date=saturday).exists())
+        self.assertEqual(build_availability(self.date, 1), (0, 0))
+
+    def test_build_availability_counts_inside_its_transaction(self):
+        self.book(self.subscriptions[0])
+        SessionAvailability.objects.filter(date=self.date, session='evening').update(booked=0)
+        with CaptureQueriesContext(connection) as queries:
+            build_availability(self.date, 1)
+        sql = [query['sql'] for query in queries.captured_queries]
+        opened = next(i for i, query in enumerate(sql) if query.startswith('SAVEPOINT'))
+        released = next(i for i, query in enumerate(sql) if query.startswith('RELEASE SAVEPOINT'))
+        counted = next(i for i, query in enumerate(sql) if 'COUNT(' in query and '"appointments_appointment"' in query)
+        # A booking committed between a count and the write it decides would be overwritten
+        self.assertTrue(opened < counted < released)
+        self.assertEqual(self.booked(), 1)
+
+    def test_month_availability_is_one_query(self):
+        self.book(self.subscriptions[0])
+        with self.assertNumQueries(1):
+            days = month_availability(self.date.year, self.date.month)
+        day = days[self.date.isoformat()]
+        self.assertEqual(day['sessions']['evening'], {'capacity': 2, 'booked': 1, 'remaining': 1})
+        self.assertEqual(day['sessions']['morning']['remaining'], 2)
+        self.assertTrue(any(day['closed'] for day in days.values()))
+
+        response = self.client.get(reverse('session_availability', args=[self.date.year, self.date.month]))
+        self.assertEqual(response.json()['days'][self.date.isoformat()]['sessions']['evening']['remaining'], 1)
+
+    def test_appointments_saved_outside_the_engine_hold_seats(self):
+        subscription = self.subscriptions[0]
+        # As the admin saves them, through the signal handlers
+        appointment = Appointment.objects.create(
+            user=subscription.user,
+            user_subscription=subscription,
+            date=self.date,
+            time_slot=get_session_slot('evening'),
+            status='confirmed'
+        )
+        self.assertEqual(self.booked(), 1)
+
+        appointment.time_slot = get_session_slot('morning')
+        appointment.save()
+        self.assertEqual((self.booked(), self.booked('morning')), (0, 1))
+
+        appointment.status = 'cancelled'
+        appointment.save()
+        self.assertEqual(self.booked('morning'), 0)
+
+        appointment.status = 'confirmed'
+        appointment.save()
+        self.assertEqual(self.booked('morning'), 1)
+        appointment.delete()
+        self.assertEqual(self.booked('morning'), 0)
+
+
+class LeaderboardTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user(username=f'member{i}', email=f'member{i}@example.com', password='pass12345')
+            for i in range(4)
+        ]
+
+    def points(self, user):
+        return Leaderboard.objects.filter(user=user).values_list('points', flat=True).first()
+
+    def test_badges_update_points(self):
+        user = self.users[0]
+        badge = Badge.objects.create(user=user, badge_type='Course Completion')
+        Badge.objects.create(user=user, badge_type='Top Performer')
+        self.assertEqual(self.points(user), 150)
+
+        badge.points = 60
+        badge.save()
+        self.assertEqual(self.points(user), 160)
+
+        badge.delete()
+        self.assertEqual(self.points(user), 100)
+
+    def test_deleting_member_with_badges(self):
+        user = self.users[0]
+        Badge.objects.create(user=user, badge_type='Top Performer')
+        user_id = user.pk
+        user.delete()
+        # TestCase defers foreign key checks to a commit that never comes
+        connection.check_constraints()
+        self.assertFalse(Leaderboard.objects.filter(user_id=user_id).exists())
+        self.assertFalse(Badge.objects.filter(user_id=user_id).exists())
+
+    def test_rank_matches_window_function(self):
+        first, tied, other, without = self.users
+        Badge.objects.create(user=first, badge_type='Top Performer')
+        Badge.objects.create(user=tied, badge_type='Course Completion')
+        Badge.objects.create(user=other, badge_type='Course Completion')
+
+        page = leaderboard_page(1)
+        self.assertEqual([(entry.user, entry.rank) for entry in page], [(first, 1), (tied, 2), (other, 2)])
+        self.assertEqual([member_rank(user) for user in self.users], [1, 2, 2, 4])
+
+    def test_badges_update_rollups(self):
+        user = self.users[0]
+        today = timezone.localdate()
+        last_month = period_start('month', today) - timedelta(days=1)
+        Badge.objects.create(user=user, badge_type='Course Completion')
+        old = Badge.objects.create(user=user, badge_type='Top Performer')
+        # Move the second badge back a month, its points must follow it
+        old.awarded_date = timezone.now().replace(year=last_month.year, month=last_month.month, day=last_month.day)
+        old.save()
+
+        rollups = dict(PointsRollup.objects.filter(user=user, period='month').values_list('period_start', 'points'))
+        self.assertEqual(rollups, {period_start('month', today): 50, period_start('month', last_month): 100})
+        self.assertEqual(
+            PointsRollup.objects.get(user=user, period='week', period_start=period_start('week', today)).points, 50
+        )
+
+        incremental = set(PointsRollup.objects.filter(points__gt=0).values_list('user_id', 'period', 'period_start', 'points'))
+        rebuild_rollups([user.pk])
+        self.assertEqual(set(PointsRollup.objects.values_list('user_id', 'period', 'period_start', 'points')), incremental)
+
+    def test_window_leaderboard(self):
+        first, second = self.users[:2]
+        Badge.objects.create(user=first, badge_type='Top Performer')
+        badge = Badge.objects.create(user=second, badge_type='Course Completion')
+        badge.awarded_date = timezone.now() - timedelta(days=400)
+        badge.save()
+
+        self.client.force_login(second)
+        response = self.client.get(reverse('leaderboard'), {'window': 'month'})
+        self.assertEqual([entry.user for entry in response.context['leaderboard']], [first])
+        self.assertEqual(response.context['user_rank'], 2)
+
+        response = self.client.get(reverse('leaderboard'), {'window': 'all'})
+        self.assertEqual([entry.user for entry in response.context['leaderboard']], [first, second])
+
+    def test_ledger_records_every_change(self):
+        user = self.users[0]
+        badge = Badge.objects.create(user=user, badge_type='Course Completion')
+        award_points(user.pk, 5, 'adjustment')
+        badge_id = badge.pk
+        with CaptureQueriesContext(connection) as queries:
+            badge.delete()
+        self.assertEqual(
+            list(PointsEntry.objects.filter(user=user).order_by('id').values_list('reason', 'points', 'badge_id')),
+            [('badge', 50, badge_id), ('adjustment', 5, None), ('badge_revoked', -50, None)]
+        )
+        # Deleting the badge leaves its ledger lines as they were written
+        self.assertFalse([query for query in queries.captured_queries if query['sql'].startswith('UPDATE "appointments_pointsentry"')])
+        self.assertEqual(self.points(user), 5)
+
+        entry = PointsEntry.objects.first()
+        entry.points = 100
+        with self.assertRaises(ValueError):
+            entry.save()
+
+    def test_deleting_member_removes_their_points(self):
+        user = User.objects.create_user(username='leaver', email='leaver@example.com', password='pass12345')
+        Badge.objects.create(user=user, badge_type='Top Performer')
+        user_id = user.pk
+        user.delete()
+        self.assertFalse(Leaderboard.objects.filter(user_id=user_id).exists())
+        self.assertFalse(PointsRollup.objects.filter(user_id=user_id).exists())
+        self.assertFalse(PointsEntry.objects.filter(user_id=user_id).exists())
+
+    def test_reconcile_points(self):
+        user = self.users[0]
+        Badge.objects.create(user=user, badge_type='Top Performer')
+        call_command('reconcile_points', stdout=StringIO())
+
+        Leaderboard.objects.filter(user=user).update(points=1)
+        PointsRollup.objects.filter(user=user, period='week').delete()
+        with self.assertRaises(CommandError):
+            call_command('reconcile_points', stdout=StringIO())
+        call_command('reconcile_points', fix=True, stdout=StringIO())
+        self.assertEqual(self.points(user), 100)
+        self.assertTrue(PointsRollup.objects.filter(user=user, period='week', points=100).exists())
+        call_command('reconcile_points', stdout=StringIO())
+
+    def test_reconcile_fix_reads_the_ledger_in_its_transaction(self):
+        user = self.users[0]
+        Badge.objects.create(user=user, badge_type='Top Performer')
+        Leaderboard.objects.filter(user=user).update(points=1)
+        PointsRollup.objects.filter(user=user).update(points=1)
+        with CaptureQueriesContext(connection) as queries:
+            call_command('reconcile_points', fix=True, stdout=StringIO())
+        sql = [query['sql'] for query in queries.captured_queries]
+        opened = next(i for i, query in enumerate(sql) if query.startswith('SAVEPOINT'))
+        released = sql.index(sql[opened].replace('SAVEPOINT', 'RELEASE SAVEPOINT', 1))
+        touched = [
+            i for i, query in enumerate(sql)
+            if '"appointments_pointsentry"' in query or query.startswith(('UPDATE', 'INSERT', 'DELETE'))
+        ]
+        # An award committed between reading the ledger and writing the counters would be lost
+        self.assertTrue(touched)
+        self.assertTrue(all(opened < i < released for i in touched))
+        self.assertEqual(self.points(user), 100)
+        self.assertTrue(PointsRollup.objects.filter(user=user, period='week', points=100).exists())
+
+    def test_member_rank_is_one_indexed_query(self):
+        Badge.objects.create(user=self.users[0], badge_type='Top Performer')
+        with CaptureQueriesContext(connection) as queries:
+            member_rank(self.users[1])
+        self.assertEqual(len(queries.captured_queries), 1)
+        if connection.vendor == 'sqlite':
+            plans = query_plans(queries.captured_queries, 'appointments_leaderboard')
+            self.assertTrue(plans)
+            self.assertNotIn('SCAN appointments_leaderboard', plans[0])
+
+
+class CertificateTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='member', email='member@example.com', password='pass12345', first_name='Sita', last_name='Rai'
+        )
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        mail.outbox = []
+
+    def download(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.get(reverse('generate_certificate', args=[self.user.username]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        return b''.join(response.streaming_content)
+
+    def test_issued_once(self):
+        first = self.download()
+        second = self.download()
+        self.assertTrue(first.startswith(b'%PDF'))
+        self.assertEqual(first, second)
+        self.assertEqual(Certificate.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(Badge.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(len(mail.outbox), 1)
+
+        name = Certificate.objects.get(user=self.user).file.name
+        self.assertRegex(name, r'^certificates/[0-9a-f]{64}\.pdf$')
+
+    def test_designs_render_deterministically(self):
+        date = timezone.now()
+        pdfs = set()
+        for design in DESIGNS.values():
+            pdf = design.render('Sita', 'Rai', date)
+            self.assertEqual(pdf, design.render('Sita', 'Rai', date))
+            pdfs.add(pdf)
+        self.assertEqual(len(pdfs), len(DESIGNS))
+
+    def test_names_are_written_into_the_cached_page(self):
+        design = DESIGNS['Top Performer']
+        date = timezone.now()
+        pdf = design.render('Sita (Devi)', 'R\\ai', date)
+        self.assertIn(b'(Awarded to: Sita \\(Devi\\) R\\\\ai) Tj', pdf)
+        self.assertEqual(len(pdf), len(design.render('S', 'R', date)))
+        self.assertEqual(len(design.render('S' * 150, 'R' * 150, date)), len(pdf))
+        with self.assertRaises(ValueError):
+            design.render('S' * 1000, 'R', date)
+
+    def test_legacy_certificate_is_rendered_without_side_effects(self):
+        Certificate.objects.create(user=self.user, file='certificate_member.pdf')
+        self.assertTrue(self.download().startswith(b'%PDF'))
+        self.assertTrue(Certificate.objects.get(user=self.user).file.name.startswith('certificates/'))
+        self.assertFalse(Badge.objects.filter(user=self.user).exists())
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_issue_certificates_command(self):
+        cohort = [
+            User.objects.create_user(username=f'cohort{i}', email=f'cohort{i}@example.com', password='pass12345')
+            for i in range(5)
+        ]
+        self.download()  # Already issued through the view
+        mail.outbox = []
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('issue_certificates', 'member', prefix='cohort', workers=2, chunk_size=2, stdout=StringIO())
+        self.assertEqual(Certificate.objects.count(), 6)
+        self.assertEqual(Badge.objects.filter(user__in=cohort, points=50).count(), 5)
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(Leaderboard.objects.get(user=cohort[0]).points, 50)
+        call_command('reconcile_points', stdout=StringIO())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('issue_certificates', prefix='cohort', workers=2, stdout=StringIO())
+        self.assertEqual(Certificate.objects.count(), 6)
+        self.assertEqual(len(mail.outbox), 5)
+
+        # Holding a course certificate does not stop a certificate of another badge type
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('issue_certificates', 'member', 'cohort0', badge_type='Top Performer', workers=1, stdout=StringIO())
+        self.assertEqual(
+            sorted(Certificate.objects.filter(badge_type='Top Performer').values_list('user__username', flat=True)),
+            ['cohort0', 'member']
+        )
+        self.assertEqual(Badge.objects.filter(badge_type='Top Performer').count(), 2)
+        self.assertEqual(len(mail.outbox), 7)
+        # The course certificate the view serves is unchanged
+        course = Certificate.objects.get(user=self.user, badge_type='Course Completion')
+        with course.file.open('rb') as stored:
+            self.assertEqual(self.download(), stored.read())
+
+
+class FailingBackend(BaseEmailBackend):
+    """Delivery backend standing in for an SMTP server that is down"""
+
+    def send_messages(self, email_messages):
+        raise smtplib.SMTPServerDisconnected('Connection unexpectedly closed')
+
+
+class ThrottlingBackend(BaseEmailBackend):
+    """Delivery backend standing in for a provider over its sending quota"""
+
+    def send_messages(self, email_messages):
+        raise smtplib.SMTPSenderRefused(421, b'4.7.0 Try again later', 'gym@example.com')
+
+
+@override_settings(
+    EMAIL_BACKEND='appointments.outbox.OutboxBackend',
+    OUTBOX_DELIVERY_BACKEND='django.core.mail.backends.locmem.EmailBackend'
+)
+class OutboxTests(TestCase):
+
+    def setUp(self):
+        mail.outbox = []
+
+    def run_worker(self, **options):
+        call_command('run_mail_worker', once=True, stdout=StringIO(), **options)
+
+    def test_mail_is_queued_then_delivered(self):
+        send_mail('Welcome', 'Hello', 'gym@example.com', ['member@example.com'])
+        message = EmailMessage('Certificate', 'Attached', 'gym@example.com', ['member@example.com'], bcc=['audit@example.com'])
+        message.attach('certificate.pdf', b'%PDF-1.4', 'application/pdf')
+        message.send()
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(OutboxEmail.objects.filter(status='queued').count(), 2)
+
+        self.run_worker()
+        self.assertEqual(OutboxEmail.objects.filter(status='sent').count(), 2)
+        self.assertEqual([message.subject for message in mail.outbox], ['Welcome', 'Certificate'])
+        self.assertEqual(mail.outbox[1].recipients(), ['member@example.com', 'audit@example.com'])
+        self.assertIn(b'certificate.pdf', mail.outbox[1].message().as_bytes())
+
+    def test_rolled_back_mail_is_never_queued(self):
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                User.objects.create_user(username='member', email='member@example.com', password='pass12345')
+                raise RuntimeError
+        self.assertFalse(OutboxEmail.objects.exists())
+
+    @override_settings(OUTBOX_DELIVERY_BACKEND='appointments.tests.FailingBackend')
+    def test_failed_mail_backs_off_then_dead_letters(self):
+        send_mail('Welcome', 'Hello', 'gym@example.com', ['member@example.com'])
+        self.run_worker(max_attempts=2)
+        email = OutboxEmail.objects.get()
+        self.assertEqual((email.status, email.attempts), ('queued', 1))
+        self.assertIn('SMTPServerDisconnected', email.last_error)
+        self.assertGreater(email.next_attempt_at, timezone.now())
+
+        # Not due yet
+        self.run_worker(max_attempts=2)
+        self.assertEqual(OutboxEmail.objects.get().attempts, 1)
+
+        OutboxEmail.objects.update(next_attempt_at=timezone.now())
+        self.run_worker(max_attempts=2)
+        self.assertEqual(OutboxEmail.objects.get().status, 'dead')
+
+    @override_settings(OUTBOX_DELIVERY_BACKEND='appointments.tests.ThrottlingBackend')
+    def test_throttling_reply_pauses_without_using_an_attempt(self):
+        send_mail('Welcome', 'Hello', 'gym@example.com', ['member@example.com'])
+        self.run_worker(max_attempts=1)
+        email = OutboxEmail.objects.get()
+        self.assertEqual((email.status, email.attempts), ('queued', 0))
+        self.assertIn('421', email.last_error)
+        self.assertGreater(email.next_attempt_at, timezone.now() + timedelta(seconds=20))
+
+    @override_settings(OUTBOX_RATE_PER_DAY=3)
+    def test_daily_quota_holds_back_mail(self):
+        OutboxEmail.objects.create(subject='Earlier', from_email='gym@example.com', recipients=['a@example.com'],
+                                   mime=b'', status='sent', sent_at=timezone.now() - timedelta(hours=2))
+        for i in range(3):
+            send_mail(f'Welcome {i}', 'Hello', 'gym@example.com', [f'member{i}@example.com'])
+        self.run_worker(workers=2)
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(OutboxEmail.objects.filter(status='queued').count(), 1)
+
+    @override_settings(OUTBOX_RATE_PER_DAY=4, OUTBOX_BULK_RESERVE=2)
+    def test_transactional_mail_goes_before_bulk_mail(self):
+        NewsletterSignup.objects.bulk_create([NewsletterSignup(email=f'reader{i}@example.com') for i in range(3)])
+        with tempfile.NamedTemporaryFile('w', suffix='.txt') as body:
+            body.write('News')
+            body.flush()
+            call_command('send_newsletter', 'Newsletter', body.name, stdout=StringIO())
+        send_mail('Booking confirmed', 'See you', 'gym@example.com', ['member@example.com'])
+        self.assertEqual(OutboxEmail.objects.filter(priority=OutboxEmail.BULK).count(), 3)
+
+        # The confirmation jumps the newsletter, which leaves the reserve of the daily quota alone
+        self.run_worker(workers=1)
+        self.assertEqual([message.subject for message in mail.outbox], ['Booking confirmed', 'Newsletter', 'Newsletter'])
+        self.assertEqual(OutboxEmail.objects.filter(status='queued', priority=OutboxEmail.BULK).count(), 1)
+
+    def test_held_mail_is_never_delivered(self):
+        with override_settings(EMAIL_BACKEND='appointments.outbox.HeldOutboxBackend'):
+            send_mail('Benchmark', 'Hello', 'gym@example.com', ['member@example.com'])
+        self.run_worker()
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(OutboxEmail.objects.get().status, 'queued')
+
+    def test_token_bucket(self):
+        bucket = TokenBucket(per_minute=2, per_day=100)
+        bucket.acquire()
+        bucket.acquire()
+        allowed, wait = bucket.available()
+        self.assertEqual(allowed, 0)
+        self.assertGreater(wait, 25)
+        bucket.throttle()
+        with self.assertRaises(Throttled):
+            bucket.acquire()
+
+
+class ExpiringSubscriptionTests(TestCase):
+
+    def setUp(self):
+        clear_caches()
+        mail.outbox = []
+        self.today = timezone.now().date()
+        self.plan = SubscriptionPlan.objects.create(name='Monthly Package', duration_months=1, price=50)
+        self.slot = get_session_slot('evening')
+
+    def subscribe(self, username, end_date):
+        user = User.objects.create_user(username=username, email=f'{username}@example.com', password='pass12345')
+        return UserSubscription.objects.create(
+            user=user,
+            plan=self.plan,
+            start_date=end_date - timedelta(days=30),
+            end_date=end_date,
+            time_slot=self.slot,
+            is_active=True
+        )
+
+    def test_sweep_emails_in_batches_and_deactivates_expired(self):
+        expiring = [self.subscribe(f'expiring{i}', self.today + timedelta(days=2)) for i in range(3)]
+        expired = [self.subscribe(f'expired{i}', self.today) for i in range(3)]
+        self.subscribe('later', self.today + timedelta(days=10))
+        get_active_subscription(expired[0].user)
+        mail.outbox = []
+
+        out = StringIO()
+        call_command('check_expiring_subscriptions', chunk_size=2, stdout=out)
+        subjects = [message.subject for message in mail.outbox]
+        self.assertEqual(subjects.count('Your Gym Subscription is Expiring Soon'), 3)
+        self.assertEqual(subjects.count('Your Gym Subscription Has Expired'), 3)
+        self.assertEqual(
+            UserSubscription.objects.filter(pk__in=[s.pk for s in expiring + expired], is_active=True).count(), 3
+        )
+        # The cached subscription of a deactivated member is dropped
+        self.assertIsNone(get_active_subscription(expired[0].user))
+        self.assertIn('Sent 3 expired notifications', out.getvalue())
+
+    @cross_process_cache
+    def test_invalidation_from_another_process(self):
+        subscription = self.subscribe('member', self.today + timedelta(days=10))
+        self.assertEqual(get_active_subscription(subscription.user), subscription)
+        UserSubscription.objects.filter(pk=subscription.pk).update(is_active=False)
+        run_in_another_process(
+            f'from appointments.subscriptions import invalidate_active_subscription; '
+            f'invalidate_active_subscription({subscription.user_id})'
+        )
+        self.assertIsNone(get_active_subscription(subscription.user))
+
+    def test_saved_subscription_is_invalidated_on_commit(self):
+        subscription = self.subscribe('member', self.today + timedelta(days=10))
+        self.assertEqual(get_active_subscription(subscription.user), subscription)
+        with self.captureOnCommitCallbacks(execute=True):
+            subscription.is_active = False
+            subscription.save()
+            # Dropped now, a request reading the committed row would cache it again
+            self.assertTrue(_cache().get(_cache_key(subscription.user_id)))
+        self.assertIsNone(get_active_subscription(subscription.user))
+
+    def test_failed_batch_stays_active(self):
+        subscription = self.subscribe('expired', self.today)
+        out = StringIO()
+        with override_settings(EMAIL_BACKEND='appointments.tests.FailingBackend'):
+            call_command('check_expiring_subscriptions', stdout=out)
+        self.assertTrue(UserSubscription.objects.get(pk=subscription.pk).is_active)
+        self.assertIn('1 failed', out.getvalue())
+        self.assertFalse(SubscriptionReminder.objects.exists())
+
+    def test_missed_days_are_caught_up_and_reminders_sent_once(self):
+        overdue = self.subscribe('overdue', self.today - timedelta(days=5))
+        expiring = self.subscribe('expiring', self.today + timedelta(days=1))
+        mail.outbox = []
+
+        call_command('check_expiring_subscriptions', stdout=StringIO())
+        call_command('check_expiring_subscriptions', stdout=StringIO())
+        self.assertFalse(UserSubscription.objects.get(pk=overdue.pk).is_active)
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), ['expiring@example.com', 'overdue@example.com'])
+        self.assertEqual(
+            set(SubscriptionReminder.objects.values_list('subscription_id', 'kind')),
+            {(overdue.pk, 'expired'), (expiring.pk, 'expiring')}
+        )
+
+    def test_long_lapsed_backlog_is_deactivated_quietly(self):
+        lapsed = self.subscribe('lapsed', self.today - timedelta(days=90))
+        recent = self.subscribe('recent', self.today - timedelta(days=7))
+        mail.outbox = []
+
+        call_command('check_expiring_subscriptions', stdout=StringIO())
+        self.assertEqual(UserSubscription.objects.filter(pk__in=[lapsed.pk, recent.pk], is_active=True).count(), 0)
+        self.assertEqual([message.to for message in mail.outbox], [['recent@example.com']])
+        self.assertFalse(SubscriptionReminder.objects.filter(subscription=lapsed).exists())
+
+
+class SchedulerTests(TestCase):
+
+    def setUp(self):
+        self.jobs = dict(JOBS)
+        self.addCleanup(lambda: (JOBS.clear(), JOBS.update(self.jobs)))
+        JOBS.clear()
+
+    def test_cron_finds_the_next_matching_minute(self):
+        moment = timezone.make_aware(datetime(2026, 10, 17, 6, 30))
+        self.assertEqual(Cron('0 6 * * *').next_after(moment), timezone.make_aware(datetime(2026, 10, 18, 6, 0)))
+        self.assertEqual(Cron('*/15 * * * *').next_after(moment), timezone.make_aware(datetime(2026, 10, 17, 6, 45)))
+        # 2026-10-17 is a Saturday, 0 and 7 both mean Sunday
+        self.assertEqual(Cron('0 4 * * 7').next_after(moment), timezone.make_aware(datetime(2026, 10, 18, 4, 0)))
+        self.assertEqual(Cron('0 0 29 2 *').next_after(moment), timezone.make_aware(datetime(2028, 2, 29, 0, 0)))
+        with self.assertRaises(ValueError):
+            Cron('61 * * * *')
+
+    def test_due_job_runs_once_and_records_its_run(self):
+        calls = []
+        job('count', every=timedelta(hours=1))(lambda: calls.append(1) or 42)
+        sync_jobs()
+
+        # Another host holds the lock
+        now = timezone.now()
+        self.assertTrue(acquire('count', timedelta(minutes=5), now))
+        self.assertFalse(acquire('count', timedelta(minutes=5), now))
+        self.assertEqual(run_due_jobs(), [])
+        self.assertEqual(calls, [])
+
+        ScheduledJob.objects.update(locked_until=None)
+        run_due_jobs()
+        run_due_jobs()
+        state = ScheduledJob.objects.get(name='count')
+        self.assertEqual(calls, [1])
+        self.assertEqual((state.last_status, state.last_rows, state.locked_until), ('succeeded', 42, None))
+        self.assertIsNotNone(state.last_duration)
+        self.assertGreater(state.next_run_at, timezone.now() + timedelta(minutes=59))
+
+    def test_failed_job_is_recorded_and_released(self):
+        def broken():
+            raise RuntimeError('disk full')
+        job('broken', cron='0 * * * *')(broken)
+        sync_jobs(now=timezone.now() - timedelta(hours=2))
+        call_command('run_scheduler', once=True, stdout=StringIO())
+        state = ScheduledJob.objects.get(name='broken')
+        self.assertEqual((state.last_status, state.last_error, state.locked_until), ('failed', 'RuntimeError: disk full', None))
+
+    def test_overrun_job_keeps_the_lock_taken_by_another_host(self):
+        def overrun():
+            # The lease runs out and another host takes the lock
+            ScheduledJob.objects.filter(name='slow').update(locked_until=timezone.now() + timedelta(minutes=5), locked_by='other:1')
+            return 1
+        job('slow', every=timedelta(hours=1))(overrun)
+        sync_jobs()
+        run_due_jobs()
+        state = ScheduledJob.objects.get(name='slow')
+        self.assertEqual(state.locked_by, 'other:1')
+        self.assertIsNotNone(state.locked_until)
+
+
+class OTPStoreTests(TestCase):
+
+    def setUp(self):
+        clear_caches()
+
+    def check_store(self, store):
+        code = store.issue('member@example.com', 'password_reset')
+        wrong = '000000' if code != '000000' else '111111'
+        self.assertEqual(store.verify('member@example.com', 'password_reset', wrong), INVALID)
+        self.assertEqual(store.verify('member@example.com', 'registration', code), EXPIRED)
+        self.assertEqual(store.verify('member@example.com', 'password_reset', code), VERIFIED)
+        # A code works once
+        self.assertEqual(store.verify('member@example.com', 'password_reset', code), EXPIRED)
+
+        code = store.issue('member@example.com', 'password_reset')
+        for attempt in range(MAX_ATTEMPTS):
+            store.verify('member@example.com', 'password_reset', wrong)
+        self.assertEqual(store.verify('member@example.com', 'password_reset', code), EXPIRED)
+
+    def test_cache_store(self):
+        self.check_store(CacheOTPStore())
+        self.assertFalse(OTP.objects.exists())
+
+    @cross_process_cache
+    def test_cache_store_code_is_verified_by_another_process(self):
+        code = CacheOTPStore().issue('member@example.com', 'password_reset')
+        # Another gunicorn worker takes the verification
+        run_in_another_process(
+            "from appointments.otp_store import CacheOTPStore, VERIFIED; "
+            f"assert CacheOTPStore().verify('member@example.com', 'password_reset', '{code}') == VERIFIED"
+        )
+
+    def test_database_store_and_purge(self):
+        store = DatabaseOTPStore()
+        self.check_store(store)
+        store.issue('late@example.com', 'registration')
+        OTP.objects.filter(email='late@example.com').update(created_at=timezone.now() - timedelta(minutes=11))
+        self.assertEqual(store.verify('late@example.com', 'registration', '123456'), EXPIRED)
+        pending = store.issue('new@example.com', 'registration')
+
+        # The verified code and the expired one, the locked code goes once it expires
+        self.assertEqual(store.purge(), 2)
+        self.assertEqual(store.verify('new@example.com', 'registration', pending), VERIFIED)
+
+    @override_settings(OTP_STORE='appointments.otp_store.CacheOTPStore')
+    def test_password_reset_with_cache_store(self):
+        User.objects.create_user(username='member', email='member@example.com', password='pass12345')
+        self.client.post(reverse('forgot_password'), {'email': 'member@example.com'})
+        code = mail.outbox[-1].body.split('Your OTP is: ')[1][:6]
+        response = self.client.post(
+            reverse('verify_otp'),
+            {'email': 'member@example.com', 'otp': code, 'purpose': 'password_reset'}
+        )
+        self.assertRedirects(response, reverse('reset_password', args=['member@example.com']), fetch_redirect_response=False)
+
+
+class RateLimitTests(TestCase):
+
+    def setUp(self):
+        clear_caches()
+        User.objects.create_user(username='member', email='member@example.com', password='pass12345')
+
+    def test_otp_requests_are_limited_per_email(self):
+        for i in range(3):
+            response = self.client.post(reverse('forgot_password'), {'email': 'member@example.com'}, REMOTE_ADDR=f'10.0.0.{i}')
+            self.assertEqual(response.status_code, 302)
+        # request_otp shares the bucket, the email is case folded
+        response = self.client.post(reverse('request_otp'), {'email': 'Member@example.com', 'purpose': 'password_reset'})
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response['Retry-After']), 100)
+        self.assertEqual(OTP.objects.count(), 3)
+
+    @cross_process_cache
+    def test_buckets_are_shared_between_processes(self):
+        # Another gunicorn worker takes the email's three requests
+        run_in_another_process(
+            "from appointments.ratelimit import account_key, take; "
+            "[take(account_key('otp', 'member@example.com'), 3, 600) for i in range(3)]"
+        )
+        response = self.client.post(reverse('forgot_password'), {'email': 'member@example.com'})
+        self.assertEqual(response.status_code, 429)
+        self.assertFalse(OTP.objects.exists())
+
+    @override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+    def test_forwarded_header_is_ignored_without_a_proxy(self):
+        for i in range(30):
+            self.client.post(reverse('login'), {'username': f'guess{i}', 'password': 'x'}, HTTP_X_FORWARDED_FOR=f'10.0.0.{i}')
+        # Every request came from the same REMOTE_ADDR, whatever the client claimed
+        response = self.client.post(reverse('login'), {'username': 'member', 'password': 'x'}, HTTP_X_FORWARDED_FOR='10.0.1.1')
+        self.assertEqual(response.status_code, 429)
+
+    @override_settings(
+        PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+        RATE_LIMIT_IP_HEADER='HTTP_X_FORWARDED_FOR'
+    )
+    def test_login_is_limited_per_ip(self):
+        for i in range(30):
+            self.client.post(reverse('login'), {'username': f'guess{i}', 'password': 'x'}, HTTP_X_FORWARDED_FOR='1.2.3.4, 10.0.0.1')
+        # A forged first entry does not help, the proxy's entry is used
+        response = self.client.post(reverse('login'), {'username': 'member', 'password': 'x'}, HTTP_X_FORWARDED_FOR='9.9.9.9, 10.0.0.1')
+        self.assertEqual(response.status_code, 429)
+        response = self.client.post(reverse('login'), {'username': 'member', 'password': 'x'}, HTTP_X_FORWARDED_FOR='10.0.0.2')
+        self.assertEqual(response.status_code, 200)
+        # Only POSTs are limited
+        self.assertEqual(self.client.get(reverse('login'), HTTP_X_FORWARDED_FOR='10.0.0.1').status_code, 200)
+
+    @override_settings(
+        PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+        RATE_LIMIT_IP_HEADER='HTTP_X_FORWARDED_FOR'
+    )
+    def test_clients_behind_the_proxy_have_their_own_buckets(self):
+        # Every request reaches gunicorn from the platform's router
+        for i in range(30):
+            self.client.post(
+                reverse('login'), {'username': f'guess{i}', 'password': 'x'},
+                REMOTE_ADDR='10.9.0.1', HTTP_X_FORWARDED_FOR='203.0.113.7'
+            )
+        response = self.client.post(
+            reverse('login'), {'username': 'member', 'password': 'x'},
+            REMOTE_ADDR='10.9.0.1', HTTP_X_FORWARDED_FOR='203.0.113.7'
+        )
+        self.assertEqual(response.status_code, 429)
+        response = self.client.post(
+            reverse('login'), {'username': 'member', 'password': 'x'},
+            REMOTE_ADDR='10.9.0.1', HTTP_X_FORWARDED_FOR='198.51.100.8'
+        )
+        self.assertEqual(response.status_code, 200)
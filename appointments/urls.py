@@ -15,8 +15,11 @@ urlpatterns = [
     path('full_logout/', views.full_logout, name='full_logout'),
     path('forgot-password/', views.forgot_password, name='forgot_password'),
     path('book/', views.book_appointment, name='book_appointment'),
+    path('book/recurring/', views.book_recurring, name='book_recurring'),
+    path('availability/<int:year>/<int:month>/', views.session_availability, name='session_availability'),
     path('my-appointments/', views.my_appointments, name='my_appointments'),
     path('cancel-appointment/<int:appointment_id>/', views.cancel_appointment, name='cancel_appointment'),
+    path('leave-waitlist/<int:entry_id>/', views.leave_waitlist_view, name='leave_waitlist'),
     path('subscribe/<int:plan_id>/', views.subscribe, name='subscribe'),
     path('workout-log/', views.workout_log, name='workout_log'),
     path('workout-history/', views.workout_history, name='workout_history'),
@@ -1,29 +1,32 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
+from django.views.decorators.http import require_POST
 from django.contrib import messages
 from django.contrib.auth.forms import UserCreationForm
 from django.urls import reverse
-from .models import Appointment, TimeSlot, SubscriptionPlan, UserSubscription, Payment, WorkoutSession, Exercise, ExerciseLog, UserProgress, PersonalBest, UserProfile, PaymentQRCode
+from .models import Appointment, TimeSlot, SubscriptionPlan, UserSubscription, Payment, WorkoutSession, Exercise, ExerciseLog, UserProgress, PersonalBest, UserProfile, PaymentQRCode, WaitlistEntry
 from datetime import datetime, timedelta
 from django.utils import timezone
 import uuid
-from .models import Certificate, Badge, Leaderboard
-from django.http import HttpResponse
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
+from .models import Certificate, Badge
+from django.http import JsonResponse, Http404, FileResponse
 from django.shortcuts import get_object_or_404
 from django.contrib.auth.models import User
-from .models import Certificate, Badge, Leaderboard
-from django.core.mail import EmailMessage
-from django.db.models import Sum
+from .models import Certificate, Badge
 from django.contrib.auth import login, logout, authenticate
 from appointments.models import Contact
 from django.core.files.storage import FileSystemStorage
 from .otp_models import OTP
 from .otp_views import send_otp_email
-from .email_utils import send_subscription_email, send_appointment_email
+from .email_utils import send_subscription_email, send_appointment_email, send_recurring_appointment_email
 from .forms import PaymentSubmissionForm
+from .subscriptions import get_active_subscription
+from .certificates import issue_certificate, certificate_filename
+from .leaderboard import leaderboard_page, member_rank, WINDOWS as LEADERBOARD_WINDOWS
+from .ratelimit import rate_limit
+from .booking import reserve_session, reserve_recurring, cancel_booking, join_waitlist, leave_waitlist, month_availability, SessionFull, AlreadyBooked
 
+@rate_limit('login', per_ip='30/10m', per_account='10/10m', account_field='username')
 def user_login(request):
     if request.method == "POST":
         username = request.POST.get('username')
@@ -109,21 +112,21 @@ def bmi(request):
 
 # View Leaderboard
 def leaderboard(request):
-    leaderboard_data = User.objects.annotate(total_points=Sum('badge__points')).order_by('-total_points')
+    window = request.GET.get('window', 'all')
+    if window not in LEADERBOARD_WINDOWS:
+        window = 'all'
+    page = leaderboard_page(request.GET.get('page'), window)
 
     user_rank = None
-    for index, user in enumerate(leaderboard_data, start=1):
-        if user == request.user:
-            user_rank = index
-            break
+    if request.user.is_authenticated:
+        user_rank = member_rank(request.user, window)
 
     return render(request, 'appointments/leaderboard.html', {
-        'leaderboard': leaderboard_data,
+        'leaderboard': page,
+        'window': window,
         'current_user': request.user,
         'user_rank': user_rank
         })
-    #leaderboard_data = Leaderboard.objects.order_by('-points')
-    #return render(request, 'appointments/leaderboard.html', {'leaderboard': leaderboard_data})
 # Create your views here.
 
 def home(request):
@@ -138,11 +141,7 @@ def home(request):
         'subscription_plans': SubscriptionPlan.objects.all()
     }
     if request.user.is_authenticated:
-        context['user_subscription'] = UserSubscription.objects.filter(
-            user=request.user,
-            is_active=True,
-            end_date__gte=timezone.now().date()
-        ).first()
+        context['user_subscription'] = get_active_subscription(request.user)
     return render(request, 'appointments/home.html', context)
 
 def register(request):
@@ -220,6 +219,8 @@ def register(request):
     
     return render(request, 'appointments/register.html')
 
+# Shares its buckets with request_otp, both email a code
+@rate_limit('otp', per_ip='10/h', per_account='3/10m')
 def forgot_password(request):
     if request.method == 'POST':
         email = request.POST.get('email')
@@ -288,50 +289,40 @@ def subscribe(request, plan_id):
 @login_required
 def book_appointment(request):
     # Check if user has active subscription
-    subscription = UserSubscription.objects.filter(
-        user=request.user,
-        is_active=True,
-        end_date__gte=timezone.now().date()
-    ).first()
+    subscription = get_active_subscription(request.user)
     
     if subscription:
         if request.method == 'POST':
             date = request.POST.get('date')
             time_slot_id = request.POST.get('time_slot')
             
-            # Map time slot IDs to actual time ranges
+            # Map time slot IDs to sessions
             time_slot_mapping = {
-                '1': {'start_time': '06:00:00', 'end_time': '10:00:00'},
-                '2': {'start_time': '12:00:00', 'end_time': '16:00:00'},
-                '3': {'start_time': '17:00:00', 'end_time': '21:00:00'}
+                '1': 'morning',
+                '2': 'afternoon',
+                '3': 'evening'
             }
             
             if time_slot_id in time_slot_mapping:
-                time_slot_data = time_slot_mapping[time_slot_id]
-                # Convert string to time object
-                start_time = datetime.strptime(time_slot_data['start_time'], '%H:%M:%S').time()
-                end_time = datetime.strptime(time_slot_data['end_time'], '%H:%M:%S').time()
-                # Check if appointment already exists for this date and user
-                existing_appointment = Appointment.objects.filter(
-                    user=request.user,
-                    date=date
-                ).first()
-                
-                if existing_appointment:
+                session = time_slot_mapping[time_slot_id]
+                try:
+                    date = datetime.strptime(date, '%Y-%m-%d').date()
+                except (TypeError, ValueError):
+                    messages.error(request, 'Please select a valid date.')
+                    return redirect('book_appointment')
+
+                try:
+                    appointment = reserve_session(request.user, subscription, date, session)
+                except AlreadyBooked:
                     messages.error(request, 'You already have an appointment booked for this date.')
                     return redirect('book_appointment')
-                
-                appointment = Appointment.objects.create(
-                    user=request.user,
-                    user_subscription=subscription,
-                    date=date,
-                    time_slot=TimeSlot.objects.create(
-                        start_time=start_time,
-                        end_time=end_time,
-                        is_available=True
-                    ),
-                    status='pending'
-                )
+                except SessionFull:
+                    if request.POST.get('join_waitlist'):
+                        join_waitlist(request.user, subscription, date, session)
+                        messages.info(request, 'This session is fully booked. You have been added to the waitlist and will be emailed if a spot opens up.')
+                        return redirect('my_appointments')
+                    messages.error(request, 'Sorry, this session is fully booked for the selected date. Please choose another session or date.')
+                    return redirect('book_appointment')
                 # Send appointment email
                 send_appointment_email(request.user, appointment)
                 messages.success(request, 'Appointment booked successfully!')
@@ -341,7 +332,8 @@ def book_appointment(request):
         
         return render(request, 'appointments/book.html', {
             'subscription': subscription,
-            'today': timezone.now().date()
+            'today': timezone.now().date(),
+            'weekdays': [(0, 'Mon'), (1, 'Tue'), (2, 'Wed'), (3, 'Thu'), (4, 'Fri'), (6, 'Sun')]
         })
     else:
         # Show subscription plans for non-subscribed users
@@ -352,29 +344,110 @@ def book_appointment(request):
             'show_subscription_packages': True  # Flag to show packages in the same format as home
         })
 
+@login_required
+def book_recurring(request):
+    if request.method != 'POST':
+        return redirect('book_appointment')
+
+    subscription = get_active_subscription(request.user)
+    if not subscription:
+        messages.error(request, 'You need an active subscription to book gym sessions.')
+        return redirect('book_appointment')
+
+    time_slot_mapping = {
+        '1': 'morning',
+        '2': 'afternoon',
+        '3': 'evening'
+    }
+    session = time_slot_mapping.get(request.POST.get('time_slot'))
+    weekdays = {int(day) for day in request.POST.getlist('weekdays') if day in {'0', '1', '2', '3', '4', '6'}}
+    if not session or not weekdays:
+        messages.error(request, 'Please choose a time slot and at least one day of the week.')
+        return redirect('book_appointment')
+
+    today = timezone.now().date()
+    try:
+        start_date = datetime.strptime(request.POST.get('start_date') or today.isoformat(), '%Y-%m-%d').date()
+        until = request.POST.get('until')
+        end_date = datetime.strptime(until, '%Y-%m-%d').date() if until else None
+    except ValueError:
+        messages.error(request, 'Please select valid dates.')
+        return redirect('book_appointment')
+
+    appointments, skipped = reserve_recurring(
+        request.user,
+        subscription,
+        session,
+        weekdays,
+        max(start_date, today),
+        end_date
+    )
+
+    if appointments:
+        send_recurring_appointment_email(request.user, appointments)
+        messages.success(request, f'{len(appointments)} appointments booked successfully!')
+    else:
+        messages.error(request, 'No appointments could be booked for the selected days.')
+    if skipped['existing']:
+        messages.info(request, f"Skipped {len(skipped['existing'])} dates where you already have an appointment.")
+    if skipped['full']:
+        full_dates = ', '.join(day.strftime('%b %d') for day in skipped['full'])
+        messages.warning(request, f'These dates are fully booked: {full_dates}')
+    return redirect('my_appointments')
+
+def session_availability(request, year, month):
+    """Remaining capacity of every session for a month, as JSON"""
+    if not 1 <= month <= 12 or not 1 <= year < 9999:
+        raise Http404("Invalid month")
+    return JsonResponse({
+        'year': year,
+        'month': month,
+        'days': month_availability(year, month)
+    })
+
 @login_required
 def my_appointments(request):
     appointments = Appointment.objects.filter(
         user=request.user
     ).select_related('time_slot', 'user_subscription').order_by('date', 'time_slot__start_time')
     
+    subscriptions = UserSubscription.objects.filter(
+        user=request.user,
+        is_active=True
+    ).select_related('plan', 'time_slot')
+    waitlist = WaitlistEntry.objects.filter(
+        user=request.user,
+        status='waiting',
+        date__gte=timezone.now().date()
+    )
+    
     return render(request, 'appointments/my_appointments.html', {
-        'appointments': appointments
+        'appointments': appointments,
+        'subscriptions': subscriptions,
+        'waitlist': waitlist
     })
 
 @login_required
+@require_POST
 def cancel_appointment(request, appointment_id):
     appointment = get_object_or_404(Appointment, id=appointment_id, user=request.user)
     
     if appointment.status != 'cancelled':
-        appointment.status = 'cancelled'
-        appointment.save()
+        cancel_booking(appointment)
         messages.success(request, 'Appointment cancelled successfully.')
     else:
         messages.error(request, 'Appointment is already cancelled.')
     
     return redirect('my_appointments')
 
+@login_required
+@require_POST
+def leave_waitlist_view(request, entry_id):
+    entry = get_object_or_404(WaitlistEntry, id=entry_id, user=request.user, status='waiting')
+    leave_waitlist(entry)
+    messages.success(request, 'You have left the waitlist.')
+    return redirect('my_appointments')
+
 @login_required
 def workout_log(request):
     if request.method == 'POST':
@@ -425,7 +498,11 @@ def workout_log(request):
 
 @login_required
 def workout_history(request):
-    sessions = WorkoutSession.objects.filter(user=request.user).order_by('-date')
+    sessions = WorkoutSession.objects.filter(user=request.user).select_related(
+        'appointment'
+    ).prefetch_related(
+        'exerciselog_set__exercise'
+    ).order_by('-date')
     return render(request, 'appointments/workout_history.html', {'sessions': sessions})
 
 @login_required
@@ -447,13 +524,13 @@ def track_progress(request):
 
 @login_required
 def progress_history(request):
-    progress_entries = UserProgress.objects.filter(user=request.user)
+    progress_entries = list(UserProgress.objects.filter(user=request.user))
     personal_bests = PersonalBest.objects.filter(user=request.user).select_related('exercise')
     
     # Calculate progress metrics
     if len(progress_entries) >= 2:
         latest = progress_entries[0]
-        oldest = progress_entries.last()
+        oldest = progress_entries[-1]
         weight_change = latest.weight - oldest.weight
         
         if latest.body_fat and oldest.body_fat:
@@ -464,11 +541,13 @@ def progress_history(request):
         weight_change = None
         fat_change = None
     
+    logs = list(ExerciseLog.objects.filter(
+        workout_session__user=request.user
+    ).select_related('exercise').order_by('id'))
+    
     # Get exercise progress
     exercise_progress = {}
-    for log in ExerciseLog.objects.filter(
-        workout_session__user=request.user
-    ).select_related('exercise'):
+    for log in logs:
         if log.exercise.category == 'strength' and log.weight:
             if log.exercise.id not in exercise_progress:
                 exercise_progress[log.exercise.id] = {
@@ -477,28 +556,36 @@ def progress_history(request):
                 }
             exercise_progress[log.exercise.id]['weights'].append(log.weight)
     
-    # Update personal bests
-    for log in ExerciseLog.objects.filter(workout_session__user=request.user):
-        pb, created = PersonalBest.objects.get_or_create(
-            user=request.user,
-            exercise=log.exercise,
-            defaults={
-                'weight': log.weight,
-                'reps': log.reps,
-                'duration': log.duration_minutes
-            }
-        )
-        
-        if not created:
-            if log.exercise.category == 'strength' and log.weight:
-                if not pb.weight or log.weight > pb.weight:
-                    pb.weight = log.weight
-                    pb.reps = log.reps
-                    pb.save()
-            elif log.exercise.category == 'cardio' and log.duration_minutes:
-                if not pb.duration or log.duration_minutes > pb.duration:
-                    pb.duration = log.duration_minutes
-                    pb.save()
+    # Update personal bests, folding every log in memory and saving only what changed
+    bests = {pb.exercise_id: pb for pb in PersonalBest.objects.filter(user=request.user)}
+    new_bests = {}
+    changed = set()
+    for log in logs:
+        pb = bests.get(log.exercise_id)
+        if pb is None:
+            pb = PersonalBest(
+                user=request.user,
+                exercise=log.exercise,
+                weight=log.weight,
+                reps=log.reps,
+                duration=log.duration_minutes
+            )
+            bests[log.exercise_id] = new_bests[log.exercise_id] = pb
+        elif log.exercise.category == 'strength' and log.weight:
+            if not pb.weight or log.weight > pb.weight:
+                pb.weight = log.weight
+                pb.reps = log.reps
+                changed.add(log.exercise_id)
+        elif log.exercise.category == 'cardio' and log.duration_minutes:
+            if not pb.duration or log.duration_minutes > pb.duration:
+                pb.duration = log.duration_minutes
+                changed.add(log.exercise_id)
+    
+    if new_bests:
+        PersonalBest.objects.bulk_create(new_bests.values(), ignore_conflicts=True)
+    changed = [bests[exercise_id] for exercise_id in changed if exercise_id not in new_bests]
+    if changed:
+        PersonalBest.objects.bulk_update(changed, ['weight', 'reps', 'duration'])
     
     context = {
         'progress_entries': progress_entries,
@@ -512,46 +599,13 @@ def progress_history(request):
 
 def generate_certificate(request, username):
     user = get_object_or_404(User, username=username)
-    certificate_name = f"certificate_{user.username}.pdf"
-    
-    # Create a PDF response
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="{certificate_name}"'
-
-    # Generate PDF content
-    p = canvas.Canvas(response, pagesize=letter)
-    p.setFont("Helvetica-Bold", 24)
-    p.drawString(200, 750, "Fitness Certification")
-    p.setFont("Helvetica", 18)
-    p.drawString(220, 700, f"Awarded to: {user.first_name} {user.last_name}")
-    p.drawString(220, 670, "For completing the fitness course successfully")
-    p.setFont("Helvetica", 12)
-    p.drawString(220, 640, f"Date: {user.date_joined.strftime('%Y-%m-%d')}")
-    p.showPage()
-    p.save()
-
-    # Save certificate in the database
-    Certificate.objects.create(user=user, file=certificate_name)
-
-    # Award Badge for Course Completion
-    Badge.objects.create(user=user, badge_type='Course Completion')
-
-    # Update Leaderboard
-    leaderboard_entry, created = Leaderboard.objects.get_or_create(user=user)
-    leaderboard_entry.points += 10  # Example: Add 10 points for course completion
-    leaderboard_entry.save()
-
-    # Email certificate
-    email = EmailMessage(
-        "Your Fitness Certificate",
-        "Congratulations! Please find your certificate attached.",
-        "admin@fitnesscenter.com",
-        [user.email]
+    certificate, created = issue_certificate(user)
+    return FileResponse(
+        certificate.file.open('rb'),
+        as_attachment=True,
+        filename=certificate_filename(user),
+        content_type='application/pdf'
     )
-    email.attach(certificate_name, response.getvalue(), 'application/pdf')
-    email.send()
-
-    return response
 
 
 @login_required
@@ -559,6 +613,7 @@ def dashboard(request):
     user_appointments = Appointment.objects.filter(user=request.user)  # Only show current user's appointments
     return render(request, "dashboard.html", {"appointments": user_appointments})
 
+@rate_limit('contact', per_ip='5/h')
 def contact(request): 
     if request.method=="POST":
         name = request.POST['name']
@@ -576,6 +631,7 @@ def contact(request):
 from .models import NewsletterSignup 
 from django.db import IntegrityError
 
+@rate_limit('newsletter', per_ip='5/h', per_account='3/d')
 def newsletter_signup(request):
     if request.method == "POST":
         first_name = request.POST['first_name']
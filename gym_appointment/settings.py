@@ -81,6 +81,12 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Take the write lock when a transaction starts so concurrent
+            # bookings queue up instead of failing with "database is locked"
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
     }
 }
 
@@ -136,6 +142,56 @@ LOGIN_URL = 'login'
 LOGOUT_REDIRECT_URL = 'home'
 
 
+CACHES = {
+    # Local to each process
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'gym-appointment',
+    },
+    # A table in the database, seen by every process: gunicorn, run_mail_worker
+    # and run_scheduler. Entries one process invalidates for another belong here.
+    # Sized for an entry per member in each cache that uses it, created by
+    # `manage.py createcachetable`. Redis or Memcached can replace it unchanged.
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'shared_cache',
+        'OPTIONS': {'MAX_ENTRIES': 200000, 'CULL_FREQUENCY': 10},
+    },
+}
+
+# Active subscriptions are deactivated by the scheduler as well as the web process
+SUBSCRIPTION_CACHE = 'shared'
+# Cached navbars are invalidated by the scheduler's notification jobs
+NOTIFICATION_CACHE = 'shared'
+
+# Where one-time passwords are kept. appointments.otp_store.CacheOTPStore keeps them
+# in OTP_CACHE with a TTL
+OTP_STORE = 'appointments.otp_store.DatabaseOTPStore'
+# A code issued by one gunicorn worker is verified by another
+OTP_CACHE = 'shared'
+
+# Rate limit buckets are shared by every gunicorn worker
+RATE_LIMIT_CACHE = 'shared'
+# Client addresses come from REMOTE_ADDR. Behind a proxy that appends the client's
+# address to X-Forwarded-For, set this to 'HTTP_X_FORWARDED_FOR', as star.sh does for
+# the platform's router: otherwise every client shares the proxy's address and bucket.
+# Without a proxy the header is whatever the client sent, leave this unset.
+RATE_LIMIT_IP_HEADER = os.environ.get('RATE_LIMIT_IP_HEADER') or None
+
+# Maximum number of members that can book each session on a single day
+SESSION_CAPACITY = {
+    'morning': 30,
+    'afternoon': 30,
+    'evening': 30,
+}
+
+# check_expiring_subscriptions only emails expiry notices for subscriptions that ended
+# this many days ago or less, older ones left active by missed runs are deactivated quietly
+EXPIRED_NOTICE_DAYS = 7
+
+# Weeks of session capacity rows the build_availability job keeps ahead of today
+AVAILABILITY_WEEKS = 8
+
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
@@ -261,7 +317,16 @@ JAZZMIN_UI_TWEAKS = {
     }
 }
 
-EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+# Mail is queued in the outbox and delivered by `manage.py run_mail_worker`
+EMAIL_BACKEND = 'appointments.outbox.OutboxBackend'
+OUTBOX_DELIVERY_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+OUTBOX_MAX_ATTEMPTS = 6
+# Parallel SMTP connections, and Gmail's sending quotas for a personal account
+OUTBOX_WORKERS = 4
+OUTBOX_RATE_PER_MINUTE = 20
+OUTBOX_RATE_PER_DAY = 500
+# Daily emails bulk mail such as newsletters leaves for transactional mail
+OUTBOX_BULK_RESERVE = 100
 EMAIL_HOST = 'smtp.gmail.com'
 EMAIL_PORT = 587
 EMAIL_USE_TLS = True
@@ -1,7 +1,7 @@
 from django.contrib import admin
-from .models import Notification, UserNotification
+from .models import Notification, UserNotification, NotificationDelivery
+from .inbox import broadcast
 from django.contrib.auth.models import User
-from django.db import transaction
 from django.contrib import messages
 from django.urls import path
 from django.shortcuts import render, redirect
@@ -13,11 +13,11 @@ from datetime import timedelta
 
 @admin.register(Notification)
 class NotificationAdmin(admin.ModelAdmin):
-    list_display = ('title', 'notification_type', 'created_at', 'is_active')
+    list_display = ('title', 'notification_type', 'created_at', 'broadcast_at', 'is_active')
     list_filter = ('notification_type', 'is_active', 'created_at')
     search_fields = ('title', 'message')
-    readonly_fields = ('created_at',)
-    actions = ['send_to_all_users']
+    readonly_fields = ('created_at', 'broadcast_at')
+    actions = ['send_to_all_users', 'send_to_subscribers', 'send_to_morning', 'send_to_afternoon', 'send_to_evening']
     change_list_template = 'admin/notifications/notification/change_list.html'
 
     def changelist_view(self, request, extra_context=None):
@@ -27,9 +27,10 @@ class NotificationAdmin(admin.ModelAdmin):
         total_notifications = Notification.objects.count()
         active_users = User.objects.filter(is_active=True).count()
         
-        # Calculate read rate
-        total_user_notifications = UserNotification.objects.count()
-        read_notifications = UserNotification.objects.filter(is_read=True).count()
+        # Calculate read rate of notifications sent to individual members, broadcasts keep no per-member rows
+        targeted = UserNotification.objects.filter(notification__broadcast_at__isnull=True)
+        total_user_notifications = targeted.count()
+        read_notifications = targeted.filter(is_read=True).count()
         read_rate = round((read_notifications / total_user_notifications * 100) if total_user_notifications > 0 else 0, 1)
         
         # Get recent activity
@@ -71,26 +72,15 @@ class NotificationAdmin(admin.ModelAdmin):
                 return redirect('admin:send-notification')
             
             try:
-                with transaction.atomic():
-                    # Create the notification
-                    notification = Notification.objects.create(
-                        title=title,
-                        message=message,
-                        notification_type=notification_type
-                    )
-                    
-                    # Get all active users
-                    users = User.objects.filter(is_active=True)
-                    
-                    # Create UserNotification entries for all users in bulk
-                    user_notifications = [
-                        UserNotification(user=user, notification=notification)
-                        for user in users
-                    ]
-                    UserNotification.objects.bulk_create(user_notifications)
-                    
-                    self.message_user(request, f"Notification sent successfully to {users.count()} users!")
-                    return redirect('admin:notifications_notification_changelist')
+                # Stored once, members read it from the broadcast
+                Notification.objects.create(
+                    title=title,
+                    message=message,
+                    notification_type=notification_type,
+                    broadcast_at=timezone.now()
+                )
+                self.message_user(request, "Notification sent successfully to all members!")
+                return redirect('admin:notifications_notification_changelist')
                     
             except Exception as e:
                 self.message_user(request, f"Error sending notification: {str(e)}", level=messages.ERROR)
@@ -108,25 +98,69 @@ class NotificationAdmin(admin.ModelAdmin):
 
         notification = queryset.first()
         try:
-            with transaction.atomic():
-                # Get all active users
-                users = User.objects.filter(is_active=True)
-                
-                # Create UserNotification entries for all users in bulk
-                user_notifications = [
-                    UserNotification(user=user, notification=notification)
-                    for user in users
-                ]
-                UserNotification.objects.bulk_create(user_notifications)
-                
-                self.message_user(request, f"Notification sent successfully to {users.count()} users!")
+            if broadcast(notification):
+                self.message_user(request, "Notification sent successfully to all members!")
+            else:
+                self.message_user(request, "This notification was already sent to all members.", level=messages.WARNING)
         except Exception as e:
             self.message_user(request, f"Error sending notification: {str(e)}", level=messages.ERROR)
 
     send_to_all_users.short_description = "Send selected notification to all users"
 
+    def queue_delivery(self, request, queryset, audience):
+        # Written in chunks by the deliver_notifications job of run_scheduler
+        deliveries = NotificationDelivery.objects.bulk_create([
+            NotificationDelivery(notification=notification, audience=audience)
+            for notification in queryset
+        ])
+        label = dict(NotificationDelivery.AUDIENCE_CHOICES)[audience].lower()
+        self.message_user(request, f"{len(deliveries)} notifications queued for {label}, follow them under Notification deliveries.")
+
+    def send_to_subscribers(self, request, queryset):
+        self.queue_delivery(request, queryset, 'subscribers')
+    send_to_subscribers.short_description = "Send selected notifications to members with an active subscription"
+
+    def send_to_morning(self, request, queryset):
+        self.queue_delivery(request, queryset, 'morning')
+    send_to_morning.short_description = "Send selected notifications to morning session members"
+
+    def send_to_afternoon(self, request, queryset):
+        self.queue_delivery(request, queryset, 'afternoon')
+    send_to_afternoon.short_description = "Send selected notifications to afternoon session members"
+
+    def send_to_evening(self, request, queryset):
+        self.queue_delivery(request, queryset, 'evening')
+    send_to_evening.short_description = "Send selected notifications to evening session members"
+
 @admin.register(UserNotification)
 class UserNotificationAdmin(admin.ModelAdmin):
     list_display = ('user', 'notification', 'is_read', 'created_at')
     list_filter = ('is_read', 'created_at')
     search_fields = ('user__username', 'notification__title')
+
+
+@admin.register(NotificationDelivery)
+class NotificationDeliveryAdmin(admin.ModelAdmin):
+    list_display = ('notification', 'audience', 'status', 'get_progress', 'created_at', 'started_at', 'finished_at')
+    list_filter = ('status', 'audience')
+    list_select_related = ('notification',)
+    ordering = ('-created_at',)
+    readonly_fields = ('notification', 'audience', 'status', 'total', 'processed', 'last_user_id', 'error',
+                       'created_at', 'started_at', 'finished_at')
+    actions = ['retry_deliveries']
+
+    def get_progress(self, obj):
+        if not obj.total:
+            return f"{obj.processed}"
+        return f"{obj.processed} / {obj.total} ({min(obj.processed / obj.total * 100, 100):.0f}%)"
+    get_progress.short_description = 'Progress'
+
+    # Deliveries are queued from the notification actions
+    def has_add_permission(self, request):
+        return False
+
+    def retry_deliveries(self, request, queryset):
+        # Failed deliveries resume after the last member they reached
+        retried = queryset.filter(status='failed').update(status='running', error='')
+        self.message_user(request, f"{retried} deliveries will resume on the scheduler's next check")
+    retry_deliveries.short_description = "Resume selected failed deliveries"
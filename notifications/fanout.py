@@ -0,0 +1,81 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+from appointments.models import UserSubscription
+from .inbox import invalidate_navbar
+from .models import NotificationDelivery, UserNotification
+
+DEFAULT_CHUNK_SIZE = 1000
+
+
+def audience(delivery):
+    """The members a delivery is addressed to"""
+    subscriptions = UserSubscription.objects.filter(
+        user=OuterRef('pk'),
+        is_active=True,
+        end_date__gte=timezone.now().date()
+    )
+    if delivery.audience != 'subscribers':
+        subscriptions = subscriptions.filter(time_slot__session=delivery.audience)
+    return User.objects.filter(Exists(subscriptions), is_active=True)
+
+
+def _write_chunk(delivery, user_ids):
+    """Insert one chunk and record the progress in the same transaction"""
+    with transaction.atomic():
+        # ignore_conflicts skips members who already have the notification, through unique_together
+        UserNotification.objects.bulk_create([
+            UserNotification(user_id=user_id, notification_id=delivery.notification_id, created_at=delivery.created_at)
+            for user_id in user_ids
+        ], batch_size=len(user_ids), ignore_conflicts=True)
+        delivery.processed += len(user_ids)
+        delivery.last_user_id = user_ids[-1]
+        delivery.save(update_fields=['processed', 'last_user_id'])
+    # bulk_create skips the post_save handler
+    invalidate_navbar(user_ids)
+
+
+def deliver(delivery, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Write a delivery's UserNotification rows. Member ids are streamed in
+    primary key order and inserted chunk_size at a time, each chunk
+    committing with the delivery's progress, so the admin sees it advance
+    and a run that dies resumes after the last committed chunk.
+    """
+    members = audience(delivery)
+    if delivery.started_at is None:
+        delivery.started_at = timezone.now()
+        delivery.total = members.count()
+    delivery.status = 'running'
+    delivery.save(update_fields=['status', 'started_at', 'total'])
+
+    user_ids = members.filter(pk__gt=delivery.last_user_id).order_by('pk').values_list('pk', flat=True)
+    chunk = []
+    for user_id in user_ids.iterator(chunk_size=chunk_size):
+        chunk.append(user_id)
+        if len(chunk) == chunk_size:
+            _write_chunk(delivery, chunk)
+            chunk = []
+    if chunk:
+        _write_chunk(delivery, chunk)
+
+    delivery.status = 'done'
+    delivery.finished_at = timezone.now()
+    delivery.save(update_fields=['status', 'finished_at'])
+    return delivery.processed
+
+
+def deliver_pending(chunk_size=DEFAULT_CHUNK_SIZE):
+    """Run every queued delivery, and resume any a crashed run left running. Returns the rows processed."""
+    processed = 0
+    for delivery in NotificationDelivery.objects.filter(status__in=['queued', 'running']).order_by('pk'):
+        started = delivery.processed
+        try:
+            deliver(delivery, chunk_size)
+        except Exception as e:
+            delivery.status = 'failed'
+            delivery.error = f'{type(e).__name__}: {e}'
+            delivery.save(update_fields=['status', 'error'])
+        processed += delivery.processed - started
+    return processed
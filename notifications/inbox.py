@@ -0,0 +1,215 @@
+import uuid
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .models import Notification, UserNotification, NotificationReadState
+
+# The navbar shows this many unread notifications, with the total count
+NAVBAR_LIMIT = 5
+NAVBAR_TIMEOUT = 60 * 60
+# Replaced when a change reaches every member, so their cached navbars are all stale
+# at once. A fresh random value rather than a counter, so concurrent bumps need no
+# atomic increment and a version the cache evicted is never reused.
+_VERSION_KEY = 'notifications:version'
+
+
+def _navbar_key(user_id, version):
+    return f'notifications:navbar:{version}:{user_id}'
+
+
+def _cache():
+    """Shared, the scheduler and mail worker invalidate navbars the web process serves"""
+    return caches[getattr(settings, 'NOTIFICATION_CACHE', 'default')]
+
+
+def _version():
+    cache = _cache()
+    version = cache.get(_VERSION_KEY)
+    if version is None:
+        cache.add(_VERSION_KEY, uuid.uuid4().hex, None)
+        version = cache.get(_VERSION_KEY)
+    return version
+
+
+def invalidate_navbar(user_ids):
+    version = _version()
+    _cache().delete_many([_navbar_key(user_id, version) for user_id in user_ids])
+
+
+def invalidate_all_navbars():
+    """For broadcasts and changes to a notification, which may be on any member's navbar"""
+    _cache().set(_VERSION_KEY, uuid.uuid4().hex, None)
+
+
+def broadcast(notification):
+    """Send a notification to every member, a single UPDATE however many there are"""
+    sent = Notification.objects.filter(pk=notification.pk, broadcast_at__isnull=True).update(
+        broadcast_at=timezone.now()
+    ) == 1
+    if sent:
+        # update() skips the post_save handler
+        invalidate_all_navbars()
+    return sent
+
+
+def _watermark(user):
+    """The member's read watermark as an expression, so it joins into the broadcast query"""
+    return Coalesce(
+        Subquery(NotificationReadState.objects.filter(user=user).values('read_until')),
+        Value(user.date_joined)
+    )
+
+
+def _read_exception(user):
+    return Exists(UserNotification.objects.filter(user=user, notification=OuterRef('pk'), is_read=True))
+
+
+def _as_user_notification(user, notification, is_read):
+    """A broadcast in the shape of the UserNotification rows it is listed with"""
+    return UserNotification(
+        user=user,
+        notification=notification,
+        is_read=is_read,
+        created_at=notification.broadcast_at
+    )
+
+
+def _unread(user):
+    """The member's unread broadcasts and targeted UserNotification rows, as two querysets"""
+    broadcasts = Notification.objects.filter(
+        broadcast_at__isnull=False,
+        is_active=True,
+        broadcast_at__gt=_watermark(user)
+    ).exclude(_read_exception(user))
+    targeted = UserNotification.objects.filter(
+        user=user,
+        is_read=False,
+        notification__is_active=True,
+        notification__broadcast_at__isnull=True
+    )
+    return broadcasts, targeted
+
+
+def _merge(user, broadcasts, targeted, limit=None):
+    notifications = [_as_user_notification(user, notification, False) for notification in broadcasts]
+    notifications += list(targeted)
+    notifications.sort(key=lambda user_notification: user_notification.created_at, reverse=True)
+    return notifications[:limit]
+
+
+def unread_notifications(user, limit=None):
+    """The member's unread notifications, newest first, as UserNotification objects"""
+    broadcasts, targeted = _unread(user)
+    broadcasts = broadcasts.order_by('-broadcast_at')
+    targeted = targeted.select_related('notification').order_by('-created_at')
+    if limit is not None:
+        broadcasts, targeted = broadcasts[:limit], targeted[:limit]
+    return _merge(user, broadcasts, targeted, limit)
+
+
+def navbar_notifications(user):
+    """
+    The member's unread count and latest unread notifications, cached until
+    one of them is created or read, or a notification changes.
+    Returns (count, notifications).
+    """
+    key = _navbar_key(user.pk, _version())
+    cache = _cache()
+    navbar = cache.get(key)
+    if navbar is None:
+        broadcasts, targeted = _unread(user)
+        latest_broadcasts = list(broadcasts.order_by('-broadcast_at')[:NAVBAR_LIMIT])
+        latest_targeted = list(targeted.select_related('notification').order_by('-created_at')[:NAVBAR_LIMIT])
+        # Only a full list may have more behind it that needs counting
+        count = broadcasts.count() if len(latest_broadcasts) == NAVBAR_LIMIT else len(latest_broadcasts)
+        count += targeted.count() if len(latest_targeted) == NAVBAR_LIMIT else len(latest_targeted)
+        navbar = (count, _merge(user, latest_broadcasts, latest_targeted, NAVBAR_LIMIT))
+        cache.set(key, navbar, NAVBAR_TIMEOUT)
+    return navbar
+
+
+def user_feed(user):
+    """Every notification the member has received, read or not, newest first"""
+    broadcasts = Notification.objects.filter(
+        broadcast_at__isnull=False,
+        is_active=True,
+        broadcast_at__gt=user.date_joined
+    ).annotate(
+        read_exception=_read_exception(user)
+    ).order_by('-broadcast_at')
+    state = NotificationReadState.objects.filter(user=user).first()
+    read_until = state.read_until if state else user.date_joined
+    notifications = [
+        _as_user_notification(user, notification, notification.read_exception or notification.broadcast_at <= read_until)
+        for notification in broadcasts
+    ]
+    notifications += list(UserNotification.objects.filter(
+        user=user,
+        notification__is_active=True,
+        notification__broadcast_at__isnull=True
+    ).select_related('notification').order_by('-created_at'))
+    notifications.sort(key=lambda user_notification: user_notification.created_at, reverse=True)
+    return notifications
+
+
+def mark_read(user, notification):
+    """
+    Mark one notification read. A broadcast past the watermark gets a read
+    row, then the watermark moves past every broadcast that is now read in a
+    row and their read rows are deleted, so the rows stay few.
+    """
+    if notification.broadcast_at is None:
+        UserNotification.objects.filter(user=user, notification=notification).update(is_read=True)
+        # update() skips the post_save handler
+        invalidate_navbar([user.pk])
+        return
+
+    with transaction.atomic():
+        state, _ = NotificationReadState.objects.select_for_update().get_or_create(
+            user=user,
+            defaults={'read_until': user.date_joined}
+        )
+        if notification.broadcast_at <= state.read_until:
+            return
+        UserNotification.objects.update_or_create(user=user, notification=notification, defaults={'is_read': True})
+
+        pending = Notification.objects.filter(
+            broadcast_at__isnull=False,
+            is_active=True,
+            broadcast_at__gt=state.read_until
+        ).annotate(read_exception=_read_exception(user)).order_by('broadcast_at').values_list(
+            'broadcast_at', 'read_exception'
+        )
+        read = []
+        first_unread = None
+        for broadcast_at, read_exception in pending:
+            if not read_exception:
+                first_unread = broadcast_at
+                break
+            read.append(broadcast_at)
+        # A read broadcast sent at the same instant as an unread one stays past the watermark
+        read_until = max(
+            (broadcast_at for broadcast_at in read if first_unread is None or broadcast_at < first_unread),
+            default=state.read_until
+        )
+        if read_until > state.read_until:
+            state.read_until = read_until
+            state.save(update_fields=['read_until'])
+            UserNotification.objects.filter(
+                user=user,
+                notification__broadcast_at__isnull=False,
+                notification__broadcast_at__lte=read_until
+            ).delete()
+    invalidate_navbar([user.pk])
+
+
+def mark_all_read(user):
+    """Move the watermark to now and mark every targeted notification read"""
+    with transaction.atomic():
+        NotificationReadState.objects.update_or_create(user=user, defaults={'read_until': timezone.now()})
+        UserNotification.objects.filter(user=user, notification__broadcast_at__isnull=False).delete()
+        UserNotification.objects.filter(user=user, is_read=False).update(is_read=True)
+    invalidate_navbar([user.pk])
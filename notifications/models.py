@@ -13,6 +13,20 @@ class Notification(models.Model):
         ('update', 'Important Update'),
         ('general', 'General')
     ])
+    # Set when the notification is sent to every member. A broadcast is stored
+    # once, members' read state is their NotificationReadState watermark plus
+    # a read UserNotification row for each broadcast read past it.
+    broadcast_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Broadcasts past a member's watermark
+            models.Index(
+                fields=['broadcast_at'],
+                condition=models.Q(broadcast_at__isnull=False, is_active=True),
+                name='notification_broadcast_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.title
@@ -25,6 +39,58 @@ class UserNotification(models.Model):
 
     class Meta:
         unique_together = ('user', 'notification')
+        indexes = [
+            # A user's notifications, newest first
+            models.Index(fields=['user', '-created_at'], name='usernotif_user_created_idx'),
+            # Only unread rows, for the navbar badge
+            models.Index(
+                fields=['user', '-created_at'],
+                condition=models.Q(is_read=False),
+                name='usernotif_unread_idx',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.notification.title}"
+
+
+class NotificationReadState(models.Model):
+    """Every broadcast up to read_until is read. Without a row, that is the member's date_joined."""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='notification_read_state')
+    read_until = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.user.username} read until {self.read_until}"
+
+class NotificationDelivery(models.Model):
+    """A notification sent to an audience, one UserNotification per member, written by the deliver_notifications job"""
+    AUDIENCE_CHOICES = [
+        ('subscribers', 'Members with an active subscription'),
+        ('morning', 'Morning session members'),
+        ('afternoon', 'Afternoon session members'),
+        ('evening', 'Evening session members'),
+    ]
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    notification = models.ForeignKey(Notification, on_delete=models.CASCADE, related_name='deliveries')
+    audience = models.CharField(max_length=20, choices=AUDIENCE_CHOICES)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    total = models.PositiveIntegerField(null=True, blank=True, help_text="Members in the audience when delivery started")
+    processed = models.PositiveIntegerField(default=0)
+    # Members are delivered in primary key order, a restarted run resumes after this one
+    last_user_id = models.IntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name_plural = 'notification deliveries'
+
+    def __str__(self):
+        return f"{self.notification.title} to {self.get_audience_display()}"
@@ -0,0 +1,40 @@
+from django.db.models.signals import post_save, pre_save, post_delete
+from django.dispatch import receiver
+from .inbox import invalidate_navbar, invalidate_all_navbars
+from .models import Notification, UserNotification
+
+
+@receiver(post_save, sender=UserNotification)
+@receiver(post_delete, sender=UserNotification)
+def invalidate_member_navbar(sender, instance, **kwargs):
+    invalidate_navbar([instance.user_id])
+
+
+def _shown(notification):
+    """What a member's navbar shows of a notification"""
+    return (
+        notification.is_active,
+        notification.broadcast_at,
+        notification.title,
+        notification.message,
+        notification.notification_type
+    )
+
+@receiver(pre_save, sender=Notification)
+def remember_notification(sender, instance, **kwargs):
+    previous = Notification.objects.filter(pk=instance.pk).first() if instance.pk else None
+    instance._previous_shown = _shown(previous) if previous else None
+
+@receiver(post_save, sender=Notification)
+def invalidate_notification_navbars(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_previous_shown', None)
+    instance._previous_shown = None
+    # A new targeted notification reaches members through its UserNotification rows
+    if created and instance.broadcast_at is None:
+        return
+    if previous != _shown(instance):
+        invalidate_all_navbars()
+
+@receiver(post_delete, sender=Notification)
+def invalidate_deleted_notification(sender, instance, **kwargs):
+    invalidate_all_navbars()
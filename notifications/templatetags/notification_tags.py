@@ -1,13 +1,13 @@
 from django import template
-from notifications.models import UserNotification
+from notifications.inbox import navbar_notifications
 
 register = template.Library()
 
 @register.inclusion_tag('notifications/notification_box.html')
 def show_notifications(user):
-    notifications = UserNotification.objects.filter(
-        user=user,
-        is_read=False,
-        notification__is_active=True
-    ).order_by('-created_at')
-    return {'notifications': notifications} 
\ No newline at end of file
+    unread_count, notifications = navbar_notifications(user)
+    return {
+        'notifications': notifications,
+        'unread_count': unread_count,
+        'more_count': unread_count - len(notifications)
+    }
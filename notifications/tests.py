@@ -1,3 +1,254 @@
-from django.test import TestCase
+from datetime import timedelta
+from unittest import skipUnless
+from django.test import TestCase, override_settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth.models import User
+from django.urls import reverse
+from django.utils import timezone
+from appointments.tests import query_plans, clear_caches, cross_process_cache, run_in_another_process, LOCAL_SHARED_CACHE
+from appointments.booking import get_session_slot
+from appointments.models import SubscriptionPlan, UserSubscription
+from .models import Notification, UserNotification, NotificationReadState, NotificationDelivery
+from .fanout import deliver_pending
+from .inbox import unread_notifications, user_feed, mark_read, mark_all_read, navbar_notifications, broadcast
 
-# Create your tests here.
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN is SQLite specific')
+class QueryPlanTests(TestCase):
+    """Notification lists must be served by an index"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='member', email='member@example.com', password='pass12345')
+        notification = Notification.objects.create(title='Holiday', message='Closed', notification_type='holiday')
+        UserNotification.objects.create(user=cls.user, notification=notification)
+
+    def setUp(self):
+        # The navbar is cached, a render left over from another test would hide its queries
+        clear_caches()
+
+    def plans(self, url):
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        return query_plans(queries.captured_queries, 'notifications_usernotification')
+
+    def test_user_notifications(self):
+        plans = self.plans(reverse('notifications:user_notifications'))
+        self.assertTrue(any('usernotif_user_created_idx' in plan for plan in plans))
+
+    def test_unread_notifications_navbar(self):
+        # The navbar tag is rendered by the base template on every page
+        plans = self.plans(reverse('home'))
+        self.assertTrue(any('usernotif_unread_idx' in plan for plan in plans))
+        # Broadcasts past the watermark, checked against the member's read rows
+        self.assertTrue(any('notification_broadcast_idx' in plan for plan in plans))
+        for plan in plans:
+            self.assertNotIn('SCAN', plan)
+
+
+class NavbarCacheTests(TestCase):
+
+    def setUp(self):
+        clear_caches()
+        self.member = User.objects.create_user(username='member', email='member@example.com', password='pass12345')
+        User.objects.filter(pk=self.member.pk).update(date_joined=timezone.now() - timedelta(days=1))
+        self.member.refresh_from_db()
+
+    def notify(self, title):
+        notification = Notification.objects.create(title=title, message='Gym notice', notification_type='general')
+        return UserNotification.objects.create(user=self.member, notification=notification)
+
+    def navbar(self):
+        count, notifications = navbar_notifications(self.member)
+        return count, [user_notification.notification.title for user_notification in notifications]
+
+    def test_home_renders_the_navbar_from_the_cache(self):
+        self.notify('Holiday')
+        self.client.force_login(self.member)
+        self.client.get(reverse('home'))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('home'))
+        self.assertContains(response, 'Holiday')
+        self.assertFalse([query for query in queries.captured_queries if 'notifications_' in query['sql']])
+
+    def test_count_and_latest_five(self):
+        for i in range(7):
+            self.notify(f'Notice {i}')
+        count, titles = self.navbar()
+        self.assertEqual(count, 7)
+        self.assertEqual(len(titles), 5)
+        self.client.force_login(self.member)
+        self.assertContains(self.client.get(reverse('home')), 'and 2 more unread')
+
+    def test_invalidated_by_changes(self):
+        user_notification = self.notify('Holiday')
+        self.assertEqual(self.navbar(), (1, ['Holiday']))
+        with CaptureQueriesContext(connection) as queries:
+            self.navbar()
+        self.assertFalse([query for query in queries.captured_queries if 'notifications_' in query['sql']])
+
+        self.notify('Event')
+        self.assertEqual(self.navbar(), (2, ['Event', 'Holiday']))
+
+        mark_read(self.member, user_notification.notification)
+        self.assertEqual(self.navbar(), (1, ['Event']))
+
+        event = Notification.objects.get(title='Event')
+        event.is_active = False
+        event.save()
+        self.assertEqual(self.navbar(), (0, []))
+
+        announcement = Notification.objects.create(title='Open day', message='Gym notice', notification_type='event')
+        broadcast(announcement)
+        self.assertEqual(self.navbar(), (1, ['Open day']))
+
+        mark_all_read(self.member)
+        self.assertEqual(self.navbar(), (0, []))
+
+    @cross_process_cache
+    def test_invalidation_from_another_process(self):
+        user_notification = self.notify('Holiday')
+        self.assertEqual(self.navbar(), (1, ['Holiday']))
+
+        # update() skips the handlers, the invalidation comes from run_scheduler instead
+        UserNotification.objects.filter(pk=user_notification.pk).update(is_read=True)
+        self.assertEqual(self.navbar(), (1, ['Holiday']))
+        run_in_another_process(f'from notifications.inbox import invalidate_navbar; invalidate_navbar([{self.member.pk}])')
+        self.assertEqual(self.navbar(), (0, []))
+
+        announcement = Notification.objects.create(title='Open day', message='Gym notice', notification_type='event')
+        self.navbar()
+        Notification.objects.filter(pk=announcement.pk).update(broadcast_at=timezone.now())
+        run_in_another_process('from notifications.inbox import invalidate_all_navbars; invalidate_all_navbars()')
+        self.assertEqual(self.navbar(), (1, ['Open day']))
+
+
+class BroadcastTests(TestCase):
+
+    def setUp(self):
+        joined = timezone.now() - timedelta(days=1)
+        self.member = User.objects.create_user(username='member', email='member@example.com', password='pass12345')
+        User.objects.filter(pk=self.member.pk).update(date_joined=joined)
+        self.member.refresh_from_db()
+        self.staff = User.objects.create_user(username='staff', password='pass12345', is_staff=True)
+
+    def send(self, title, minutes_ago=0):
+        return Notification.objects.create(
+            title=title,
+            message='Gym notice',
+            notification_type='general',
+            broadcast_at=timezone.now() - timedelta(minutes=minutes_ago)
+        )
+
+    def unread_titles(self, user):
+        return [user_notification.notification.title for user_notification in unread_notifications(user)]
+
+    @override_settings(CACHES=LOCAL_SHARED_CACHE)
+    def test_broadcast_is_stored_once(self):
+        for i in range(20):
+            User.objects.create_user(username=f'member{i}')
+        self.client.force_login(self.staff)
+        with self.assertNumQueries(3):
+            # Session, user and the INSERT, nothing per member
+            self.client.post(reverse('notifications:send_notification'), {
+                'title': 'Holiday', 'message': 'Closed on Friday', 'notification_type': 'holiday'
+            })
+        self.assertEqual(Notification.objects.get().title, 'Holiday')
+        self.assertFalse(UserNotification.objects.exists())
+        self.assertEqual(self.unread_titles(self.member), ['Holiday'])
+
+        # Members who joined later never see it
+        newcomer = User.objects.create_user(username='newcomer')
+        User.objects.filter(pk=newcomer.pk).update(date_joined=timezone.now() + timedelta(minutes=1))
+        newcomer.refresh_from_db()
+        self.assertEqual(self.unread_titles(newcomer), [])
+
+    def test_reading_in_order_moves_the_watermark(self):
+        first, second, third = self.send('First', 30), self.send('Second', 20), self.send('Third', 10)
+        targeted = Notification.objects.create(title='Personal', message='Hi', notification_type='general')
+        UserNotification.objects.create(user=self.member, notification=targeted)
+        self.assertEqual(self.unread_titles(self.member), ['Personal', 'Third', 'Second', 'First'])
+
+        # Read out of order, the read row is kept until the gap closes
+        mark_read(self.member, second)
+        self.assertEqual(self.unread_titles(self.member), ['Personal', 'Third', 'First'])
+        self.assertEqual(UserNotification.objects.filter(notification__broadcast_at__isnull=False).count(), 1)
+
+        mark_read(self.member, first)
+        state = NotificationReadState.objects.get(user=self.member)
+        self.assertEqual(state.read_until, second.broadcast_at)
+        self.assertFalse(UserNotification.objects.filter(notification__broadcast_at__isnull=False).exists())
+        self.assertEqual(self.unread_titles(self.member), ['Personal', 'Third'])
+        self.assertEqual([(n.notification.title, n.is_read) for n in user_feed(self.member)], [
+            ('Personal', False), ('Third', False), ('Second', True), ('First', True)
+        ])
+
+        mark_read(self.member, third)
+        state.refresh_from_db()
+        self.assertEqual(state.read_until, third.broadcast_at)
+        self.assertEqual(self.unread_titles(self.member), ['Personal'])
+
+        mark_all_read(self.member)
+        self.assertEqual(self.unread_titles(self.member), [])
+
+    def test_mark_as_read_view(self):
+        notice = self.send('Holiday')
+        self.client.force_login(self.member)
+        response = self.client.post(reverse('notifications:mark_as_read', args=[notice.pk]), HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(response.json(), {'status': 'success'})
+        self.assertEqual(self.unread_titles(self.member), [])
+
+        # A notification sent only to someone else
+        private = Notification.objects.create(title='Private', message='Hi', notification_type='general')
+        UserNotification.objects.create(user=self.staff, notification=private)
+        response = self.client.post(reverse('notifications:mark_as_read', args=[private.pk]), HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(response.status_code, 404)
+
+
+class FanoutTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        plan = SubscriptionPlan.objects.create(name='Monthly Package', duration_months=1, price=50)
+        today = timezone.now().date()
+        cls.members = {}
+        for i, session in enumerate(['morning'] * 4 + ['evening'] * 3 + [None]):
+            user = User.objects.create_user(username=f'member{i}')
+            cls.members[user.pk] = session
+            if session:
+                UserSubscription.objects.create(
+                    user=user, plan=plan, start_date=today, end_date=today + timedelta(days=30),
+                    time_slot=get_session_slot(session), is_active=True
+                )
+        cls.notification = Notification.objects.create(title='Coach away', message='Sessions moved', notification_type='update')
+
+    def recipients(self):
+        return set(UserNotification.objects.filter(notification=self.notification).values_list('user_id', flat=True))
+
+    def test_delivers_to_the_audience_in_chunks(self):
+        subscribers = NotificationDelivery.objects.create(notification=self.notification, audience='subscribers')
+        # One member already has it, the insert skips them
+        first = min(self.members)
+        UserNotification.objects.create(user_id=first, notification=self.notification)
+
+        self.assertEqual(deliver_pending(chunk_size=3), 7)
+        subscribers.refresh_from_db()
+        self.assertEqual((subscribers.status, subscribers.total, subscribers.processed), ('done', 7, 7))
+        self.assertEqual(self.recipients(), {pk for pk, session in self.members.items() if session})
+
+    def test_session_audience_and_resume(self):
+        evening = [pk for pk, session in sorted(self.members.items()) if session == 'evening']
+        # A run that died after its first chunk
+        delivery = NotificationDelivery.objects.create(
+            notification=self.notification, audience='evening', status='running',
+            started_at=timezone.now(), total=3, processed=1, last_user_id=evening[0]
+        )
+        UserNotification.objects.create(user_id=evening[0], notification=self.notification)
+
+        # Resumes after the member the first chunk reached
+        self.assertEqual(deliver_pending(chunk_size=1), 2)
+        delivery.refresh_from_db()
+        self.assertEqual((delivery.status, delivery.processed), ('done', 3))
+        self.assertEqual(self.recipients(), set(evening))
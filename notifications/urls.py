@@ -7,4 +7,5 @@ urlpatterns = [
     path('send/', views.send_notification, name='send_notification'),
     path('user/', views.user_notifications, name='user_notifications'),
     path('mark-read/<int:notification_id>/', views.mark_as_read, name='mark_as_read'),
+    path('mark-all-read/', views.mark_all_as_read, name='mark_all_as_read'),
 ] 
\ No newline at end of file
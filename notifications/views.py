@@ -1,12 +1,12 @@
 from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
-from django.contrib.auth.models import User
-from .models import Notification, UserNotification
+from .models import Notification
+from .inbox import user_feed, mark_read, mark_all_read
 from django.utils import timezone
 from django.http import JsonResponse
 from django.views.decorators.http import require_POST
-from django.db import transaction
+from django.db.models import Q
 
 # Create your views here.
 
@@ -23,26 +23,15 @@ def send_notification(request):
             return redirect('notifications:send_notification')
         
         try:
-            with transaction.atomic():
-                # Create the notification
-                notification = Notification.objects.create(
-                    title=title,
-                    message=message,
-                    notification_type=notification_type
-                )
-                
-                # Get all active users
-                users = User.objects.filter(is_active=True)
-                
-                # Create UserNotification entries for all users in bulk
-                user_notifications = [
-                    UserNotification(user=user, notification=notification)
-                    for user in users
-                ]
-                UserNotification.objects.bulk_create(user_notifications)
-                
-                messages.success(request, f'Notification sent successfully to {users.count()} users!')
-                return redirect('notifications:send_notification')
+            # Stored once, members read it from the broadcast
+            Notification.objects.create(
+                title=title,
+                message=message,
+                notification_type=notification_type,
+                broadcast_at=timezone.now()
+            )
+            messages.success(request, 'Notification sent successfully to all members!')
+            return redirect('notifications:send_notification')
                 
         except Exception as e:
             messages.error(request, f'Error sending notification: {str(e)}')
@@ -52,10 +41,7 @@ def send_notification(request):
 
 @login_required
 def user_notifications(request):
-    notifications = UserNotification.objects.filter(
-        user=request.user,
-        notification__is_active=True
-    ).order_by('-created_at')
+    notifications = user_feed(request.user)
     
     return render(request, 'notifications/user_notifications.html', {
         'notifications': notifications
@@ -65,21 +51,28 @@ def user_notifications(request):
 @require_POST
 def mark_as_read(request, notification_id):
     try:
-        user_notification = UserNotification.objects.get(
-            id=notification_id,
-            user=request.user
-        )
-        user_notification.is_read = True
-        user_notification.save()
+        # A broadcast, or one sent to this member
+        notification = Notification.objects.filter(
+            Q(broadcast_at__isnull=False) | Q(usernotification__user=request.user),
+            id=notification_id
+        ).distinct().get()
+        mark_read(request.user, notification)
         
         if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
             return JsonResponse({'status': 'success'})
             
         messages.success(request, 'Notification marked as read')
-    except UserNotification.DoesNotExist:
+    except Notification.DoesNotExist:
         if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
             return JsonResponse({'status': 'error'}, status=404)
             
         messages.error(request, 'Notification not found')
     
     return redirect('notifications:user_notifications')
+
+@login_required
+@require_POST
+def mark_all_as_read(request):
+    mark_all_read(request.user)
+    messages.success(request, 'All notifications marked as read')
+    return redirect('notifications:user_notifications')
@@ -1,3 +1,11 @@
-
 #!/bin/bash
+# The shared cache is a database table
+python manage.py createcachetable
+# Queued mail is delivered by the outbox worker
+python manage.py run_mail_worker &
+# Maintenance jobs: subscription expiry, purges and reconciliation
+python manage.py run_scheduler &
+# The platform's router sits in front of gunicorn, so REMOTE_ADDR is the router's
+# and the client's address is the last entry it appends to X-Forwarded-For
+export RATE_LIMIT_IP_HEADER=${RATE_LIMIT_IP_HEADER:-HTTP_X_FORWARDED_FOR}
 gunicorn gym_appointment.wsgi:application --bind 0.0.0.0:$PORT